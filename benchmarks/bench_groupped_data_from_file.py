@@ -0,0 +1,132 @@
+"""Benchmark of groupping ratings from file
+
+This script compares streaming aggregation of `get_groupped_data_from_file`
+with previous list-per-group implementation on ratings file.
+
+Usage:
+    python benchmarks/bench_groupped_data_from_file.py -i data/ml-latest-small/ratings.csv -r 3
+"""
+
+# import the necessary packages
+import os
+import csv
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from movies import get_groupped_data_from_file
+
+
+def legacy_groupped_data_from_file(file_path: str, group_by: str, agg_col: str, delimiter: str = ',') -> list:
+    """Previous implementation which stores list of values per group
+
+    Parameters
+    ----------
+    file_path : str
+        File name to read
+    group_by : str
+        Group by column name
+    agg_col : str
+        Aggregation column name
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+
+    Returns
+    -------
+    list
+        Data stored in list of dicts
+    """
+    data = []
+    with open(file_path, newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=delimiter)
+
+        group_vals = {}
+        for row in reader:
+            gr_val = row.get(group_by)
+            agg_val = float(row.get(agg_col))
+
+            if gr_val in group_vals.keys():
+                group_vals[gr_val] += [agg_val]
+            else:
+                group_vals[gr_val] = [agg_val]
+
+        for k, v in group_vals.items():
+            data.append({group_by: k, agg_col: round(sum(v)/len(v), 4)})
+
+    return data
+
+
+def measure(func, *args, repeat: int = 1, trace_memory: bool = True) -> tuple:
+    """Run function several times and measure best time and peak memory
+
+    Parameters
+    ----------
+    func : callable
+        Function to measure
+    repeat : int, optional
+        Number of runs, by default 1
+    trace_memory : bool, optional
+        Flag to measure peak memory with tracemalloc, by default True
+
+    Returns
+    -------
+    tuple
+        Result of function, best time in seconds and peak memory in bytes
+    """
+    best = None
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - time_start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = 0
+    if trace_memory:
+        tracemalloc.start()
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, best, peak
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-i", "--input", type=str, default='data/ml-latest-small/ratings.csv',
+                    help="ratings file to group (example: data/ml-latest/ratings.csv)")
+    ap.add_argument("-r", "--repeat", type=int, default=3,
+                    help="number of runs of each implementation (example: 3)")
+    ap.add_argument("--no-memory", action='store_true',
+                    help="skip tracemalloc run which is slow on large files")
+
+    return vars(ap.parse_args())
+
+
+def main():
+    args = get_arguments()
+    print(f"file: {args['input']}, repeat: {args['repeat']}")
+
+    results = {}
+    for name, func in (('legacy', legacy_groupped_data_from_file),
+                       ('streaming', get_groupped_data_from_file)):
+        data, best, peak = measure(func, args['input'], 'movieId', 'rating',
+                                   repeat=args['repeat'],
+                                   trace_memory=not args['no_memory'])
+        results[name] = data
+        print(f'{name:>10}: {best:.4f} secs, peak memory {peak / 2**20:.2f} MiB, groups {len(data)}')
+
+    assert results['legacy'] == results['streaming'], 'results differ'
+    print('results are equal')
+
+
+if __name__ == "__main__":
+    main()
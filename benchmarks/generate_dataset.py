@@ -0,0 +1,214 @@
+"""Generator of synthetic MovieLens-shaped datasets
+
+This script writes deterministic `movies.csv` and `ratings.csv` files with
+the same columns and format as MovieLens datasets. Popularity of movies
+follows Zipf distribution, so few movies have most of ratings like in
+real data. The same scale and seed always produce identical files.
+
+Usage:
+    python benchmarks/generate_dataset.py -s 1m --seed 42 -o data/synthetic/
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * SCALES - Number of ratings, movies and users of supported scales
+    * get_title - Get random movie title with year
+    * generate_movies - Write movies file and return popularity and quality of movies
+    * generate_ratings - Write ratings file with Zipf-distributed ratings per movie
+    * generate_dataset - Write movies and ratings files of scale if they don't exist
+    * get_arguments - Construct the argument parser and get the arguments
+    * main - the main function of the script
+"""
+
+# import the necessary packages
+import os
+import csv
+import json
+import random
+import argparse
+from itertools import accumulate
+
+
+# number of ratings, movies and users of MovieLens datasets
+SCALES = {
+    '100k': (100_000, 9_742, 610),
+    '1m': (1_000_000, 3_706, 6_040),
+    '10m': (10_000_000, 10_681, 71_567),
+    '27m': (27_000_000, 58_098, 283_228),
+}
+GENRES = ('Action', 'Adventure', 'Animation', 'Children', 'Comedy', 'Crime', 'Documentary',
+          'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'IMAX', 'Musical', 'Mystery', 'Romance',
+          'Sci-Fi', 'Thriller', 'War', 'Western')
+NULL_GENRE = '(no genres listed)'
+WORDS = ('love', 'night', 'story', 'man', 'day', 'war', 'life', 'dead', 'city', 'girl', 'king',
+         'star', 'return', 'house', 'dark', 'last', 'time', 'world', 'blood', 'summer', 'heart',
+         'secret', 'road', 'ghost', 'island', 'game', 'dream', 'river', 'fire', 'christmas')
+ZIPF_EXPONENT = 1.0
+GENERATOR_VERSION = 1
+
+
+def get_title(rng: random.Random) -> str:
+    """Get random movie title with year in MovieLens format, some titles have
+    article after comma, quotes or no year
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random generator
+
+    Returns
+    -------
+    str
+        Movie title
+    """
+    title = ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 4)))
+    p = rng.random()
+    if p < 0.05:
+        title = f'{title}, The'
+    elif p < 0.06:
+        title = f'"{title}"'
+    if rng.random() < 0.99:
+        title = f'{title} ({rng.randint(1902, 2018)})'
+    return title
+
+
+def generate_movies(file_path: str, n_movies: int, rng: random.Random) -> tuple:
+    """Write movies file and get popularity weights and quality of movies
+
+    Parameters
+    ----------
+    file_path : str
+        File name of movies
+    n_movies : int
+        Number of movies
+    rng : random.Random
+        Random generator
+
+    Returns
+    -------
+    tuple
+        List of movieIds, cumulative Zipf weights of movieIds and dict of mean rating per movieId
+    """
+    movie_ids = sorted(rng.sample(range(1, n_movies * 20), n_movies))
+    quality = {}
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['movieId', 'title', 'genres'])
+        for movie_id in movie_ids:
+            if rng.random() < 0.005:
+                genres = NULL_GENRE
+            else:
+                genres = '|'.join(sorted(rng.sample(GENRES, rng.choice((1, 1, 2, 2, 2, 3, 3, 4)))))
+            writer.writerow([movie_id, get_title(rng), genres])
+            quality[movie_id] = min(max(rng.gauss(3.4, 0.5), 1.0), 4.8)
+
+    # popularity rank is not correlated with movieId
+    ranked = movie_ids[:]
+    rng.shuffle(ranked)
+    cum_weights = list(accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(n_movies)))
+    return ranked, cum_weights, quality
+
+
+def generate_ratings(file_path: str, n_ratings: int, n_users: int, movies: tuple, rng: random.Random) -> None:
+    """Write ratings file sorted by userId and movieId like MovieLens files.
+    Movies of every user are sampled with Zipf weights of movies
+
+    Parameters
+    ----------
+    file_path : str
+        File name of ratings
+    n_ratings : int
+        Number of ratings
+    n_users : int
+        Number of users, more users are added if they have not enough ratings
+    movies : tuple
+        Result of generate_movies
+    rng : random.Random
+        Random generator
+    """
+    ranked, cum_weights, quality = movies
+    mean_per_user = max(n_ratings / n_users - 20, 1)
+    written = 0
+    user_id = 0
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['userId', 'movieId', 'rating', 'timestamp'])
+        while written < n_ratings:
+            user_id += 1
+            k = min(20 + int(rng.expovariate(1 / mean_per_user)), len(ranked), n_ratings - written)
+            user_movies = set(rng.choices(ranked, cum_weights=cum_weights, k=k))
+            rows = []
+            for movie_id in sorted(user_movies):
+                rating = min(max(round((quality[movie_id] + rng.gauss(0, 0.9)) * 2) / 2, 0.5), 5.0)
+                rows.append((user_id, movie_id, rating, rng.randint(828124615, 1537799250)))
+            writer.writerows(rows)
+            written += len(rows)
+
+
+def generate_dataset(out_dir: str, scale: str = '100k', seed: int = 42) -> str:
+    """Write movies and ratings files of scale to `<out_dir>/<scale>-<seed>/`
+    if they don't exist yet
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory of generated datasets
+    scale : str, optional
+        Scale from SCALES, by default '100k'
+    seed : int, optional
+        Seed of random generator, by default 42
+
+    Returns
+    -------
+    str
+        Directory of dataset with trailing slash
+    """
+    if scale not in SCALES:
+        raise ValueError(f'Unknown scale `{scale}`, expected one of {tuple(SCALES)}')
+
+    path = os.path.join(out_dir, f'{scale}-{seed}', '')
+    meta_path = os.path.join(path, 'meta.json')
+    meta = {'version': GENERATOR_VERSION, 'scale': scale, 'seed': seed}
+    try:
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                return path
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(path, exist_ok=True)
+    n_ratings, n_movies, n_users = SCALES[scale]
+    rng = random.Random(seed)
+    movies = generate_movies(os.path.join(path, 'movies.csv'), n_movies, rng)
+    generate_ratings(os.path.join(path, 'ratings.csv'), n_ratings, n_users, movies, rng)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return path
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-s", "--scale", type=str, choices=SCALES, default='100k',
+                    help="number of ratings of dataset (default: 100k)")
+    ap.add_argument("--seed", type=int, default=42,
+                    help="seed of random generator (default: 42)")
+    ap.add_argument("-o", "--out_dir", type=str, default='data/synthetic/',
+                    help="directory of generated datasets (default: data/synthetic/)")
+
+    return vars(ap.parse_args())
+
+
+def main():
+    args = get_arguments()
+    print(generate_dataset(args['out_dir'], args['scale'], args['seed']))
+
+
+if __name__ == "__main__":
+    main()
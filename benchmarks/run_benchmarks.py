@@ -0,0 +1,332 @@
+"""Benchmark suite of movies.py
+
+This script generates synthetic MovieLens-shaped datasets (see
+generate_dataset.py), runs public functions of movies.py and the
+end-to-end `main()` pipeline on them, records best time and peak memory
+of every benchmark to results file and compares them with stored baseline.
+Exit code is 1 if any benchmark is slower or uses more memory than
+baseline by more than threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py -s 100k 1m -r 3
+    python benchmarks/run_benchmarks.py -s 100k --save_baseline
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * get_benchmarks - Get benchmarks of dataset
+    * run_main - Run main() of movies.py with arguments on dataset
+    * run_benchmarks - Run benchmarks and get results
+    * compare_with_baseline - Find regressions of results against baseline
+    * get_arguments - Construct the argument parser and get the arguments
+    * main - the main function of the script
+"""
+
+# import the necessary packages
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import logging as log
+from contextlib import redirect_stdout
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+sys.path.insert(0, ROOT_PATH)
+import movies
+from movies import (read_csv, read_csv_table, read_movies_table, read_ratings_summary_table,
+                    get_mean_ratings_table, get_groupped_data_from_file, get_groupped_data,
+                    get_sorted_data, merged_data, filtered_data_col_contains, filtered_data_col_has_any,
+                    filtered_data_col_in_range, get_data_with_splitted_col, get_top_n_per_genre,
+                    RATINGS_SCHEMA, RATINGS_AGG_SCHEMA)
+from indexes import InvertedIndex
+from generate_dataset import SCALES, generate_dataset
+from bench_groupped_data_from_file import measure
+
+
+RESULTS_PATH = os.path.join(BENCHMARKS_PATH, 'results.json')
+BASELINE_PATH = os.path.join(BENCHMARKS_PATH, 'baseline.json')
+# list of dicts of ratings file doesn't fit in memory on larger scales
+MAX_LIST_RATINGS = 1_000_000
+
+
+def run_main(argv: list, data_path: str, cache_dir: str) -> None:
+    """Run main() of movies.py with arguments on dataset, output is discarded
+
+    Parameters
+    ----------
+    argv : list
+        Arguments of movies.py
+    data_path : str
+        Directory of dataset with trailing slash
+    cache_dir : str
+        Cache directory of parsed files and results
+    """
+    saved = movies.DATA_FOLDER_PATH, sys.argv
+    movies.DATA_FOLDER_PATH = data_path
+    sys.argv = ['movies.py', '--cache_dir', cache_dir, '--no_result_cache'] + argv
+    try:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            movies.main()
+    finally:
+        movies.DATA_FOLDER_PATH, sys.argv = saved
+
+
+def get_benchmarks(data_path: str, n_ratings: int, cache_dir: str) -> list:
+    """Get benchmarks of dataset. Inputs of benchmarks are prepared once,
+    so every benchmark measures only its function
+
+    Parameters
+    ----------
+    data_path : str
+        Directory of dataset with trailing slash
+    n_ratings : int
+        Number of ratings of dataset
+    cache_dir : str
+        Cache directory of main() benchmarks
+
+    Returns
+    -------
+    list
+        Pairs of benchmark name and function without arguments
+    """
+    movies_path = data_path + 'movies.csv'
+    ratings_path = data_path + 'ratings.csv'
+
+    movies_list = get_data_with_splitted_col(read_csv(movies_path), 'title', 'year',
+                                             r'\s\(\d\d\d\d\)', r'\d\d\d\d')
+    movies_table = read_movies_table(movies_path)
+    ratings_list = get_groupped_data_from_file(ratings_path, 'movieId', 'rating')
+    ratings_table = get_mean_ratings_table(read_ratings_summary_table(ratings_path))
+    merged_list = merged_data(movies_list, ratings_list, 'movieId')
+    merged_table = merged_data(movies_table, ratings_table, 'movieId')
+    unsorted_ratings = get_sorted_data(ratings_table, 'rating')
+    genre_index = InvertedIndex.from_column(movies_table.column('genres'))
+    genres = ['Comedy', 'Adventure']
+
+    benchmarks = [
+        ('read_csv/movies', lambda: read_csv(movies_path)),
+        ('read_csv_table/ratings', lambda: read_csv_table(ratings_path, RATINGS_AGG_SCHEMA)),
+        ('read_csv_table/ratings_all_columns', lambda: read_csv_table(ratings_path, RATINGS_SCHEMA)),
+        ('read_movies_table', lambda: read_movies_table(movies_path)),
+        ('get_data_with_splitted_col/list', lambda: get_data_with_splitted_col(
+            read_csv(movies_path), 'title', 'year', r'\s\(\d\d\d\d\)', r'\d\d\d\d')),
+        ('get_groupped_data_from_file', lambda: get_groupped_data_from_file(ratings_path, 'movieId', 'rating')),
+        ('get_groupped_data_from_file/workers=4', lambda: get_groupped_data_from_file(
+            ratings_path, 'movieId', 'rating', workers=4)),
+        ('read_ratings_summary_table', lambda: read_ratings_summary_table(ratings_path)),
+        ('merged_data/list', lambda: merged_data(movies_list, ratings_list, 'movieId')),
+        ('merged_data/table', lambda: merged_data(movies_table, ratings_table, 'movieId')),
+        ('merged_data/table_hash', lambda: merged_data(movies_table, unsorted_ratings, 'movieId')),
+        ('get_sorted_data/list', lambda: get_sorted_data(merged_list, 'rating')),
+        ('get_sorted_data/table', lambda: get_sorted_data(merged_table, 'rating')),
+        ('filtered_data_col_contains/list', lambda: filtered_data_col_contains(merged_list, 'title', 'love')),
+        ('filtered_data_col_contains/table', lambda: filtered_data_col_contains(merged_table, 'title', 'love')),
+        ('filtered_data_col_in_range/list', lambda: filtered_data_col_in_range(merged_list, 'year', 1990, 2010)),
+        ('filtered_data_col_in_range/table', lambda: filtered_data_col_in_range(merged_table, 'year', 1990, 2010)),
+        ('filtered_data_col_has_any/table', lambda: filtered_data_col_has_any(merged_table, 'genres', genres)),
+        ('filtered_data_col_has_any/index', lambda: filtered_data_col_has_any(
+            movies_table, 'genres', genres, index=genre_index)),
+        ('get_top_n_per_genre/all', lambda: get_top_n_per_genre(merged_table, 10)),
+        ('main/no_cache', lambda: run_main(['--no_cache', '-n', '10'], data_path, cache_dir)),
+        ('main/cached', lambda: run_main(['-n', '10'], data_path, cache_dir)),
+        ('main/genres', lambda: run_main(['-n', '5', '-f', '2000', '-g', 'Comedy|Adventure'], data_path, cache_dir)),
+        ('main/regexp', lambda: run_main(['-r', 'love', '-f', '1995'], data_path, cache_dir)),
+    ]
+
+    if n_ratings <= MAX_LIST_RATINGS:
+        benchmarks += [
+            ('read_csv/ratings', lambda: read_csv(ratings_path)),
+            ('get_groupped_data/list', lambda: get_groupped_data(read_csv(ratings_path), 'movieId', 'rating')),
+            ('read_csv/ratings_schema', lambda: read_csv(ratings_path, schema=RATINGS_AGG_SCHEMA)),
+            ('get_groupped_data/list_typed', lambda: get_groupped_data(
+                read_csv(ratings_path, schema=RATINGS_AGG_SCHEMA), 'movieId', 'rating')),
+        ]
+
+    try:
+        import numpy_backend
+        numpy_backend.check_numpy()
+    except ImportError:
+        return benchmarks
+
+    benchmarks += [
+        ('numpy/get_groupped_data_from_file', lambda: numpy_backend.get_groupped_data_from_file(
+            ratings_path, 'movieId', 'rating')),
+        ('numpy/merged_data', lambda: numpy_backend.merged_data(movies_table, ratings_table, 'movieId')),
+        ('numpy/get_sorted_data', lambda: numpy_backend.get_sorted_data(merged_table, 'rating')),
+        ('numpy/filtered_data_col_in_range', lambda: numpy_backend.filtered_data_col_in_range(
+            merged_table, 'year', 1990, 2010)),
+        ('main/numpy', lambda: run_main(['-b', 'numpy', '-n', '10'], data_path, cache_dir)),
+    ]
+    return benchmarks
+
+
+def run_benchmarks(scales: list, data_dir: str, seed: int = 42, repeat: int = 3, trace_memory: bool = True, only: str = None) -> dict:
+    """Generate datasets, run benchmarks and get results
+
+    Parameters
+    ----------
+    scales : list
+        Scales from SCALES
+    data_dir : str
+        Directory of generated datasets
+    seed : int, optional
+        Seed of dataset generator, by default 42
+    repeat : int, optional
+        Number of runs of each benchmark, by default 3
+    trace_memory : bool, optional
+        Flag to measure peak memory with tracemalloc, by default True
+    only : str, optional
+        RegEx of benchmark names to run, by default None (all)
+
+    Returns
+    -------
+    dict
+        Metadata of run and dictionary of `<scale>/<benchmark>` and
+        best time in seconds and peak memory in MiB
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_PATH,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    results = {}
+    report = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+    # main() writes log/app.log relative to working directory, logging of
+    # rows which can't be parsed is not measured
+    os.chdir(ROOT_PATH)
+    log.disable(log.WARNING)
+    for scale in scales:
+        print(f'generating dataset {scale}', file=sys.stderr)
+        data_path = generate_dataset(data_dir, scale, seed)
+        cache_dir = os.path.join(data_path, 'cache')
+        for name, func in get_benchmarks(data_path, SCALES[scale][0], cache_dir):
+            if only and not re.search(only, name):
+                continue
+            _, best, peak = measure(func, repeat=repeat, trace_memory=trace_memory)
+            key = f'{scale}/{name}'
+            results[key] = {'secs': round(best, 6), 'peak_mib': round(peak / 2**20, 3) if trace_memory else None}
+            print(f'{key:<55} {best:10.4f} secs {peak / 2**20:10.2f} MiB', file=sys.stderr)
+
+    return report
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float = 0.25, min_secs: float = 0.02) -> list:
+    """Find benchmarks which are slower or use more memory than baseline
+
+    Parameters
+    ----------
+    results : dict
+        Results of run_benchmarks
+    baseline : dict
+        Stored results of run_benchmarks
+    threshold : float, optional
+        Allowed relative increase, by default 0.25
+    min_secs : float, optional
+        Time increase below which difference is treated as noise, by default 0.02
+
+    Returns
+    -------
+    list
+        Regressions stored in dicts with `name`, `metric`, `value`, `baseline` and `ratio` keys
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for metric, noise in (('secs', min_secs), ('peak_mib', 0.01)):
+            value, base_value = result.get(metric), base.get(metric)
+            if value is None or not base_value:
+                continue
+            if value > base_value * (1 + threshold) and value - base_value > noise:
+                regressions.append({'name': name, 'metric': metric, 'value': value,
+                                    'baseline': base_value, 'ratio': round(value / base_value, 3)})
+    return regressions
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-s", "--scale", type=str, nargs='+', choices=SCALES, default=['100k'],
+                    help="scales of datasets (default: 100k)")
+    ap.add_argument("--seed", type=int, default=42,
+                    help="seed of dataset generator (default: 42)")
+    ap.add_argument("-r", "--repeat", type=int, default=3,
+                    help="number of runs of each benchmark (default: 3)")
+    ap.add_argument("--only", type=str,
+                    help="RegEx of benchmark names to run (example: ^main)")
+    ap.add_argument("--data_dir", type=str, default='data/synthetic/',
+                    help="directory of generated datasets (default: data/synthetic/)")
+    ap.add_argument("-o", "--output", type=str, default=RESULTS_PATH,
+                    help="results file (default: benchmarks/results.json)")
+    ap.add_argument("-b", "--baseline", type=str, default=BASELINE_PATH,
+                    help="baseline file (default: benchmarks/baseline.json)")
+    ap.add_argument("--save_baseline", action='store_true',
+                    help="save results as new baseline")
+    ap.add_argument("-t", "--threshold", type=float, default=0.25,
+                    help="allowed relative increase of time and memory (default: 0.25)")
+    ap.add_argument("--min_secs", type=float, default=0.02,
+                    help="time increase treated as noise (default: 0.02)")
+    ap.add_argument("--no-memory", action='store_true',
+                    help="skip tracemalloc run which is slow on large files")
+
+    return vars(ap.parse_args())
+
+
+def main():
+    args = get_arguments()
+    data_dir = os.path.abspath(args['data_dir'])
+    output, baseline_path = os.path.abspath(args['output']), os.path.abspath(args['baseline'])
+
+    report = run_benchmarks(args['scale'], data_dir, args['seed'], args['repeat'],
+                            not args['no_memory'], args['only'])
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results saved to {output}')
+
+    if args['save_baseline']:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'baseline saved to {baseline_path}')
+        return 0
+
+    try:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f'no baseline {baseline_path}, run with --save_baseline to create it')
+        return 0
+
+    regressions = compare_with_baseline(report, baseline, args['threshold'], args['min_secs'])
+    for r in regressions:
+        print(f"REGRESSION {r['name']} {r['metric']}: {r['value']} vs {r['baseline']} (x{r['ratio']})")
+    if not regressions:
+        print(f"no regressions against baseline of commit {baseline['meta'].get('commit')}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Check query plan of spr_find_top_rated_movies
+
+This script runs EXPLAIN for queries of stored procedure
+`spr_find_top_rated_movies` with sample arguments and fails if any base
+table is read with full table scan or full index scan. Run it after changes of procedure
+or indexes. Queries are loaded from `sql/spr_get_top_ranked_movies.sql`,
+so the checked plans are plans of the procedure itself.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * get_procedure_queries - Get queries of procedure from its sql file
+    * explain_query - Get EXPLAIN rows of query
+    * get_full_scans - Get base tables read with full table or index scan
+    * get_arguments - Construct the argument parser and get the arguments
+    * main - the main function of the script
+"""
+
+# import the necessary packages
+import os
+import re
+import sys
+import argparse
+import logging as log
+from config import *
+from mysql.connector import (connection)
+
+
+BASE_TABLES = ('movies', 'ratings', 'movie_genres', 'movie_rating_stats')
+# access types which read every row of table or index
+FULL_SCAN_TYPES = ('ALL', 'index')
+
+PROCEDURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql', 'spr_get_top_ranked_movies.sql')
+PROCEDURE_VARIABLES = ('n', 'regexp', 'year_from', 'year_to', 'genres', 'lim')
+MAX_LIMIT = 18446744073709551615
+
+SAMPLE_ARGUMENTS = (
+    {'n': 10, 'regexp': None, 'year_from': 1995, 'year_to': 2015, 'genres': None},
+    {'n': 10, 'regexp': 'love', 'year_from': 1995, 'year_to': None, 'genres': None},
+    {'n': None, 'regexp': None, 'year_from': 2010, 'year_to': None, 'genres': None},
+    {'n': 5, 'regexp': None, 'year_from': 1995, 'year_to': 2015, 'genres': 'Horror|Children'},
+    {'n': 5, 'regexp': 'love', 'year_from': None, 'year_to': None, 'genres': 'Comedy'},
+)
+
+
+def get_procedure_queries(file_path: str = PROCEDURE_PATH) -> tuple:
+    """Get queries of both branches of procedure from its sql file with
+    parameters and local variables replaced by named query parameters
+
+    Parameters
+    ----------
+    file_path : str, optional
+        File name of procedure, by default PROCEDURE_PATH
+
+    Returns
+    -------
+    tuple
+        Query without genres and query of top movies per genre
+    """
+    with open(file_path) as f:
+        procedure = f.read()
+
+    match = re.search(r'IF genres IS NULL THEN(.*?);\s*ELSE(.*?);\s*END IF;', procedure, re.DOTALL)
+    if match is None:
+        raise ValueError(f'Queries of procedure are not found in `{file_path}`')
+
+    names = '|'.join(name for name in PROCEDURE_VARIABLES if name != 'regexp')
+    variable = re.compile(rf'`regexp`|(?<![.\w])(?:{names})\b')
+    return tuple(variable.sub(lambda m: f"%({m.group(0).strip('`')})s", query).strip()
+                 for query in match.groups())
+
+
+def explain_query(cnx, query_string: str, params: dict) -> list:
+    """Get EXPLAIN rows of query
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    query_string : str
+        Query with named parameters
+    params : dict
+        Values of query parameters
+
+    Returns
+    -------
+    list
+        EXPLAIN rows stored in dicts
+    """
+    cursor = cnx.cursor(dictionary=True)
+    cursor.execute('EXPLAIN ' + query_string, params)
+    plan = cursor.fetchall()
+    cursor.close()
+    return plan
+
+
+def get_full_scans(plan: list, tables=BASE_TABLES) -> list:
+    """Get base tables read with full table scan (`ALL` access type) or
+    full index scan (`index` access type), which also reads every row.
+    Derived tables of CTE are not checked
+
+    Parameters
+    ----------
+    plan : list
+        EXPLAIN rows stored in dicts
+    tables : tuple, optional
+        Names or aliases of checked tables, by default BASE_TABLES
+
+    Returns
+    -------
+    list
+        EXPLAIN rows with full table or index scan
+    """
+    aliases = {'m': 'movies', 'r': 'ratings', 'mg': 'movie_genres', 's': 'movie_rating_stats'}
+    return [row for row in plan
+            if aliases.get(row['table'], row['table']) in tables and row['type'] in FULL_SCAN_TYPES]
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-v", "--verbose", action='store_true',
+                    help="print EXPLAIN rows of every checked query")
+
+    return vars(ap.parse_args())
+
+
+def main():
+    log.basicConfig(level=log.getLevelName(CONFIG['logging']['level']),
+                    filename=CONFIG['logging']['filename'],
+                    filemode=CONFIG['logging']['filemode'],
+                    format=CONFIG['logging']['format'],
+                    datefmt=CONFIG['logging']['datefmt'])
+    log.info('Start')
+
+    args = get_arguments()
+    log.debug(f'arguments: {args}')
+
+    full_scans = 0
+    try:
+        log.info('Opening connection to DB')
+        cnx = connection.MySQLConnection(**CONFIG['db_connect'])
+        log.info('Done!')
+
+        top_movies_query, top_movies_per_genre_query = get_procedure_queries()
+        for params in SAMPLE_ARGUMENTS:
+            log.info(f'explaining query with arguments {params}')
+            query_string = top_movies_query if params['genres'] is None else top_movies_per_genre_query
+            lim = MAX_LIMIT if params['n'] is None else params['n']
+            plan = explain_query(cnx, query_string, {**params, 'lim': lim})
+            if args['verbose']:
+                for row in plan:
+                    print(row)
+            for row in get_full_scans(plan):
+                full_scans += 1
+                scan = 'table' if row['type'] == 'ALL' else f"index `{row['key']}`"
+                print(f"Full {scan} scan of `{row['table']}` with arguments {params}")
+                log.error(f'full scan: {row}')
+            log.info('Done!')
+
+        cnx.close()
+        log.info('Connection to DB closed')
+    except Exception as e:
+        log.exception(e)
+        return 2
+
+    if not full_scans:
+        print('No full table or index scans')
+    return 1 if full_scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
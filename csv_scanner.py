@@ -0,0 +1,212 @@
+"""Memory-mapped byte-level CSV scanner
+
+This module parses CSV files into columnar Tables without creating
+python objects per row. File is memory-mapped and splitted to blocks of
+lines, fields of block are splitted at once and numeric columns are
+converted straight from bytes to typed arrays. Text columns are decoded
+once per field. Blocks which contain quotes, e.g. titles with commas in
+`movies.csv`, and blocks with blank lines or lines with irregular number
+of fields are parsed by csv module, which skips blank lines and fails on
+lines shorter than header. Fields must not contain line breaks.
+
+Memory used by scanner is bounded by size of block, which is copied from
+the map and splitted to bytes object per field, so purely numeric
+`ratings.csv` of any size is read with flat memory profile besides the
+resulting arrays.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * SCAN_BLOCK_SIZE - Default size of block in bytes
+    * get_blocks - Split byte range of memory-mapped file to blocks of lines
+    * scan_csv_chunks - Scan CSV file and yield Table per block of lines
+    * scan_csv_table - Scan CSV file to one Table
+"""
+
+
+# import the necessary packages
+import io
+import csv
+import mmap
+from array import array
+from itertools import repeat
+from table import Table, Column, DTYPES
+
+
+# peak memory of scan is a few MiB per block, small blocks also fit in cache
+SCAN_BLOCK_SIZE = 1 << 16
+CONVERTERS = {
+    'int16': int,
+    'int32': int,
+    'int64': int,
+    'float32': float,
+    'float64': float,
+}
+
+
+def get_blocks(buffer, start: int, end: int, block_size: int = SCAN_BLOCK_SIZE):
+    """Split byte range of buffer to blocks which end on line boundaries
+
+    Parameters
+    ----------
+    buffer : mmap.mmap or bytes
+        File content
+    start : int
+        Offset of first line
+    end : int
+        Exclusive end offset, line boundary or end of buffer
+    block_size : int, optional
+        Desired size of block in bytes, by default SCAN_BLOCK_SIZE
+
+    Yields
+    -------
+    tuple
+        (start, end) offsets of block
+    """
+    pos = start
+    while pos < end:
+        cut = min(pos + block_size, end)
+        if cut < end:
+            newline = buffer.rfind(b'\n', pos, cut)
+            if newline < 0:
+                # line is longer than block
+                newline = buffer.find(b'\n', cut, end)
+            cut = newline + 1 if newline >= 0 else end
+        yield pos, cut
+        pos = cut
+
+
+def _extend_column(column: Column, values: list, encoding: str) -> None:
+    """Append list of raw bytes fields to column"""
+    convert = CONVERTERS.get(column.dtype)
+    if convert is not None and b'' not in values:
+        column.data.extend(array(DTYPES[column.dtype], map(convert, values)))
+        if column.nulls is not None:
+            column.nulls.extend(bytes(len(values)))
+    elif column.dtype == 'str' and column.nulls is None:
+        column.data.extend([v.decode(encoding) for v in values])
+    else:
+        # nulls and categories are handled by column
+        column.extend([v.decode(encoding) for v in values])
+
+
+def _get_line_number(file_path: str, offset: int) -> int:
+    """Get number of line of file which starts at offset, only for errors"""
+    with open(file_path, 'rb') as f:
+        return f.read(offset).count(b'\n') + 1
+
+
+def _append_block(table: Table, block: bytes, positions: list, n_fields: int, delimiter: bytes, encoding: str,
+                  file_path: str, block_start: int) -> None:
+    """Parse block of lines and append its fields to columns of table"""
+    if b'"' not in block:
+        body = block.replace(b'\r', b'').rstrip(b'\n')
+        # first field of every next line keeps its line break, so total
+        # number of fields is checked together with boundaries of lines
+        fields = body.replace(b'\n', delimiter + b'\n').split(delimiter)
+        if (len(fields) == (body.count(b'\n') + 1) * n_fields
+                and all(map(bytes.startswith, fields[n_fields::n_fields], repeat(b'\n')))):
+            for name, i in positions:
+                values = fields[i::n_fields]
+                if i == 0:
+                    values = list(map(bytes.removeprefix, values, repeat(b'\n')))
+                _extend_column(table.column(name), values, encoding)
+            return
+
+    reader = csv.reader(io.StringIO(block.decode(encoding), newline=''), delimiter=delimiter.decode())
+    appends = [(i, table.column(name).append) for name, i in positions]
+    for row in reader:
+        if len(row) < n_fields:
+            if not row:
+                continue
+            line = _get_line_number(file_path, block_start) + reader.line_num - 1
+            raise ValueError(f'Line {line} of `{file_path}` has {len(row)} fields, expected {n_fields}')
+        for i, append in appends:
+            append(row[i])
+
+
+def _scan(file_path: str, schema: dict, delimiter: str, start: int, end: int, block_size: int, encoding: str):
+    """Yield (positions, number of fields, block, offset of block) of file"""
+    with open(file_path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            raise ValueError(f'File `{file_path}` is empty')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            header_end = buffer.find(b'\n')
+            header_end = len(buffer) if header_end < 0 else header_end + 1
+            header = next(csv.reader([buffer[:header_end].decode(encoding)], delimiter=delimiter))
+            positions = [(name, header.index(name)) for name in schema]
+
+            start = header_end if start is None else max(start, header_end)
+            end = len(buffer) if end is None else min(end, len(buffer))
+            for block_start, block_end in get_blocks(buffer, start, end, block_size):
+                yield positions, len(header), buffer[block_start:block_end], block_start
+
+
+def scan_csv_chunks(file_path: str, schema: dict, delimiter: str = ',', start: int = None, end: int = None,
+                    block_size: int = SCAN_BLOCK_SIZE, encoding: str = 'utf-8'):
+    """Scan CSV file and yield Table per block of lines. Category columns of
+    all chunks share categories, so chunks can be appended to one table
+    without decoding values
+
+    Parameters
+    ----------
+    file_path : str
+        File name of csv file with header
+    schema : dict
+        Columns to read from file with their types, see table.DTYPES
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    start : int, optional
+        Offset of first line to read, e.g. from movies.get_file_chunks,
+        by default None (line after header)
+    end : int, optional
+        Exclusive end offset on line boundary, by default None (end of file)
+    block_size : int, optional
+        Desired size of block in bytes, by default SCAN_BLOCK_SIZE
+    encoding : str, optional
+        Encoding of text fields, by default 'utf-8'
+
+    Yields
+    -------
+    Table
+        Chunk of data with schema columns
+    """
+    template = Table({name: Column(dtype) for name, dtype in schema.items()})
+    sep = delimiter.encode()
+    for positions, n_fields, block, block_start in _scan(file_path, schema, delimiter, start, end, block_size, encoding):
+        chunk = template.empty_like()
+        _append_block(chunk, block, positions, n_fields, sep, encoding, file_path, block_start)
+        yield chunk
+
+
+def scan_csv_table(file_path: str, schema: dict, delimiter: str = ',', start: int = None, end: int = None,
+                   block_size: int = SCAN_BLOCK_SIZE, encoding: str = 'utf-8') -> Table:
+    """Scan CSV file to one Table, blocks are appended to columns in place
+
+    Parameters
+    ----------
+    file_path : str
+        File name of csv file with header
+    schema : dict
+        Columns to read from file with their types, see table.DTYPES
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    start : int, optional
+        Offset of first line to read, by default None (line after header)
+    end : int, optional
+        Exclusive end offset on line boundary, by default None (end of file)
+    block_size : int, optional
+        Desired size of block in bytes, by default SCAN_BLOCK_SIZE
+    encoding : str, optional
+        Encoding of text fields, by default 'utf-8'
+
+    Returns
+    -------
+    Table
+        Data from file stored in typed columns
+    """
+    table = Table({name: Column(dtype) for name, dtype in schema.items()})
+    sep = delimiter.encode()
+    for positions, n_fields, block, block_start in _scan(file_path, schema, delimiter, start, end, block_size, encoding):
+        _append_block(table, block, positions, n_fields, sep, encoding, file_path, block_start)
+    return table
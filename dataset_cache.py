@@ -0,0 +1,267 @@
+"""Binary columnar cache of parsed datasets
+
+This module allows to store Table on disk and load it back without
+parsing CSV files again. Each column is written to separate file with raw
+array data in native byte order, so files can be memory-mapped with
+`mmap` or `numpy.memmap`. Table metadata and fingerprints of source files
+are stored in `meta.json`, cache is invalidated when size, modification
+time or content hash of any source file changes.
+
+Layout of cached table:
+
+    <cache_dir>/<name>/meta.json
+    <cache_dir>/<name>/<column>.bin      - values or category codes
+    <cache_dir>/<name>/<column>.nulls    - null mask, if column has nulls
+    <cache_dir>/<name>/<column>.offsets  - int64 offsets of `str` values
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * get_file_fingerprint - Get size, modification time and hash of file
+    * is_fresh - Check if source files match stored fingerprints
+    * save_table - Save Table to cache directory
+    * load_table - Load Table from cache directory
+    * cached_table - Load Table from cache or build and save it
+"""
+
+
+# import the necessary packages
+import os
+import sys
+import json
+import mmap
+import hashlib
+import logging as log
+from array import array
+from table import Table, Column, DTYPES
+
+
+CACHE_FORMAT_VERSION = 1
+
+
+def get_file_fingerprint(file_path: str, with_hash: bool = True) -> dict:
+    """Get size, modification time and content hash of file
+
+    Parameters
+    ----------
+    file_path : str
+        File name
+    with_hash : bool, optional
+        Flag to compute blake2b hash of file content, by default True
+
+    Returns
+    -------
+    dict
+        Dictionary with `size`, `mtime_ns` and `hash` keys
+    """
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': None}
+    if with_hash:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint['hash'] = digest.hexdigest()
+    return fingerprint
+
+
+def is_fresh(meta: dict, sources: list) -> bool:
+    """Check if source files match fingerprints stored in metadata. Content
+    hash is computed only when size is the same but modification time changed,
+    and stored fingerprint is updated if content is unchanged.
+
+    Parameters
+    ----------
+    meta : dict
+        Cache metadata
+    sources : list
+        Source file names
+
+    Returns
+    -------
+    bool
+        True if cache can be used
+    """
+    stored = meta.get('sources', {})
+    if sorted(stored) != sorted(os.path.abspath(s) for s in sources):
+        return False
+
+    for path, fingerprint in stored.items():
+        try:
+            current = get_file_fingerprint(path, with_hash=False)
+        except OSError:
+            return False
+        if current['size'] != fingerprint['size']:
+            return False
+        if current['mtime_ns'] != fingerprint['mtime_ns']:
+            if get_file_fingerprint(path)['hash'] != fingerprint['hash']:
+                return False
+            fingerprint['mtime_ns'] = current['mtime_ns']
+
+    return True
+
+
+def _write_array(file_path: str, data) -> None:
+    with open(file_path, 'wb') as f:
+        data.tofile(f)
+
+
+def _read_array(file_path: str, typecode: str) -> array:
+    data = array(typecode)
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data.frombytes(mm)
+    return data
+
+
+def save_table(table: Table, cache_path: str, sources: list) -> None:
+    """Save Table to cache directory
+
+    Parameters
+    ----------
+    table : Table
+        Table to save
+    cache_path : str
+        Directory of cached table
+    sources : list
+        Source file names, cache is invalidated when they change
+    """
+    os.makedirs(cache_path, exist_ok=True)
+    meta_path = os.path.join(cache_path, 'meta.json')
+    # table without metadata is never loaded, so remove it before writing columns
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    columns = []
+    for name in table.columns:
+        column = table.column(name)
+        base = os.path.join(cache_path, name)
+        if column.dtype == 'str':
+            blobs = [v.encode('utf-8') for v in column.data]
+            offsets = array('q', [0])
+            for blob in blobs:
+                offsets.append(offsets[-1] + len(blob))
+            with open(base + '.bin', 'wb') as f:
+                f.write(b''.join(blobs))
+            _write_array(base + '.offsets', offsets)
+        else:
+            _write_array(base + '.bin', column.data)
+        if column.nulls is not None:
+            with open(base + '.nulls', 'wb') as f:
+                f.write(column.nulls)
+        columns.append({
+            'name': name,
+            'dtype': column.dtype,
+            'nulls': column.nulls is not None,
+            'categories': column.categories,
+        })
+
+    meta = {
+        'version': CACHE_FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'rows': len(table),
+        'columns': columns,
+        'sources': {os.path.abspath(s): get_file_fingerprint(s) for s in sources},
+    }
+    tmp_path = meta_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def load_table(cache_path: str, sources: list = None):
+    """Load Table from cache directory
+
+    Parameters
+    ----------
+    cache_path : str
+        Directory of cached table
+    sources : list, optional
+        Source file names to validate cache, by default None (no validation)
+
+    Returns
+    -------
+    Table or None
+        Cached table, None if cache is missing or stale
+    """
+    meta_path = os.path.join(cache_path, 'meta.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('version') != CACHE_FORMAT_VERSION or meta.get('byteorder') != sys.byteorder:
+        return None
+    if sources is not None:
+        stored_mtimes = {k: v['mtime_ns'] for k, v in meta['sources'].items()}
+        if not is_fresh(meta, sources):
+            return None
+        if stored_mtimes != {k: v['mtime_ns'] for k, v in meta['sources'].items()}:
+            # sources were touched but not changed, remember new modification time
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+    columns = {}
+    try:
+        for spec in meta['columns']:
+            base = os.path.join(cache_path, spec['name'])
+            column = Column(spec['dtype'])
+            if spec['dtype'] == 'str':
+                offsets = _read_array(base + '.offsets', 'q')
+                with open(base + '.bin', 'rb') as f:
+                    blob = f.read()
+                column.data = [blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+                               for i in range(len(offsets) - 1)]
+            else:
+                column.data = _read_array(base + '.bin', DTYPES[spec['dtype']])
+            if spec['nulls']:
+                with open(base + '.nulls', 'rb') as f:
+                    column.nulls = bytearray(f.read())
+            if spec['categories'] is not None:
+                column.categories = spec['categories']
+                column._codes = {c: i for i, c in enumerate(column.categories)}
+            columns[spec['name']] = column
+        table = Table(columns)
+    except (OSError, ValueError) as e:
+        log.warning(f'Can`t load cached table `{cache_path}`: {e}')
+        return None
+
+    if len(table) != meta['rows']:
+        return None
+    return table
+
+
+def cached_table(cache_dir: str, name: str, sources: list, build_func) -> Table:
+    """Load Table from cache or build it and save to cache
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory
+    name : str
+        Name of cached table
+    sources : list
+        Source file names of table
+    build_func : callable
+        Function without arguments which builds Table from sources
+
+    Returns
+    -------
+    Table
+        Cached or built table
+    """
+    cache_path = os.path.join(cache_dir, name)
+    table = load_table(cache_path, sources)
+    if table is not None:
+        log.debug(f'`{name}` loaded from cache `{cache_path}`')
+        return table
+
+    log.debug(f'`{name}` is not cached or stale, building it')
+    table = build_func()
+    try:
+        save_table(table, cache_path, sources)
+    except OSError as e:
+        log.warning(f'Can`t save `{name}` to cache `{cache_path}`: {e}')
+    return table
@@ -6,6 +6,7 @@
 filename="ml-latest-small.zip"
 url="https://files.grouplens.org/datasets/movielens/${filename}"
 data_path="data/"
+daemon_url="http://127.0.0.1:8765"
 
 function parse_arguments() {
     if [ $# -eq 0 ]
@@ -21,7 +22,7 @@ function parse_arguments() {
     pass="root"
     db="master"
 
-    while getopts "hn:g:f:t:r:sH:P:u:p:d:" flag
+    while getopts "hn:g:f:t:r:silH:P:u:p:d:" flag
     do
         case "${flag}" in
             h)  
@@ -46,6 +47,12 @@ function parse_arguments() {
             s)
                 checkargs
                 setupdb=1;;
+            i)
+                checkargs
+                incremental=1;;
+            l)
+                checkargs
+                local_daemon=1;;
             H)  
                 checkargs
                 hostname=${OPTARG};;
@@ -82,7 +89,7 @@ function print_help() {
     echo "Get top N rated movies from MovieLens"
     echo ""
     echo "Usage:"
-    echo "  ./get-movies.sh [-h] [-n TOPN] [-g GENRES] [-f YEAR_FROM] [-t YEAR_TO] [-r REGEXP]"
+    echo "  ./get-movies.sh [-h] [-n TOPN] [-g GENRES] [-f YEAR_FROM] [-t YEAR_TO] [-r REGEXP] [-s] [-i] [-l]"
     echo "Optional arguments:"
     echo "  -h (help) show this message and exit"
     echo "  -n (topN) the number of top rated movies for each genre (example: 3)"
@@ -91,6 +98,8 @@ function print_help() {
     echo "  -t (year_to) the lower boundary of year filter (example: 2010)"
     echo "  -r (regexp) filter on name of the film (example: love)"
     echo "  -s (setupdb) flag for setup db"
+    echo "  -i (incremental) import only new ratings and changed movies to existing db"
+    echo "  -l (local) query running movies_daemon.py at ${daemon_url} instead of db"
     echo "  -H (host) host name for connection to db (default: localhost)"
     echo "  -P (port) port for connection to db (default: 3306)"
     echo "  -u (user) user name for connection to db (default: root)"
@@ -104,13 +113,22 @@ function exec_sql_files() {
     echo -ne '                          (0%)\r'
 
     mysql -h $hostname --port=$port $db -u$user < sql/movies_table.sql
-    echo -ne '#######                   (25%)\r'
+    echo -ne '####                      (14%)\r'
 
     mysql -h $hostname --port=$port $db -u$user < sql/ratings_table.sql
-    echo -ne '#############             (50%)\r'
+    echo -ne '#######                   (29%)\r'
+
+    mysql -h $hostname --port=$port $db -u$user < sql/movie_rating_stats_table.sql
+    echo -ne '###########               (43%)\r'
+
+    mysql -h $hostname --port=$port $db -u$user < sql/movie_genres_table.sql
+    echo -ne '###############           (57%)\r'
+
+    mysql -h $hostname --port=$port $db -u$user < sql/import_watermarks_table.sql
+    echo -ne '##################        (71%)\r'
 
     mysql -h $hostname --port=$port $db -u$user < sql/vw_movies_ratings.sql
-    echo -ne '#################         (75%)\r'
+    echo -ne '######################    (86%)\r'
 
     mysql -h $hostname --port=$port $db -u$user < sql/spr_get_top_ranked_movies.sql
     echo -ne '#######################   (100%) Done!\r'
@@ -119,16 +137,7 @@ function exec_sql_files() {
 
 function exec_import_to_db() {
     echo "Importing data to db"
-    python3 import_to_db.py &
-    PID=$!
-    i=1
-    sp="/-\|"
-    echo -n ' '
-    while [ -d /proc/$PID ]
-    do
-        printf "\b${sp:i++%${#sp}:1}"
-    done
-    echo ""
+    python3 import_to_db.py --progress "$@"
     echo "Done!"
 }
 
@@ -161,6 +170,35 @@ function construct_command () {
     fi
 }
 
+function construct_daemon_command () {
+    cmd="curl -sfG ${daemon_url}/movies"
+
+    if [[ -v topN ]]
+    then
+        cmd="${cmd} -d \"topN=${topN}\""
+    fi
+
+    if [[ -v genres ]]
+    then
+        cmd="${cmd} --data-urlencode \"genres=${genres}\""
+    fi
+
+    if [[ -v year_from ]]
+    then
+        cmd="${cmd} -d \"year_from=${year_from}\""
+    fi
+
+    if [[ -v year_to ]]
+    then
+        cmd="${cmd} -d \"year_to=${year_to}\""
+    fi
+
+    if [[ -v regexp ]]
+    then
+        cmd="${cmd} --data-urlencode \"regexp=${regexp}\""
+    fi
+}
+
 function download_data_files() {
 
     out=$(wget -qN $url 2>&1)
@@ -184,6 +222,15 @@ then
     download_data_files;
     exec_import_to_db;
     remove_data_files;
+elif [[ -v incremental ]];
+then
+    download_data_files;
+    exec_import_to_db --incremental;
+    remove_data_files;
+elif [[ -v local_daemon ]];
+then
+    construct_daemon_command;
+    eval $cmd;
 else
     construct_command;
     eval $cmd;
@@ -6,19 +6,68 @@ This file can also be imported as a module and contains the following
 functions:
     * import_ratings_csv_to_db - Read data from CSV file and insert it to database table
     * import_movies_csv_to_db - Read data from CSV file and insert it to database table
+    * disabled_checks - Context manager which disables unique and foreign key checks
+    * insert_rows_batched - Insert rows to database table by batches with executemany
+    * upsert_rating_stats - Add count and sum of ratings per movie to stats table
+    * upsert_rating_stats_deltas - Add changes of count and sum of ratings per movie to stats table
+    * rebuild_rating_stats - Recompute stats table from all ratings
+    * insert_movie_genres - Insert normalized genres of movies to genres table
+    * rebuild_movie_genres - Recompute genres table from all movies
+    * get_movie_row - Transform row of movies CSV file to table row
+    * bulk_import_ratings_csv_to_db - Read ratings from CSV file and insert it by batches
+    * bulk_import_movies_csv_to_db - Read movies from CSV file and insert it by batches
+    * load_ratings_infile - Load ratings CSV file with LOAD DATA LOCAL INFILE
+    * load_movies_infile - Load movies CSV file with LOAD DATA LOCAL INFILE
+    * ImportProgress - Progress and speed of concurrent imports printed to terminal
+    * read_csv_batches - Read CSV file by batches of transformed rows
+    * pipeline_insert_csv_to_db - Insert CSV file with producer thread and several insert workers
+    * pipeline_import_ratings_csv_to_db - Import ratings with pipeline of parse and insert workers
+    * pipeline_import_movies_csv_to_db - Import movies with pipeline of parse and insert workers
+    * pipeline_import_tables - Import ratings and movies concurrently
+    * get_watermark - Get high-water mark of imported rows of table
+    * set_watermark - Save high-water mark of imported rows of table
+    * record_ratings_watermark - Save latest timestamp of ratings table as its high-water mark
+    * get_rating_deltas - Get changes of stats of movies made by upsert of ratings
+    * incremental_import_ratings_csv_to_db - Upsert ratings newer than high-water mark and apply deltas to stats
+    * upsert_movies_csv_to_db - Upsert new and changed movies and their genres
+    * get_arguments - Construct the argument parser and get the arguments
     * main - the main function of the script
 """
 
 # import the necessary packages
+import os
 import re
 import csv
+import sys
 import time
+import queue
+import argparse
+import threading
 import logging as log
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from config import *
 from mysql.connector import (connection)
+from movies import get_running_aggregates
+from indexes import InvertedIndex
+from result_cache import bump_db_version
+import profiling
 
 
-def import_ratings_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='ratings', skip_header=True) -> None:
+IMPORT_MODES = ('rows', 'bulk', 'infile', 'pipeline')
+STATS_TABLE = 'movie_rating_stats'
+GENRES_TABLE = 'movie_genres'
+WATERMARKS_TABLE = 'import_watermarks'
+LOOKUP_BATCH_SIZE = 5000
+IMPORT_WORKERS = 4
+QUEUE_SIZE = 8
+DEADLOCK_ERRNO = 1213
+DEADLOCK_RETRIES = 3
+
+
+@profiling.timed()
+def import_ratings_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='ratings', skip_header=True) -> int:
     """Read data from CSV file and insert it to database table
 
     Parameters
@@ -33,8 +82,14 @@ def import_ratings_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='rat
         Destination table name, by default 'ratings'
     skip_header : bool, optional
         Flag to determinate header row of file, by default True
+
+    Returns
+    -------
+    int
+        Number of inserted rows
     """
     cursor = cnx.cursor()
+    rows_affected = 0
 
     try:
         with open(file_path, newline='') as csvfile:
@@ -59,13 +114,18 @@ def import_ratings_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='rat
     except Exception as e:
         log.exception(e)
         cnx.rollback()
+        # nothing is inserted, all rows are in one transaction
+        rows_affected = 0
     
     log.info(f'Rows affected: {rows_affected}')
     cursor.close()
+    return rows_affected
 
 
-def import_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movies', skip_header=True, split_regex=r'\s\(\d{4}\)', year_regex=r'\d{4}', null_genre='(no genres listed)') -> None:
-    """Read data from CSV file and insert it to database table
+@profiling.timed()
+def import_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movies', skip_header=True, split_regex=r'\s\(\d{4}\)', year_regex=r'\d{4}', null_genre='(no genres listed)') -> int:
+    """Read data from CSV file and insert it to database table. Normalized
+    genres of movies are inserted to genres table in the same transaction
 
     Parameters
     ----------
@@ -85,8 +145,14 @@ def import_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movi
         Regular Expression used to extract year from title column, by default r'\d{4}'
     null_genre : str, optional
         String that determinate NULL value of genres column, by default (no genres listed)'
+
+    Returns
+    -------
+    int
+        Number of inserted rows
     """
     cursor = cnx.cursor()
+    rows_affected = 0
 
     try:
         with open(file_path, newline='') as csvfile:
@@ -99,7 +165,9 @@ def import_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movi
             log.debug(field_names)
 
             rows_affected = 0
+            movie_genres = []
             for row in reader:
+                movie_genres.append((int(row[0]), None if row[2] == null_genre else row[2]))
 
                 # get year column from title
                 year = re.search(split_regex, row[1])
@@ -129,14 +197,1142 @@ def import_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movi
                     values
                 )
                 rows_affected += cursor.rowcount
+            insert_movie_genres(cursor, movie_genres, 0, 1)
         cnx.commit()
     except Exception as e:
         log.exception(e)
         log.debug(query_string)
         cnx.rollback()
+        # nothing is inserted, all rows are in one transaction
+        rows_affected = 0
     
     log.info(f'Rows affected: {rows_affected}')
     cursor.close()
+    return rows_affected
+
+
+@contextmanager
+def disabled_checks(cnx, unique_checks: bool = False):
+    """Context manager which disables unique and foreign key checks of session
+    during bulk load and restores them after. Tables with secondary unique
+    index, e.g. `ratings`, must be loaded with unique checks, otherwise
+    duplicates of the index can be inserted
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    unique_checks : bool, optional
+        Flag to keep unique checks enabled, by default False
+    """
+    cursor = cnx.cursor()
+    if not unique_checks:
+        cursor.execute('SET unique_checks = 0')
+    cursor.execute('SET foreign_key_checks = 0')
+    try:
+        yield
+    finally:
+        cursor.execute('SET unique_checks = 1')
+        cursor.execute('SET foreign_key_checks = 1')
+        cursor.close()
+
+
+def insert_rows_batched(cnx, dest_table: str, field_names: list, rows, batch_size: int = 10000, on_batch=None, unique_checks: bool = False) -> int:
+    """Insert rows to database table by batches. Each batch is sent as one
+    multi-row parameterized INSERT with executemany and committed.
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    dest_table : str
+        Destination table name
+    field_names : list
+        Column names of destination table in order of row values
+    rows : iterable
+        Rows stored in tuples
+    batch_size : int, optional
+        Number of rows in one INSERT and transaction, by default 10000
+    on_batch : callable, optional
+        Function of cursor and batch rows called in transaction of each
+        batch before commit, by default None
+    unique_checks : bool, optional
+        Flag to keep unique checks enabled, by default False
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    cursor = cnx.cursor()
+    placeholders = ', '.join(['%s'] * len(field_names))
+    query_string = f'INSERT INTO {dest_table} ({", ".join(field_names)}) VALUES ({placeholders})'
+    log.debug(query_string)
+
+    rows_affected = 0
+    batch = []
+    try:
+        with disabled_checks(cnx, unique_checks):
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    cursor.executemany(query_string, batch)
+                    if on_batch:
+                        on_batch(cursor, batch)
+                    cnx.commit()
+                    rows_affected += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(query_string, batch)
+                if on_batch:
+                    on_batch(cursor, batch)
+                cnx.commit()
+                rows_affected += len(batch)
+    except Exception as e:
+        log.exception(e)
+        log.error(f'Batch after row {rows_affected} is rolled back')
+        cnx.rollback()
+
+    cursor.close()
+    return rows_affected
+
+
+def upsert_rating_stats(cursor, ratings, movie_idx: int = 1, rating_idx: int = 2, stats_table: str = STATS_TABLE) -> int:
+    """Add count and sum of ratings per movie to pre-aggregated stats table.
+    Commit is left to caller, so stats are updated in the same transaction
+    as ratings
+
+    Parameters
+    ----------
+    cursor :
+        Cursor of MySqlConnection to database
+    ratings : iterable
+        Rows of ratings
+    movie_idx : int, optional
+        Position of movieId in row, by default 1
+    rating_idx : int, optional
+        Position of rating in row, by default 2
+    stats_table : str, optional
+        Stats table name, by default STATS_TABLE
+
+    Returns
+    -------
+    int
+        Number of updated movies
+    """
+    states = get_running_aggregates(
+        ((int(row[movie_idx]), float(row[rating_idx])) for row in ratings), 'sum')
+    return upsert_rating_stats_deltas(cursor, states, stats_table)
+
+
+def upsert_rating_stats_deltas(cursor, deltas: dict, stats_table: str = STATS_TABLE) -> int:
+    """Add changes of count and sum of ratings per movie to stats table.
+    Commit is left to caller
+
+    Parameters
+    ----------
+    cursor :
+        Cursor of MySqlConnection to database
+    deltas : dict
+        Lists of count and sum changes per movieId
+    stats_table : str, optional
+        Stats table name, by default STATS_TABLE
+
+    Returns
+    -------
+    int
+        Number of updated movies
+    """
+    query_string = (f'INSERT INTO {stats_table} (movieId, rating_count, rating_sum) '
+                    f'VALUES (%s, %s, %s) AS new '
+                    f'ON DUPLICATE KEY UPDATE rating_count = {stats_table}.rating_count + new.rating_count, '
+                    f'rating_sum = {stats_table}.rating_sum + new.rating_sum')
+    # movies are updated in the same order by all connections to avoid deadlocks
+    rows = [(k, v[0], v[1]) for k, v in sorted(deltas.items()) if v[0] or v[1]]
+    if rows:
+        cursor.executemany(query_string, rows)
+    return len(rows)
+
+
+@profiling.timed()
+def rebuild_rating_stats(cnx, stats_table: str = STATS_TABLE, ratings_table: str = 'ratings') -> int:
+    """Recompute pre-aggregated stats table from all ratings
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    stats_table : str, optional
+        Stats table name, by default STATS_TABLE
+    ratings_table : str, optional
+        Ratings table name, by default 'ratings'
+
+    Returns
+    -------
+    int
+        Number of movies in stats table
+    """
+    cursor = cnx.cursor()
+    rows_affected = 0
+    try:
+        cursor.execute(f'DELETE FROM {stats_table}')
+        cursor.execute(f'INSERT INTO {stats_table} (movieId, rating_count, rating_sum) '
+                       f'SELECT movieId, COUNT(*), SUM(rating) FROM {ratings_table} GROUP BY movieId')
+        rows_affected = cursor.rowcount
+        cnx.commit()
+    except Exception as e:
+        log.exception(e)
+        cnx.rollback()
+
+    log.info(f'Movie rating stats rebuilt: {rows_affected}')
+    cursor.close()
+    return rows_affected
+
+
+def insert_movie_genres(cursor, movies, id_idx: int = 0, genres_idx: int = 2, genres_table: str = GENRES_TABLE) -> int:
+    """Insert normalized genres of movies to genres table, one row per movie
+    and genre. Commit is left to caller, so genres are inserted in the same
+    transaction as movies
+
+    Parameters
+    ----------
+    cursor :
+        Cursor of MySqlConnection to database
+    movies : iterable
+        Rows of movies, None genres are skipped
+    id_idx : int, optional
+        Position of movieId in row, by default 0
+    genres_idx : int, optional
+        Position of genres in row, by default 2
+    genres_table : str, optional
+        Genres table name, by default GENRES_TABLE
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    movies = list(movies)
+    index = InvertedIndex.from_values((row[genres_idx] for row in movies),
+                                      ids=(row[id_idx] for row in movies))
+    pairs = list(index.pairs())
+    if pairs:
+        cursor.executemany(f'INSERT INTO {genres_table} (movieId, genre) VALUES (%s, %s)', pairs)
+    return len(pairs)
+
+
+@profiling.timed()
+def rebuild_movie_genres(cnx, genres_table: str = GENRES_TABLE, movies_table: str = 'movies') -> int:
+    """Recompute genres table from all movies. Genres are split on server
+    side with JSON_TABLE, used after imports which don`t pass rows through python
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    genres_table : str, optional
+        Genres table name, by default GENRES_TABLE
+    movies_table : str, optional
+        Movies table name, by default 'movies'
+
+    Returns
+    -------
+    int
+        Number of rows in genres table
+    """
+    cursor = cnx.cursor()
+    rows_affected = 0
+    try:
+        cursor.execute(f'DELETE FROM {genres_table}')
+        cursor.execute(f'INSERT INTO {genres_table} (movieId, genre) '
+                       f'SELECT m.movieId, g.genre FROM {movies_table} m, '
+                       f'JSON_TABLE(CONCAT(\'["\', REPLACE(m.genres, \'|\', \'","\'), \'"]\'), '
+                       f'\'$[*]\' COLUMNS (genre varchar(64) PATH \'$\')) g '
+                       f'WHERE m.genres IS NOT NULL')
+        rows_affected = cursor.rowcount
+        cnx.commit()
+    except Exception as e:
+        log.exception(e)
+        cnx.rollback()
+
+    log.info(f'Movie genres rebuilt: {rows_affected}')
+    cursor.close()
+    return rows_affected
+
+
+def get_movie_row(row: list, split_regex=r'\s\(\d{4}\)', year_regex=r'\d{4}', null_genre='(no genres listed)') -> tuple:
+    """Transform row of movies CSV file to row of movies table
+
+    Parameters
+    ----------
+    row : list
+        movieId, title and genres values of CSV file
+    split_regex : str, optional
+        Regular Expression used to remove substring from title column, by default r'\s\(\d{4}\)'
+    year_regex : str, optional
+        Regular Expression used to extract year from title column, by default r'\d{4}'
+    null_genre : str, optional
+        String that determinate NULL value of genres column, by default (no genres listed)'
+
+    Returns
+    -------
+    tuple
+        movieId, title, genres and year values, None for NULL
+    """
+    movie_id, title, genres = row[0], row[1], row[2]
+
+    # get year column from title
+    year = re.search(split_regex, title)
+    if year:
+        title = re.sub(split_regex, '', title)
+        year = int(re.search(year_regex, year.group()).group())
+    else:
+        year = None
+        log.warning(f'Can`t split year column in row: {row}')
+
+    # set NULL if no genres listed
+    if genres == null_genre:
+        genres = None
+        log.warning(f'NULL genre: {row}')
+
+    return (int(movie_id), title, genres, year)
+
+
+@profiling.timed()
+def bulk_import_ratings_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='ratings', batch_size: int = 10000, stats_table: str = STATS_TABLE) -> int:
+    """Read ratings from CSV file and insert it to database table by batches.
+    Pre-aggregated stats table is updated in transaction of each batch
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'ratings'
+    batch_size : int, optional
+        Number of rows in one INSERT and transaction, by default 10000
+    stats_table : str, optional
+        Stats table name, None to skip stats update, by default STATS_TABLE
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    rows_affected = 0
+    try:
+        with open(file_path, newline='') as csvfile:
+            log.debug(f"Reading file '{file_path}'")
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            field_names = next(reader)
+            on_batch = None
+            if stats_table:
+                on_batch = partial(upsert_rating_stats, movie_idx=field_names.index('movieId'),
+                                   rating_idx=field_names.index('rating'), stats_table=stats_table)
+            # unique key (userId, movieId) of ratings is checked on load
+            rows_affected = insert_rows_batched(cnx, dest_table, field_names, reader, batch_size, on_batch,
+                                                unique_checks=True)
+    except Exception as e:
+        log.exception(e)
+
+    log.info(f'Rows affected: {rows_affected}')
+    return rows_affected
+
+
+@profiling.timed()
+def bulk_import_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movies', batch_size: int = 10000, split_regex=r'\s\(\d{4}\)', year_regex=r'\d{4}', null_genre='(no genres listed)', genres_table: str = GENRES_TABLE) -> int:
+    """Read movies from CSV file, split year from title and insert it
+    to database table by batches. Normalized genres table is filled in
+    transaction of each batch
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'movies'
+    batch_size : int, optional
+        Number of rows in one INSERT and transaction, by default 10000
+    split_regex : str, optional
+        Regular Expression used to remove substring from title column, by default r'\s\(\d{4}\)'
+    year_regex : str, optional
+        Regular Expression used to extract year from title column, by default r'\d{4}'
+    null_genre : str, optional
+        String that determinate NULL value of genres column, by default (no genres listed)'
+    genres_table : str, optional
+        Genres table name, None to skip genres insert, by default GENRES_TABLE
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    rows_affected = 0
+    try:
+        with open(file_path, newline='') as csvfile:
+            log.debug(f"Reading file '{file_path}'")
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            field_names = next(reader) + ['year']
+            rows = (get_movie_row(row, split_regex, year_regex, null_genre) for row in reader)
+            on_batch = None
+            if genres_table:
+                on_batch = partial(insert_movie_genres, genres_table=genres_table)
+            rows_affected = insert_rows_batched(cnx, dest_table, field_names, rows, batch_size, on_batch)
+    except Exception as e:
+        log.exception(e)
+
+    log.info(f'Rows affected: {rows_affected}')
+    return rows_affected
+
+
+@profiling.timed()
+def load_ratings_infile(cnx, file_path: str, delimiter=',', dest_table='ratings') -> int:
+    """Load ratings CSV file with LOAD DATA LOCAL INFILE. Connection must be
+    opened with `allow_local_infile=True` and server must enable `local_infile`
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'ratings'
+
+    Returns
+    -------
+    int
+        Number of loaded rows
+    """
+    cursor = cnx.cursor()
+    rows_affected = 0
+    query_string = (f"LOAD DATA LOCAL INFILE %s INTO TABLE {dest_table} "
+                    f"FIELDS TERMINATED BY %s LINES TERMINATED BY '\\n' IGNORE 1 LINES "
+                    f"(userId, movieId, rating, timestamp)")
+    try:
+        # unique key (userId, movieId) of ratings is checked on load
+        with disabled_checks(cnx, unique_checks=True):
+            cursor.execute(query_string, (file_path, delimiter))
+            rows_affected = cursor.rowcount
+            cnx.commit()
+    except Exception as e:
+        log.exception(e)
+        log.debug(query_string)
+        cnx.rollback()
+
+    log.info(f'Rows affected: {rows_affected}')
+    cursor.close()
+    return rows_affected
+
+
+@profiling.timed()
+def load_movies_infile(cnx, file_path: str, delimiter=',', dest_table='movies', null_genre='(no genres listed)') -> int:
+    """Load movies CSV file with LOAD DATA LOCAL INFILE. Year is split from
+    title on server side. Connection must be opened with `allow_local_infile=True`
+    and server must enable `local_infile`
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'movies'
+    null_genre : str, optional
+        String that determinate NULL value of genres column, by default (no genres listed)'
+
+    Returns
+    -------
+    int
+        Number of loaded rows
+    """
+    cursor = cnx.cursor()
+    rows_affected = 0
+    query_string = (f"LOAD DATA LOCAL INFILE %s INTO TABLE {dest_table} "
+                    f"FIELDS TERMINATED BY %s OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+                    f"LINES TERMINATED BY '\\n' IGNORE 1 LINES "
+                    f"(movieId, @title, @genres) "
+                    f"SET title = REGEXP_REPLACE(@title, '[[:space:]]\\\\([0-9]{{4}}\\\\)', ''), "
+                    f"year = REGEXP_SUBSTR(REGEXP_SUBSTR(@title, '[[:space:]]\\\\([0-9]{{4}}\\\\)'), '[0-9]{{4}}'), "
+                    f"genres = NULLIF(@genres, %s)")
+    try:
+        with disabled_checks(cnx):
+            cursor.execute(query_string, (file_path, delimiter, null_genre))
+            rows_affected = cursor.rowcount
+            cnx.commit()
+    except Exception as e:
+        log.exception(e)
+        log.debug(query_string)
+        cnx.rollback()
+
+    log.info(f'Rows affected: {rows_affected}')
+    cursor.close()
+    return rows_affected
+
+
+class ImportProgress:
+    """Progress and speed of concurrent imports. Importers update counters
+    from their threads, reporter thread prints one line with all tables
+
+    Parameters
+    ----------
+    stream : file-like, optional
+        Output stream, by default None (no output, counters only)
+    interval : float, optional
+        Seconds between printed lines, by default 0.5
+    """
+
+    def __init__(self, stream=None, interval: float = 0.5):
+        self.stream = stream
+        self.interval = interval
+        self.tables = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_table(self, name: str, total_bytes: int) -> None:
+        """Register table with size of its file"""
+        with self._lock:
+            self.tables[name] = {'rows': 0, 'bytes': 0, 'total_bytes': total_bytes,
+                                 'start': time.perf_counter(), 'end': None}
+
+    def update(self, name: str, rows: int, n_bytes: int) -> None:
+        """Add inserted rows and size of their part of file"""
+        with self._lock:
+            table = self.tables[name]
+            table['rows'] += rows
+            table['bytes'] += n_bytes
+
+    def finish(self, name: str) -> None:
+        """Mark import of table as finished"""
+        with self._lock:
+            self.tables[name]['end'] = time.perf_counter()
+
+    def line(self) -> str:
+        """Get progress of all tables, e.g. `ratings 45% 45000 rows 12000 rows/s`"""
+        parts = []
+        with self._lock:
+            for name, t in self.tables.items():
+                elapsed = (t['end'] or time.perf_counter()) - t['start']
+                percent = 100 if t['end'] else min(99, 100 * t['bytes'] // max(t['total_bytes'], 1))
+                parts.append(f"{name} {percent:3d}% {t['rows']} rows {t['rows'] / max(elapsed, 1e-9):.0f} rows/s")
+        return ' | '.join(parts)
+
+    def _report(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.stream.write('\r' + self.line())
+            self.stream.flush()
+
+    def __enter__(self):
+        if self.stream is not None:
+            self._thread = threading.Thread(target=self._report, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.stream.write('\r' + self.line() + '\n')
+            self.stream.flush()
+
+
+def read_csv_batches(file_path: str, delimiter=',', transform=None, batch_size: int = 10000):
+    """Read CSV file by batches of transformed rows
+
+    Parameters
+    ----------
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    transform : callable, optional
+        Function of CSV row which returns table row, by default None (rows as is)
+    batch_size : int, optional
+        Number of rows in batch, by default 10000
+
+    Yields
+    -------
+    tuple
+        Header of file, batch of rows and number of bytes of file read for batch
+    """
+    with open(file_path, newline='') as csvfile:
+        position = 0
+
+        def lines():
+            nonlocal position
+            for line in csvfile:
+                position += len(line)
+                yield line
+
+        reader = csv.reader(lines(), delimiter=delimiter)
+        header = next(reader)
+        batch = []
+        batch_start = position
+        for row in reader:
+            batch.append(transform(row) if transform else row)
+            if len(batch) >= batch_size:
+                yield header, batch, position - batch_start
+                batch = []
+                batch_start = position
+        if batch:
+            yield header, batch, position - batch_start
+
+
+def _insert_batches(db_connect: dict, batches: queue.Queue, query_string: str, on_batch, failed: threading.Event, progress: ImportProgress, name: str, unique_checks: bool) -> int:
+    """Insert worker of pipeline, takes batches from queue until None"""
+    rows_affected = 0
+    cnx = cursor = None
+    try:
+        # failed connection also stops pipeline and drains queue
+        cnx = connection.MySQLConnection(**db_connect)
+        cursor = cnx.cursor()
+        with disabled_checks(cnx, unique_checks):
+            while True:
+                item = batches.get()
+                if item is None or failed.is_set():
+                    # stop on end of file or failure of other worker
+                    if item is None:
+                        break
+                    continue
+                batch, n_bytes = item
+                for attempt in range(DEADLOCK_RETRIES + 1):
+                    try:
+                        cursor.executemany(query_string, batch)
+                        if on_batch:
+                            on_batch(cursor, batch)
+                        cnx.commit()
+                        break
+                    except Exception as e:
+                        cnx.rollback()
+                        if getattr(e, 'errno', None) != DEADLOCK_ERRNO or attempt == DEADLOCK_RETRIES:
+                            raise
+                        log.warning(f'Deadlock on batch of {name}, retry {attempt + 1}')
+                rows_affected += len(batch)
+                progress.update(name, len(batch), n_bytes)
+    except Exception as e:
+        log.exception(e)
+        log.error(f'Insert worker of {name} stopped after {rows_affected} rows')
+        failed.set()
+        # drain queue, so producer is not blocked
+        while batches.get() is not None:
+            pass
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if cnx is not None:
+            cnx.close()
+
+    return rows_affected
+
+
+def pipeline_insert_csv_to_db(db_connect: dict, file_path: str, dest_table: str, delimiter=',', transform=None, extra_fields: list = None, on_batch=None, workers: int = IMPORT_WORKERS, batch_size: int = 10000, queue_size: int = QUEUE_SIZE, progress: ImportProgress = None, unique_checks: bool = False) -> int:
+    """Insert CSV file to database table with producer/consumer pipeline.
+    Producer thread parses file and transforms rows into batches of bounded
+    queue, insert workers with own connections send batches with
+    executemany and commit them, so parsing overlaps with waiting for
+    server. Order of inserted batches is not kept
+
+    Parameters
+    ----------
+    db_connect : dict
+        Arguments of MySqlConnection, one connection per worker is opened
+    file_path : str
+        File name of csv file with header
+    dest_table : str
+        Destination table name
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    transform : callable, optional
+        Function of CSV row which returns table row, by default None
+    extra_fields : list, optional
+        Column names added by transform after CSV columns, by default None
+    on_batch : callable, optional
+        Function of cursor and batch rows called in transaction of each
+        batch before commit, by default None
+    workers : int, optional
+        Number of insert workers, by default IMPORT_WORKERS
+    batch_size : int, optional
+        Number of rows in one INSERT and transaction, by default 10000
+    queue_size : int, optional
+        Maximum number of parsed batches waiting for insert, by default QUEUE_SIZE
+    progress : ImportProgress, optional
+        Progress of import, by default None
+    unique_checks : bool, optional
+        Flag to keep unique checks enabled, by default False
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    progress = progress or ImportProgress()
+    progress.add_table(dest_table, os.path.getsize(file_path))
+    batches = queue.Queue(maxsize=queue_size)
+    failed = threading.Event()
+    query_string = None
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            log.debug(f"Reading file '{file_path}'")
+            for header, batch, n_bytes in read_csv_batches(file_path, delimiter, transform, batch_size):
+                if query_string is None:
+                    field_names = header + (extra_fields or [])
+                    placeholders = ', '.join(['%s'] * len(field_names))
+                    query_string = f'INSERT INTO {dest_table} ({", ".join(field_names)}) VALUES ({placeholders})'
+                    log.debug(query_string)
+                    futures = [executor.submit(_insert_batches, db_connect, batches, query_string,
+                                               on_batch, failed, progress, dest_table, unique_checks)
+                               for _ in range(workers)]
+                if failed.is_set():
+                    break
+                batches.put((batch, n_bytes))
+        except Exception as e:
+            log.exception(e)
+            failed.set()
+        finally:
+            for _ in futures:
+                batches.put(None)
+
+    rows_affected = sum(f.result() for f in futures)
+    progress.finish(dest_table)
+    if failed.is_set():
+        log.error(f'Import of {dest_table} failed, {rows_affected} rows are inserted')
+    log.info(f'Rows affected: {rows_affected}')
+    return rows_affected
+
+
+@profiling.timed()
+def pipeline_import_ratings_csv_to_db(db_connect: dict, file_path: str, delimiter=',', dest_table='ratings', stats_table: str = STATS_TABLE, **kwargs) -> int:
+    """Import ratings with pipeline of parse and insert workers, see
+    pipeline_insert_csv_to_db. Pre-aggregated stats table is updated in
+    transaction of each batch
+
+    Parameters
+    ----------
+    db_connect : dict
+        Arguments of MySqlConnection
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'ratings'
+    stats_table : str, optional
+        Stats table name, None to skip stats update, by default STATS_TABLE
+    **kwargs
+        workers, batch_size, queue_size and progress of pipeline_insert_csv_to_db
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    on_batch = None
+    if stats_table:
+        # rows of batches keep order of columns of file
+        with open(file_path, newline='') as csvfile:
+            field_names = next(csv.reader(csvfile, delimiter=delimiter))
+        on_batch = partial(upsert_rating_stats, movie_idx=field_names.index('movieId'),
+                           rating_idx=field_names.index('rating'), stats_table=stats_table)
+    # unique key (userId, movieId) of ratings is checked on load
+    return pipeline_insert_csv_to_db(db_connect, file_path, dest_table, delimiter,
+                                     on_batch=on_batch, unique_checks=True, **kwargs)
+
+
+@profiling.timed()
+def pipeline_import_movies_csv_to_db(db_connect: dict, file_path: str, delimiter=',', dest_table='movies', genres_table: str = GENRES_TABLE, **kwargs) -> int:
+    """Import movies with pipeline of parse and insert workers, see
+    pipeline_insert_csv_to_db. Year is split from title by producer and
+    normalized genres table is filled in transaction of each batch
+
+    Parameters
+    ----------
+    db_connect : dict
+        Arguments of MySqlConnection
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'movies'
+    genres_table : str, optional
+        Genres table name, None to skip genres insert, by default GENRES_TABLE
+    **kwargs
+        workers, batch_size, queue_size and progress of pipeline_insert_csv_to_db
+
+    Returns
+    -------
+    int
+        Number of inserted rows
+    """
+    on_batch = partial(insert_movie_genres, genres_table=genres_table) if genres_table else None
+    return pipeline_insert_csv_to_db(db_connect, file_path, dest_table, delimiter,
+                                     transform=get_movie_row, extra_fields=['year'],
+                                     on_batch=on_batch, **kwargs)
+
+
+def pipeline_import_tables(db_connect: dict, data_folder_path: str, workers: int = IMPORT_WORKERS, batch_size: int = 10000, queue_size: int = QUEUE_SIZE, progress: ImportProgress = None) -> dict:
+    """Import ratings and movies concurrently, each table with own pipeline
+
+    Parameters
+    ----------
+    db_connect : dict
+        Arguments of MySqlConnection
+    data_folder_path : str
+        Directory of ratings.csv and movies.csv
+    workers : int, optional
+        Number of insert workers of each table, by default IMPORT_WORKERS
+    batch_size : int, optional
+        Number of rows in one INSERT and transaction, by default 10000
+    queue_size : int, optional
+        Maximum number of parsed batches waiting for insert, by default QUEUE_SIZE
+    progress : ImportProgress, optional
+        Progress of imports, by default None
+
+    Returns
+    -------
+    dict
+        Number of inserted rows per table name
+    """
+    options = {'workers': workers, 'batch_size': batch_size, 'queue_size': queue_size,
+               'progress': progress or ImportProgress()}
+    importers = {
+        'ratings': pipeline_import_ratings_csv_to_db,
+        'movies': pipeline_import_movies_csv_to_db,
+    }
+    with ThreadPoolExecutor(max_workers=len(importers)) as executor:
+        futures = {name: executor.submit(import_func, db_connect, data_folder_path + f'{name}.csv', **options)
+                   for name, import_func in importers.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def get_watermark(cursor, table_name: str, watermarks_table: str = WATERMARKS_TABLE):
+    """Get high-water mark of imported rows of table
+
+    Parameters
+    ----------
+    cursor :
+        Cursor of MySqlConnection to database
+    table_name : str
+        Imported table name
+    watermarks_table : str, optional
+        Watermarks table name, by default WATERMARKS_TABLE
+
+    Returns
+    -------
+    int or None
+        High-water mark, None if table was never loaded
+    """
+    cursor.execute(f'SELECT high_water_mark FROM {watermarks_table} WHERE table_name = %s', (table_name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(cursor, table_name: str, high_water_mark: int, rows_loaded: int, watermarks_table: str = WATERMARKS_TABLE) -> None:
+    """Save high-water mark of imported rows of table and add number of
+    loaded rows. Commit is left to caller
+
+    Parameters
+    ----------
+    cursor :
+        Cursor of MySqlConnection to database
+    table_name : str
+        Imported table name
+    high_water_mark : int
+        New high-water mark
+    rows_loaded : int
+        Number of rows of load
+    watermarks_table : str, optional
+        Watermarks table name, by default WATERMARKS_TABLE
+    """
+    cursor.execute(f'INSERT INTO {watermarks_table} (table_name, high_water_mark, rows_loaded) '
+                   f'VALUES (%s, %s, %s) AS new '
+                   f'ON DUPLICATE KEY UPDATE high_water_mark = new.high_water_mark, '
+                   f'rows_loaded = {watermarks_table}.rows_loaded + new.rows_loaded',
+                   (table_name, high_water_mark, rows_loaded))
+
+
+@profiling.timed()
+def record_ratings_watermark(cnx, ratings_table: str = 'ratings', watermarks_table: str = WATERMARKS_TABLE):
+    """Save latest timestamp of ratings table as its high-water mark after
+    full import, so next incremental import starts from it
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    ratings_table : str, optional
+        Ratings table name, by default 'ratings'
+    watermarks_table : str, optional
+        Watermarks table name, by default WATERMARKS_TABLE
+
+    Returns
+    -------
+    int or None
+        High-water mark
+    """
+    cursor = cnx.cursor()
+    high_water_mark = None
+    try:
+        cursor.execute(f'SELECT MAX(timestamp), COUNT(*) FROM {ratings_table}')
+        high_water_mark, n_rows = cursor.fetchone()
+        set_watermark(cursor, ratings_table, high_water_mark, n_rows, watermarks_table)
+        cnx.commit()
+    except Exception as e:
+        log.exception(e)
+        cnx.rollback()
+
+    log.info(f'High-water mark of {ratings_table}: {high_water_mark}')
+    cursor.close()
+    return high_water_mark
+
+
+def get_rating_deltas(cursor, ratings: list, ratings_table: str = 'ratings') -> dict:
+    """Get changes of count and sum of ratings per movie made by upsert of
+    ratings: new ratings add count and rating, changed ratings add only
+    difference with stored rating
+
+    Parameters
+    ----------
+    cursor :
+        Cursor of MySqlConnection to database
+    ratings : list
+        Rows of userId, movieId, rating and timestamp
+    ratings_table : str, optional
+        Ratings table name, by default 'ratings'
+
+    Returns
+    -------
+    dict
+        Lists of count and sum changes per movieId
+    """
+    keys = [(int(row[0]), int(row[1])) for row in ratings]
+    stored = {}
+    # number of placeholders of one statement is limited
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        part = keys[start:start + LOOKUP_BATCH_SIZE]
+        placeholders = ', '.join(['(%s, %s)'] * len(part))
+        cursor.execute(f'SELECT userId, movieId, rating FROM {ratings_table} '
+                       f'WHERE (userId, movieId) IN ({placeholders})',
+                       [v for key in part for v in key])
+        stored.update(((user_id, movie_id), rating) for user_id, movie_id, rating in cursor.fetchall())
+
+    deltas = {}
+    for key, row in zip(keys, ratings):
+        delta = deltas.setdefault(key[1], [0, 0.0])
+        rating = float(row[2])
+        old_rating = stored.get(key)
+        if old_rating is None:
+            delta[0] += 1
+            delta[1] += rating
+        else:
+            delta[1] += rating - old_rating
+        # the same key later in batch changes rating inserted by this row
+        stored[key] = rating
+    return deltas
+
+
+@profiling.timed()
+def incremental_import_ratings_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='ratings', batch_size: int = 10000, stats_table: str = STATS_TABLE, watermarks_table: str = WATERMARKS_TABLE) -> int:
+    """Upsert ratings with timestamp not less than high-water mark of table
+    by batches and apply their deltas to stats table in transaction of each
+    batch. Ratings are unique by userId and movieId. Rows with timestamp
+    equal to the mark are imported again, which doesn't change stats, so
+    import can be repeated after failure. Mark is moved after all batches
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'ratings'
+    batch_size : int, optional
+        Number of rows in one INSERT and transaction, by default 10000
+    stats_table : str, optional
+        Stats table name, None to skip stats update, by default STATS_TABLE
+    watermarks_table : str, optional
+        Watermarks table name, by default WATERMARKS_TABLE
+
+    Returns
+    -------
+    int
+        Number of upserted rows
+    """
+    cursor = cnx.cursor()
+    rows_affected = 0
+    try:
+        high_water_mark = get_watermark(cursor, dest_table, watermarks_table)
+        if high_water_mark is None:
+            log.warning(f'No high-water mark of {dest_table}, all rows are upserted')
+        log.info(f'High-water mark of {dest_table}: {high_water_mark}')
+        new_mark = high_water_mark
+
+        query_string = (f'INSERT INTO {dest_table} (userId, movieId, rating, timestamp) '
+                        f'VALUES (%s, %s, %s, %s) AS new '
+                        f'ON DUPLICATE KEY UPDATE rating = new.rating, timestamp = new.timestamp')
+        log.debug(query_string)
+        with open(file_path, newline='') as csvfile:
+            log.debug(f"Reading file '{file_path}'")
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            header = next(reader)
+            positions = [header.index(name) for name in ('userId', 'movieId', 'rating', 'timestamp')]
+            ts_idx = positions[3]
+            if high_water_mark is not None:
+                reader = (row for row in reader if int(row[ts_idx]) >= high_water_mark)
+
+            batch = []
+            for row in reader:
+                batch.append([row[i] for i in positions])
+                if len(batch) >= batch_size:
+                    rows_affected += _upsert_ratings_batch(cnx, cursor, query_string, batch,
+                                                           dest_table, stats_table)
+                    new_mark = max(new_mark or 0, max(int(r[3]) for r in batch))
+                    batch = []
+            if batch:
+                rows_affected += _upsert_ratings_batch(cnx, cursor, query_string, batch,
+                                                       dest_table, stats_table)
+                new_mark = max(new_mark or 0, max(int(r[3]) for r in batch))
+
+        if new_mark is not None:
+            set_watermark(cursor, dest_table, new_mark, rows_affected, watermarks_table)
+            cnx.commit()
+        log.info(f'New high-water mark of {dest_table}: {new_mark}')
+    except Exception as e:
+        log.exception(e)
+        log.error(f'Batch after row {rows_affected} is rolled back, high-water mark is not moved')
+        cnx.rollback()
+
+    log.info(f'Rows affected: {rows_affected}')
+    cursor.close()
+    return rows_affected
+
+
+def _upsert_ratings_batch(cnx, cursor, query_string: str, batch: list, dest_table: str, stats_table: str) -> int:
+    """Upsert batch of ratings and apply its deltas to stats in one transaction"""
+    if stats_table:
+        deltas = get_rating_deltas(cursor, batch, dest_table)
+    cursor.executemany(query_string, batch)
+    if stats_table:
+        upsert_rating_stats_deltas(cursor, deltas, stats_table)
+    cnx.commit()
+    return len(batch)
+
+
+@profiling.timed()
+def upsert_movies_csv_to_db(cnx, file_path: str, delimiter=',', dest_table='movies', genres_table: str = GENRES_TABLE, split_regex=r'\s\(\d{4}\)', year_regex=r'\d{4}', null_genre='(no genres listed)') -> int:
+    """Upsert new and changed movies of CSV file by movieId and replace
+    genres of changed movies in genres table in one transaction. Movies
+    missing in file are kept
+
+    Parameters
+    ----------
+    cnx :
+        MySqlConnection to database
+    file_path : str
+        File name of csv file with header
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    dest_table : str, optional
+        Destination table name, by default 'movies'
+    genres_table : str, optional
+        Genres table name, None to skip genres update, by default GENRES_TABLE
+    split_regex : str, optional
+        Regular Expression used to remove substring from title column, by default r'\s\(\d{4}\)'
+    year_regex : str, optional
+        Regular Expression used to extract year from title column, by default r'\d{4}'
+    null_genre : str, optional
+        String that determinate NULL value of genres column, by default (no genres listed)'
+
+    Returns
+    -------
+    int
+        Number of new and changed movies
+    """
+    cursor = cnx.cursor()
+    rows_affected = 0
+    try:
+        cursor.execute(f'SELECT movieId, title, genres, year FROM {dest_table}')
+        stored = {row[0]: tuple(row) for row in cursor.fetchall()}
+
+        with open(file_path, newline='') as csvfile:
+            log.debug(f"Reading file '{file_path}'")
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            next(reader)
+            rows = [get_movie_row(row, split_regex, year_regex, null_genre) for row in reader]
+        changed = [row for row in rows if stored.get(row[0]) != row]
+        log.info(f'{len(changed)} new or changed movies of {len(rows)}')
+
+        if changed:
+            cursor.executemany(f'INSERT INTO {dest_table} (movieId, title, genres, year) '
+                               f'VALUES (%s, %s, %s, %s) AS new '
+                               f'ON DUPLICATE KEY UPDATE title = new.title, genres = new.genres, year = new.year',
+                               changed)
+            if genres_table:
+                changed_genres = [row for row in changed
+                                  if row[0] not in stored or stored[row[0]][2] != row[2]]
+                replaced = [(row[0],) for row in changed_genres if row[0] in stored]
+                if replaced:
+                    cursor.executemany(f'DELETE FROM {genres_table} WHERE movieId = %s', replaced)
+                insert_movie_genres(cursor, changed_genres, genres_table=genres_table)
+        cnx.commit()
+        rows_affected = len(changed)
+    except Exception as e:
+        log.exception(e)
+        cnx.rollback()
+
+    log.info(f'Rows affected: {rows_affected}')
+    cursor.close()
+    return rows_affected
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-m", "--mode", type=str, choices=IMPORT_MODES, default='pipeline',
+                    help="rows - one INSERT per row, bulk - batched multi-row INSERT, "
+                         "infile - LOAD DATA LOCAL INFILE, pipeline - batched INSERT by "
+                         "several connections while file is parsed, tables are loaded concurrently (default: pipeline)")
+    ap.add_argument("-b", "--batch_size", type=int, default=10000,
+                    help="number of rows in one INSERT and transaction of bulk and pipeline modes (default: 10000)")
+    ap.add_argument("-w", "--workers", type=int, default=IMPORT_WORKERS,
+                    help=f"number of insert connections per table of pipeline mode (default: {IMPORT_WORKERS})")
+    ap.add_argument("--queue_size", type=int, default=QUEUE_SIZE,
+                    help=f"number of parsed batches waiting for insert in pipeline mode (default: {QUEUE_SIZE})")
+    ap.add_argument("--progress", action='store_true',
+                    help="print progress and rows per second of every table to stderr")
+    ap.add_argument("--rebuild_stats", action='store_true',
+                    help=f"only recompute `{STATS_TABLE}` table from all ratings")
+    ap.add_argument("-i", "--incremental", action='store_true',
+                    help="upsert only ratings newer than high-water mark of last load and "
+                         "new or changed movies, apply changes to derived tables")
+    profiling.add_arguments(ap)
+
+    return vars(ap.parse_args())
 
 
 def main():
@@ -149,19 +1345,95 @@ def main():
     # save start time for calculating
     time_start = time.perf_counter()
 
+    args = get_arguments()
+    log.debug(f'arguments: {args}')
+    profiling.setup_from_arguments(args)
+
+    importers = {
+        'rows': (import_ratings_csv_to_db, import_movies_csv_to_db),
+        'bulk': (partial(bulk_import_ratings_csv_to_db, batch_size=args['batch_size']),
+                 partial(bulk_import_movies_csv_to_db, batch_size=args['batch_size'])),
+        'infile': (load_ratings_infile, load_movies_infile),
+        'pipeline': (None, None),
+    }
+    import_ratings, import_movies = importers[args['mode']]
+
+    db_connect = CONFIG['db_connect']
+    if args['mode'] == 'infile':
+        db_connect = {**db_connect, 'allow_local_infile': True}
+
     try:
         # DB connect
         log.info('Opening connection to DB')
-        cnx = connection.MySQLConnection(**CONFIG['db_connect'])
+        with profiling.stage('connect'):
+            cnx = connection.MySQLConnection(**db_connect)
         log.info('Done!')
 
-        log.info('importing ratings to DB')
-        import_ratings_csv_to_db(cnx, CONFIG['data_folder_path'] + 'ratings.csv')
-        log.info('Done!')
+        if args['rebuild_stats']:
+            log.info(f'rebuilding {STATS_TABLE}')
+            rebuild_rating_stats(cnx)
+            bump_db_version()
+            log.info('Done!')
+            import_ratings = import_movies = None
+        elif args['incremental']:
+            log.info('importing new ratings and changed movies to DB')
+            rows = {
+                'ratings': incremental_import_ratings_csv_to_db(
+                    cnx, CONFIG['data_folder_path'] + 'ratings.csv', batch_size=args['batch_size']),
+                'movies': upsert_movies_csv_to_db(cnx, CONFIG['data_folder_path'] + 'movies.csv'),
+            }
+            if any(rows.values()):
+                # cached results of movies-client.py are stale now
+                bump_db_version()
+            log.info('Done!')
+            import_ratings = import_movies = None
+        elif args['mode'] == 'pipeline':
+            log.info('importing ratings and movies to DB concurrently')
+            progress = ImportProgress(sys.stderr if args['progress'] else None)
+            with progress:
+                rows = pipeline_import_tables(db_connect, CONFIG['data_folder_path'], args['workers'],
+                                              args['batch_size'], args['queue_size'], progress)
+            for table_name, rows_affected in rows.items():
+                table = progress.tables[table_name]
+                table_elapsed = table['end'] - table['start']
+                log.info(f'{table_name}: {rows_affected} rows in {table_elapsed:.4f} secs, '
+                         f'{rows_affected / max(table_elapsed, 1e-9):.0f} rows/sec')
+            if any(rows.values()):
+                # cached results of movies-client.py are stale now
+                bump_db_version()
+            if rows['ratings']:
+                record_ratings_watermark(cnx)
+            log.info('Done!')
+            import_ratings = import_movies = None
 
-        log.info('importing movies to DB')
-        import_movies_csv_to_db(cnx, CONFIG['data_folder_path'] + 'movies.csv')
-        log.info('Done!')
+        for table_name, import_func in (('ratings', import_ratings), ('movies', import_movies)):
+            if import_func is None:
+                continue
+            log.info(f'importing {table_name} to DB')
+            table_start = time.perf_counter()
+            rows_affected = import_func(cnx, CONFIG['data_folder_path'] + f'{table_name}.csv')
+            table_elapsed = time.perf_counter() - table_start
+            log.info(f'{rows_affected} rows in {table_elapsed:.4f} secs, '
+                     f'{rows_affected / max(table_elapsed, 1e-9):.0f} rows/sec')
+            if rows_affected:
+                # cached results of movies-client.py are stale now
+                bump_db_version()
+            log.info('Done!')
+
+            if table_name == 'ratings' and args['mode'] != 'bulk' and rows_affected:
+                # rows already in table are skipped by LOAD DATA, so stats
+                # are recomputed from table instead of adding up the file
+                log.info(f'rebuilding {STATS_TABLE}')
+                rebuild_rating_stats(cnx)
+                log.info('Done!')
+
+            if table_name == 'ratings' and rows_affected:
+                record_ratings_watermark(cnx)
+
+            if table_name == 'movies' and args['mode'] == 'infile' and rows_affected:
+                log.info(f'rebuilding {GENRES_TABLE}')
+                rebuild_movie_genres(cnx)
+                log.info('Done!')
 
     except Exception as e:
         log.exception(e)
@@ -171,6 +1443,8 @@ def main():
 
     time_elapsed = time.perf_counter() - time_start
     log.info(f'Finish in {time_elapsed:.4f} secs')
+    if args['profile']:
+        profiling.write_report(args['profile'])
 
 
 if __name__ == "__main__":
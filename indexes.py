@@ -0,0 +1,517 @@
+"""Indexes over columnar data
+
+This module contains index structures which are built once while loading
+data and reused by queries instead of scanning every row.
+
+This file can also be imported as a module and contains the following:
+
+    * InvertedIndex - Inverted index from category to sorted row ids of
+      multi-valued column, e.g. genres of movies
+    * get_required_literals - Get query of literals which every match of RegEx contains
+    * TrigramIndex - Trigram index from text to sorted row ids, used to
+      narrow RegEx search, e.g. by titles of movies
+    * SortedIndex - Secondary index of row ids sorted by column values, used
+      for range filters and sorting, e.g. by year or rating of movies
+"""
+
+
+# import the necessary packages
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from table import Column
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # python < 3.11
+    import sre_parse
+    import sre_constants
+
+
+TRIGRAM_SIZE = 3
+MAX_POSTINGS_RATIO = 16
+
+
+class InvertedIndex:
+    """Inverted index from category to sorted row ids of column which
+    contains multiple categories splitted by delimiter, e.g. `Comedy|Drama`.
+    Categories are matched exactly, so `Action` never matches `Action-Adventure`.
+
+    Parameters
+    ----------
+    delimiter : str, optional
+        Delimiter of categories in column values, by default '|'
+    """
+
+    def __init__(self, delimiter: str = '|'):
+        self.delimiter = delimiter
+        self._postings = {}
+
+    @classmethod
+    def from_values(cls, values, ids=None, delimiter: str = '|') -> 'InvertedIndex':
+        """Build index from column values
+
+        Parameters
+        ----------
+        values : iterable
+            Column values, None values are skipped
+        ids : iterable, optional
+            Increasing row ids of values, by default positions of values
+        delimiter : str, optional
+            Delimiter of categories in column values, by default '|'
+
+        Returns
+        -------
+        InvertedIndex
+            New index
+        """
+        index = cls(delimiter)
+        splitted = {}
+        postings = index._postings
+        for row_id, value in zip(ids if ids is not None else range(2**63), values):
+            if value is None:
+                continue
+            categories = splitted.get(value)
+            if categories is None:
+                categories = splitted[value] = value.split(delimiter)
+            for category in categories:
+                rows = postings.get(category)
+                if rows is None:
+                    rows = postings[category] = array('q')
+                rows.append(row_id)
+        return index
+
+    @classmethod
+    def from_column(cls, column: Column, delimiter: str = '|') -> 'InvertedIndex':
+        """Build index from Table column, row ids are positions in column.
+        Values of `category` column are splitted once per category
+
+        Parameters
+        ----------
+        column : Column
+            Column of Table
+        delimiter : str, optional
+            Delimiter of categories in column values, by default '|'
+
+        Returns
+        -------
+        InvertedIndex
+            New index
+        """
+        if column.categories is None:
+            return cls.from_values(column, delimiter=delimiter)
+
+        index = cls(delimiter)
+        postings = index._postings
+        code_postings = [[postings.setdefault(c, array('q')) for c in value.split(delimiter)]
+                         for value in column.categories]
+        nulls = column.nulls
+        for row_id, code in enumerate(column.data):
+            if nulls and nulls[row_id]:
+                continue
+            for rows in code_postings[code]:
+                rows.append(row_id)
+        return index
+
+    @property
+    def categories(self) -> list:
+        """Sorted list of unique categories"""
+        return sorted(self._postings)
+
+    def rows(self, category: str) -> array:
+        """Get sorted row ids of category, empty if category is unknown"""
+        return self._postings.get(category, array('q'))
+
+    def union(self, categories: list) -> list:
+        """Get sorted row ids which contain any of categories"""
+        result = []
+        for row_id in merge(*(self.rows(c) for c in categories)):
+            if not result or result[-1] != row_id:
+                result.append(row_id)
+        return result
+
+    def intersection(self, categories: list) -> list:
+        """Get sorted row ids which contain all of categories"""
+        postings = sorted((self.rows(c) for c in categories), key=len)
+        if not postings:
+            return []
+        result = set(postings[0])
+        for rows in postings[1:]:
+            result.intersection_update(rows)
+        return sorted(result)
+
+    def pairs(self):
+        """Iterate over (row id, category) pairs ordered by category and row id,
+        e.g. rows of normalized `movie_genres` table when ids are movieIds"""
+        for category in self.categories:
+            for row_id in self._postings[category]:
+                yield row_id, category
+
+    def __contains__(self, category: str) -> bool:
+        return category in self._postings
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __repr__(self) -> str:
+        return f'InvertedIndex(categories={len(self)})'
+
+
+def _required_literals(parsed) -> tuple:
+    """Get `('and', items)` query of parsed RegEx sequence, where item is
+    literal string or `('or', queries)` query of alternatives"""
+    items = []
+    run = []
+
+    def flush():
+        if run:
+            items.append(''.join(run))
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+        elif op is sre_constants.AT:
+            # anchors match empty string, so literals around them are contiguous
+            continue
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            add_flags = av[1]
+            if not add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+                items.append(_required_literals(av[-1]))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+                    getattr(sre_constants, 'POSSESSIVE_REPEAT', None)):
+            flush()
+            if av[0] >= 1:
+                items.append(_required_literals(av[2]))
+        elif op is sre_constants.BRANCH:
+            flush()
+            items.append(('or', [_required_literals(branch) for branch in av[1]]))
+        else:
+            flush()
+    flush()
+    return ('and', items)
+
+
+def get_required_literals(pattern: str):
+    """Get query of literals which every match of RegEx contains. Query is
+    `('and', items)` tuple, item is literal string or `('or', queries)`
+    tuple of alternatives. Only case sensitive patterns are analyzed
+
+    Parameters
+    ----------
+    pattern : str
+        Regular expression
+
+    Returns
+    -------
+    tuple or None
+        Query of literals, None if pattern is case insensitive or invalid
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, OverflowError, RecursionError):
+        return None
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return None
+    return _required_literals(parsed)
+
+
+class TrigramIndex:
+    """Trigram index from text to sorted row ids of column. Index narrows
+    RegEx search to rows which contain all trigrams of literals required
+    by pattern, then compiled pattern is evaluated only on this candidate
+    rows, so results are the same as of full scan. Trigrams are case
+    sensitive, case insensitive patterns are evaluated on every row
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._n_rows = 0
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        """Get set of trigrams of text"""
+        return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+    @classmethod
+    def from_values(cls, values, ids=None) -> 'TrigramIndex':
+        """Build index from column values
+
+        Parameters
+        ----------
+        values : iterable
+            Column values, None values are skipped
+        ids : iterable, optional
+            Increasing row ids of values, by default positions of values
+
+        Returns
+        -------
+        TrigramIndex
+            New index
+        """
+        index = cls()
+        postings = index._postings
+        for row_id, value in zip(ids if ids is not None else range(2**63), values):
+            index._n_rows = row_id + 1
+            if value is None:
+                continue
+            for trigram in cls.trigrams(value):
+                rows = postings.get(trigram)
+                if rows is None:
+                    rows = postings[trigram] = array('q')
+                rows.append(row_id)
+        return index
+
+    @classmethod
+    def from_column(cls, column: Column) -> 'TrigramIndex':
+        """Build index from Table column, row ids are positions in column.
+        Values of `category` column are splitted to trigrams once per category
+
+        Parameters
+        ----------
+        column : Column
+            Column of Table
+
+        Returns
+        -------
+        TrigramIndex
+            New index
+        """
+        if column.categories is None:
+            return cls.from_values(column)
+
+        index = cls()
+        index._n_rows = len(column)
+        postings = index._postings
+        code_postings = [[postings.setdefault(t, array('q')) for t in cls.trigrams(value)]
+                         for value in column.categories]
+        nulls = column.nulls
+        for row_id, code in enumerate(column.data):
+            if nulls and nulls[row_id]:
+                continue
+            for rows in code_postings[code]:
+                rows.append(row_id)
+        return index
+
+    def _literal_rows(self, literal: str):
+        """Get set of row ids which contain all trigrams of literal,
+        None for literals shorter than trigram"""
+        trigrams = self.trigrams(literal)
+        if not trigrams:
+            return None
+        postings = sorted((self._postings.get(t, ()) for t in trigrams), key=len)
+        result = set(postings[0])
+        for rows in postings[1:]:
+            # few candidates are cheaper to check by pattern than long posting list
+            if not result or len(rows) > MAX_POSTINGS_RATIO * len(result):
+                break
+            result.intersection_update(rows)
+        return result
+
+    def _query_rows(self, query):
+        """Get set of candidate row ids of literals query, None if query
+        doesn't narrow search"""
+        if isinstance(query, str):
+            return self._literal_rows(query)
+
+        op, items = query
+        if op == 'or':
+            result = set()
+            for item in items:
+                rows = self._query_rows(item)
+                if rows is None:
+                    return None
+                result |= rows
+            return result
+
+        result = None
+        for item in sorted(items, key=lambda x: -len(x) if isinstance(x, str) else 0):
+            rows = self._query_rows(item)
+            if rows is None:
+                continue
+            if result is None:
+                result = rows
+            else:
+                result &= rows
+            if not result:
+                break
+        return result
+
+    def candidates(self, pattern: str):
+        """Get sorted row ids which can match RegEx
+
+        Parameters
+        ----------
+        pattern : str
+            Regular expression
+
+        Returns
+        -------
+        list or None
+            Sorted row ids, None if pattern has no required literals of
+            trigram length and every row is candidate
+        """
+        query = get_required_literals(pattern)
+        if query is None:
+            return None
+        rows = self._query_rows(query)
+        return sorted(rows) if rows is not None else None
+
+    def search(self, pattern, values, rows: list = None) -> list:
+        """Get sorted row ids of values which match RegEx, like
+        `[i for i, v in enumerate(values) if v is not None and re.search(pattern, v)]`
+
+        Parameters
+        ----------
+        pattern : str or re.Pattern
+            Regular expression
+        values : Column or list
+            Values which index is built from
+        rows : list, optional
+            Sorted row ids to search in, e.g. result of other index,
+            by default all rows
+
+        Returns
+        -------
+        list
+            Sorted row ids
+        """
+        compiled = re.compile(pattern)
+        search = compiled.search
+        candidates = self.candidates(compiled.pattern) if not compiled.flags & re.IGNORECASE else None
+        if candidates is None:
+            if rows is None and isinstance(values, Column):
+                return values.where(search)
+            candidates = rows if rows is not None else range(len(values))
+        elif rows is not None:
+            candidates = set(candidates)
+            candidates = [i for i in rows if i in candidates]
+        return [i for i in candidates if (value := values[i]) is not None and search(value)]
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __repr__(self) -> str:
+        return f'TrigramIndex(rows={self._n_rows}, trigrams={len(self)})'
+
+
+class SortedIndex:
+    """Secondary index of row ids sorted by typed values of column. Range
+    of values is found with binary search in O(log n + k) and order of
+    rows is reused by sorting instead of sorting data again. Rows with
+    equal values keep their order like in stable sort
+
+    Parameters
+    ----------
+    keys : list
+        Sorted non-null values
+    rows : array
+        Row ids of keys
+    nulls : array
+        Row ids of null values
+    """
+
+    def __init__(self, keys: list, rows: array, nulls: array):
+        self._keys = keys
+        self._rows = rows
+        self._nulls = nulls
+
+    @classmethod
+    def from_values(cls, values) -> 'SortedIndex':
+        """Build index from typed column values
+
+        Parameters
+        ----------
+        values : iterable
+            Column values of comparable type, None values are nulls
+
+        Returns
+        -------
+        SortedIndex
+            New index
+        """
+        values = list(values)
+        nulls = array('q', (i for i, v in enumerate(values) if v is None))
+        not_null = [i for i, v in enumerate(values) if v is not None] if nulls else range(len(values))
+        rows = array('q', sorted(not_null, key=values.__getitem__))
+        return cls([values[i] for i in rows], rows, nulls)
+
+    @classmethod
+    def from_column(cls, column: Column) -> 'SortedIndex':
+        """Build index from Table column, row ids are positions in column
+
+        Parameters
+        ----------
+        column : Column
+            Column of Table
+
+        Returns
+        -------
+        SortedIndex
+            New index
+        """
+        return cls.from_values(column)
+
+    def range(self, start=None, end=None, rows: list = None) -> list:
+        """Get sorted row ids of values in range `start <= value <= end`
+
+        Parameters
+        ----------
+        start : optional
+            Lower boundary of range, by default None (no boundary)
+        end : optional
+            Higher boundary of range, by default None (no boundary)
+        rows : list, optional
+            Sorted row ids to search in, e.g. result of other index,
+            by default all rows
+
+        Returns
+        -------
+        list
+            Sorted row ids, nulls are never in range
+        """
+        lo = bisect_left(self._keys, start) if start is not None else 0
+        hi = bisect_right(self._keys, end) if end is not None else len(self._keys)
+        if lo >= hi:
+            return []
+        if rows is not None:
+            matched = set(self._rows[lo:hi])
+            return [i for i in rows if i in matched]
+        return sorted(self._rows[lo:hi])
+
+    def order(self, reverse: bool = False) -> list:
+        """Get row ids in order of values like stable sort of column. Nulls
+        go first in ascending and last in descending order
+
+        Parameters
+        ----------
+        reverse : bool, optional
+            Flag of descending order, by default False
+
+        Returns
+        -------
+        list
+            Row ids
+        """
+        if not reverse:
+            return self._nulls.tolist() + self._rows.tolist()
+
+        # groups of equal values are reversed, rows of group keep their order
+        keys = self._keys
+        result = []
+        hi = len(keys)
+        while hi > 0:
+            lo = bisect_left(keys, keys[hi - 1], 0, hi)
+            result.extend(self._rows[lo:hi])
+            hi = lo
+        result.extend(self._nulls)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._nulls)
+
+    def __repr__(self) -> str:
+        return f'SortedIndex(rows={len(self)}, nulls={len(self._nulls)})'
@@ -5,20 +5,49 @@ This script allows user to get information about films.
 This file can also be imported as a module and contains the following
 functions:
 
+    * fetch_movies_data - Generator function to fetch data rows from stored procedure by batches
+    * open_output - Open buffered text stream for csv output
     * display_movies - Print data in csv format
+    * read_query_specs - Read query specs from JSON lines or CSV file
+    * get_latency_percentiles - Get percentiles of latencies in milliseconds
+    * run_query_batch - Run queries concurrently with pool of connections
     * get_arguments - Construct the argument parser and get the arguments
     * main - the main function of the script
 """
 
 # import the necessary packages
+import io
+import os
+import csv
+import sys
 import time
+import json
 import argparse
+import threading
 import logging as log
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from config import *
-from mysql.connector import (connection)
+from mysql.connector import (connection, pooling)
+from result_cache import ResultCache, get_cache_key, get_db_version
+import profiling
 
-def fetch_movies_data(cnx, n=None, regexp=None, year_from=None, year_to=None, genres=None):
-    """ Generator function to fetch data rows from stored procedure with arguments
+
+# log level below DEBUG for logging of every fetched row
+TRACE = 5
+log.addLevelName(TRACE, 'TRACE')
+
+FETCH_BATCH_SIZE = 1000
+OUTPUT_BUFFER_SIZE = 1 << 16
+COLUMN_NAMES = ['movieId', 'title', 'genres', 'year', 'rating']
+QUERY_SPEC_TYPES = {'id': str, 'topN': int, 'regexp': str, 'year_from': int, 'year_to': int, 'genres': str}
+POOL_SIZE = 5
+
+
+def fetch_movies_data(cnx, n=None, regexp=None, year_from=None, year_to=None, genres=None, batch_size=FETCH_BATCH_SIZE):
+    """ Generator function to fetch data rows from stored procedure with arguments.
+    Rows are streamed from unbuffered cursor by batches, so memory doesn`t
+    depend on size of result set
 
     Parameters
     ----------
@@ -34,6 +63,8 @@ def fetch_movies_data(cnx, n=None, regexp=None, year_from=None, year_to=None, ge
         The lower boundary of year filter, by default None
     genres : str, optional
         User-defined genre filter. can be multiple, by default None
+    batch_size : int, optional
+        Number of rows fetched from server at once, by default FETCH_BATCH_SIZE
 
     Yields
     -------
@@ -41,42 +72,58 @@ def fetch_movies_data(cnx, n=None, regexp=None, year_from=None, year_to=None, ge
         row of MySqlConnector data from stored procedure
     """
     log.info('fetching movies')
-    cursor = cnx.cursor()
+    cursor = cnx.cursor(buffered=False)
+    trace = log.getLogger().isEnabledFor(TRACE)
 
-    # NULL if None
-    if not n:
-        n = 'NULL'
-    if not regexp:
-        regexp = 'NULL'
-    else:
-        regexp = f"'{regexp}'"
-    if not year_from:
-        year_from = 'NULL'
-    if not year_to:
-        year_to = 'NULL'
-    if not genres:
-        genres = 'NULL'
-    else:
-        genres = f"'{genres}'"
+    # values are sent as query parameters, None is sent as NULL
+    params = (n or None, regexp or None, year_from or None, year_to or None, genres or None)
 
     try:
-        query_string = f"CALL spr_find_top_rated_movies({n}, {regexp}, {year_from}, {year_to}, {genres});"
-        for result in cursor.execute(query_string, multi=True):
+        query_string = 'CALL spr_find_top_rated_movies(%s, %s, %s, %s, %s);'
+        for result in cursor.execute(query_string, params, multi=True):
             if result.with_rows:
                 log.debug(f'Rows produced by statement "{result.statement}":')
 
-                for row in result.fetchall():
-                    log.debug(row)
-                    yield row
-    except Exception as e:
-        log.exception(e)
-        log.debug(query_string)
+                rows = result.fetchmany(batch_size)
+                while rows:
+                    if trace:
+                        for row in rows:
+                            log.log(TRACE, row)
+                    yield from rows
+                    rows = result.fetchmany(batch_size)
+    except Exception:
+        log.debug(f'{query_string} {params}')
+        raise
+    finally:
+        cursor.close()
 
-    cursor.close()
+
+def open_output(file_path=None, buffer_size=OUTPUT_BUFFER_SIZE):
+    """Open buffered text stream for csv output, which is written to
+    file or stdout in blocks of buffer size
+
+    Parameters
+    ----------
+    file_path : str, optional
+        Output file name, by default None (stdout)
+    buffer_size : int, optional
+        Size of output buffer in bytes, by default OUTPUT_BUFFER_SIZE
+
+    Returns
+    -------
+    io.TextIOWrapper
+        Opened stream, stdout is not closed with it
+    """
+    if file_path:
+        return open(file_path, 'w', newline='', buffering=buffer_size)
+    sys.stdout.flush()
+    return io.open(sys.stdout.fileno(), 'w', newline='', buffering=buffer_size,
+                   encoding=sys.stdout.encoding, closefd=False)
 
 
-def display_movies(cnx, n=None, regexp=None, year_from=None, year_to=None, genres=None, delimiter=',') -> None:
-    """ Display movies from called stored procedure in csv format
+def display_movies(cnx, n=None, regexp=None, year_from=None, year_to=None, genres=None, delimiter=',', output=None, batch_size=FETCH_BATCH_SIZE, result_cache=None, cache_key=None) -> None:
+    """ Display movies from called stored procedure in csv format.
+    Complete output is saved to result cache if it is given
 
     Parameters
     ----------
@@ -94,24 +141,195 @@ def display_movies(cnx, n=None, regexp=None, year_from=None, year_to=None, genre
         User-defined genre filter. can be multiple, by default None
     delimiter : str, optional
         Separator of csv format, by default ','
+    output : str, optional
+        Output file name, by default None (stdout)
+    batch_size : int, optional
+        Number of rows fetched from server at once, by default FETCH_BATCH_SIZE
+    result_cache : ResultCache, optional
+        Cache of results, by default None
+    cache_key : str, optional
+        Key of result in cache, by default None
     """
     try:
-        column_names = ['movieId', 'title', 'genres', 'year', 'rating']
-        header = ', '.join(column_names)
-        print(header)
-        
-        for row in fetch_movies_data(cnx, n, regexp, year_from, year_to, genres):
-            csv_row = ''
-            for attr in row:
-                if delimiter in str(attr):
-                    attr = f'"{attr}"'
-                csv_row += delimiter + str(attr)
-            csv_row = csv_row[1:]
-            print(csv_row)
+        with open_output(output) as stream:
+            if result_cache is not None:
+                stream = result_cache.recording(cache_key, stream)
+            else:
+                stream = nullcontext(stream)
+            with stream as out:
+                writer = csv.writer(out, delimiter=delimiter, lineterminator='\n')
+                writer.writerow(COLUMN_NAMES)
+                writer.writerows(fetch_movies_data(cnx, n, regexp, year_from, year_to, genres, batch_size))
     except Exception as e:
         log.exception(e)
 
 
+@profiling.timed()
+def read_query_specs(file_path: str) -> list:
+    """Read query specs, one per line. Lines of `.csv` file are parsed with
+    header, other files are read as JSON lines. Spec has keys `topN`,
+    `regexp`, `year_from`, `year_to`, `genres` and optional `id`, which is
+    number of line by default
+
+    Parameters
+    ----------
+    file_path : str
+        File name of specs, `-` for stdin
+
+    Returns
+    -------
+    list
+        Query specs stored in dicts
+    """
+    f = sys.stdin if file_path == '-' else open(file_path, newline='')
+    try:
+        if file_path.endswith('.csv'):
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    specs = []
+    for i, record in enumerate(records, 1):
+        unknown = set(record) - set(QUERY_SPEC_TYPES)
+        if unknown:
+            raise ValueError(f'Unknown keys {sorted(unknown)} of query spec {i}, expected {tuple(QUERY_SPEC_TYPES)}')
+        spec = dict.fromkeys(QUERY_SPEC_TYPES)
+        for key, value in record.items():
+            if value not in (None, ''):
+                spec[key] = QUERY_SPEC_TYPES[key](value)
+        spec['id'] = spec['id'] or str(i)
+        specs.append(spec)
+    return specs
+
+
+def get_latency_percentiles(latencies: list, percentiles=(50, 90, 99)) -> dict:
+    """Get percentiles of latencies in milliseconds by nearest rank
+
+    Parameters
+    ----------
+    latencies : list
+        Latencies in seconds
+    percentiles : tuple, optional
+        Percentiles to compute, by default (50, 90, 99)
+
+    Returns
+    -------
+    dict
+        Dictionary of `p<percentile>_ms` keys, None values if list is empty
+    """
+    latencies = sorted(latencies)
+    result = {}
+    for p in percentiles:
+        value = None
+        if latencies:
+            value = round(latencies[min(len(latencies) * p // 100, len(latencies) - 1)] * 1000, 3)
+        result[f'p{p}_ms'] = value
+    return result
+
+
+@profiling.timed()
+def run_query_batch(pool, specs: list, workers: int = POOL_SIZE, output_dir: str = None, output=None, delimiter=',', batch_size=FETCH_BATCH_SIZE) -> dict:
+    """Run queries concurrently in thread pool, each query uses connection
+    from connection pool. Results are streamed to file `<id>.csv` per query
+    in output directory or to one output stream, where every row is tagged
+    with id of query in first column
+
+    Parameters
+    ----------
+    pool :
+        MySQLConnectionPool of database
+    specs : list
+        Query specs from read_query_specs
+    workers : int, optional
+        Number of concurrent queries, by default POOL_SIZE
+    output_dir : str, optional
+        Directory of per-query outputs, by default None (tagged output)
+    output : str, optional
+        File name of tagged output, by default None (stdout)
+    delimiter : str, optional
+        Separator of csv format, by default ','
+    batch_size : int, optional
+        Number of rows fetched from server at once, by default FETCH_BATCH_SIZE
+
+    Returns
+    -------
+    dict
+        Number of queries, errors and rows, throughput in queries per second
+        and latency percentiles
+    """
+    stats_lock = threading.Lock()
+    latencies = []
+    counters = {'queries': 0, 'errors': 0, 'rows': 0}
+    tagged = None
+    tagged_lock = threading.Lock()
+
+    def run(spec):
+        time_start = time.perf_counter()
+        rows = 0
+        failed = False
+        try:
+            cnx = pool.get_connection()
+            try:
+                movies = fetch_movies_data(cnx, spec['topN'], spec['regexp'], spec['year_from'],
+                                           spec['year_to'], spec['genres'], batch_size)
+                if tagged is None:
+                    with open_output(os.path.join(output_dir, f"{spec['id']}.csv")) as stream:
+                        writer = csv.writer(stream, delimiter=delimiter, lineterminator='\n')
+                        writer.writerow(COLUMN_NAMES)
+                        for row in movies:
+                            writer.writerow(row)
+                            rows += 1
+                else:
+                    # rows are formatted outside of lock and written by blocks
+                    block = io.StringIO()
+                    writer = csv.writer(block, delimiter=delimiter, lineterminator='\n')
+                    for row in movies:
+                        writer.writerow((spec['id'], *row))
+                        rows += 1
+                        if rows % batch_size == 0:
+                            with tagged_lock:
+                                tagged.write(block.getvalue())
+                            block.seek(0)
+                            block.truncate()
+                    with tagged_lock:
+                        tagged.write(block.getvalue())
+            finally:
+                cnx.close()
+        except Exception as e:
+            log.exception(e)
+            log.error(f'query {spec} failed')
+            failed = True
+        elapsed = time.perf_counter() - time_start
+        log.debug(f"query {spec['id']}: {rows} rows in {elapsed:.4f} secs")
+        with stats_lock:
+            latencies.append(elapsed)
+            counters['queries'] += 1
+            counters['errors'] += failed
+            counters['rows'] += rows
+
+    time_start = time.perf_counter()
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(run, specs))
+    else:
+        with open_output(output) as tagged:
+            csv.writer(tagged, delimiter=delimiter, lineterminator='\n').writerow(['query'] + COLUMN_NAMES)
+            with ThreadPoolExecutor(workers) as executor:
+                list(executor.map(run, specs))
+    time_elapsed = time.perf_counter() - time_start
+
+    return {
+        **counters,
+        'secs': round(time_elapsed, 4),
+        'qps': round(counters['queries'] / max(time_elapsed, 1e-9), 2),
+        **get_latency_percentiles(latencies),
+    }
+
+
 def get_arguments() -> dict:
     """Construct the argument parser and get the arguments
 
@@ -131,6 +349,19 @@ def get_arguments() -> dict:
                     help="the lower boundary of year filter (example: 2010)")
     ap.add_argument("-r", "--regexp", type=str,
                     help="filter on name of the film (example: love)")
+    ap.add_argument("-o", "--output", type=str,
+                    help="write csv to file instead of stdout (example: output.csv)")
+    ap.add_argument("--batch_size", type=int, default=FETCH_BATCH_SIZE,
+                    help=f"number of rows fetched from server at once (default: {FETCH_BATCH_SIZE})")
+    ap.add_argument("--no_result_cache", action='store_true',
+                    help="call procedure without reading and writing cache of results")
+    ap.add_argument("-q", "--queries", type=str,
+                    help="run queries from JSON lines or .csv file concurrently, - for stdin (example: queries.jsonl)")
+    ap.add_argument("-w", "--workers", type=int,
+                    help=f"number of concurrent queries of batch mode (default: pool_size of config or {POOL_SIZE})")
+    ap.add_argument("--output_dir", type=str,
+                    help="write result of every query of batch mode to <output_dir>/<id>.csv instead of one tagged output")
+    profiling.add_arguments(ap)
 
     return vars(ap.parse_args())
 
@@ -150,16 +381,69 @@ def main():
     args = get_arguments()
     log.debug(f'arguments: {args}')
     log.info('Done!')
+    profiling.setup_from_arguments(args)
+
+    # run batch of queries with pool of connections
+    if args['queries']:
+        pool_size = CONFIG.get('pool_size', POOL_SIZE)
+        workers = args['workers'] or pool_size
+        if workers > pool_size:
+            log.warning(f'workers are limited to pool_size {pool_size}')
+            workers = pool_size
+        try:
+            specs = read_query_specs(args['queries'])
+            log.info(f'Opening pool of {pool_size} connections to DB')
+            with profiling.stage('open_pool'):
+                pool = pooling.MySQLConnectionPool(pool_name='movies_client', pool_size=pool_size,
+                                                   **CONFIG['db_connect'])
+            log.info('Done!')
+
+            log.info(f'running {len(specs)} queries with {workers} workers')
+            stats = run_query_batch(pool, specs, workers, args['output_dir'], args['output'],
+                                    batch_size=args['batch_size'])
+            log.info(f'Done! {stats}')
+            print(json.dumps(stats), file=sys.stderr)
+        except Exception as e:
+            log.exception(e)
+
+        time_elapsed = time.perf_counter() - time_start
+        log.info(f'Finish in {time_elapsed:.4f} secs')
+        if args['profile']:
+            profiling.write_report(args['profile'])
+        return
+
+    # print cached result of the same query on the same database data
+    result_cache = cache_key = None
+    if not args['no_result_cache']:
+        db_connect = CONFIG['db_connect']
+        with profiling.stage('result_cache_lookup'):
+            result_cache = ResultCache()
+            cache_key = get_cache_key(f"client:{db_connect.get('host')}:{db_connect.get('port')}/{db_connect.get('database')}",
+                                      args, get_db_version())
+            result = result_cache.get(cache_key)
+        if result is not None:
+            with open_output(args['output']) as stream:
+                stream.write(result)
+            log.info('result printed from result cache')
+            time_elapsed = time.perf_counter() - time_start
+            log.info(f'Finish in {time_elapsed:.4f} secs')
+            if args['profile']:
+                profiling.write_report(args['profile'])
+            return
 
     try:
         # DB connect
         log.info('Opening connection to DB')
-        cnx = connection.MySQLConnection(**CONFIG['db_connect'])
+        with profiling.stage('connect'):
+            cnx = connection.MySQLConnection(**CONFIG['db_connect'])
         log.info('Done!')
 
         log.info('fetching and printing movies')
-        display_movies(cnx, args['topN'], args['regexp'],
-                     args['year_from'], args['year_to'], args['genres'])
+        with profiling.stage('fetch_and_print'):
+            display_movies(cnx, args['topN'], args['regexp'],
+                           args['year_from'], args['year_to'], args['genres'],
+                           output=args['output'], batch_size=args['batch_size'],
+                           result_cache=result_cache, cache_key=cache_key)
         log.info('Done!')
 
     except Exception as e:
@@ -170,6 +454,8 @@ def main():
 
     time_elapsed = time.perf_counter() - time_start
     log.info(f'Finish in {time_elapsed:.4f} secs')
+    if args['profile']:
+        profiling.write_report(args['profile'])
 
 
 if __name__ == "__main__":
@@ -5,22 +5,47 @@ This script allows user to get information about films.
 This file can also be imported as a module and contains the following
 functions:
 
+    * get_field_parsers - Resolve columns of schema to positions and parsers
     * read_csv - Read data from CSV file and return it as a list
+    * read_csv_table - Read data from CSV file and return it as a columnar Table
+    * read_csv_chunks - Read data from CSV file by chunks of rows stored in Tables
     * print_data_csv - Print data in csv format
     * get_columns - Get column names of data
     * get_shape - Get number of rows and columns of data
     * data_info - Print data summary info
     * get_sorted_data - Get sorted data by column and order
+    * get_typed_values - Parse string values of column to numbers
     * get_groupped_data - Group data by column and apply aggregation function
+    * get_running_aggregates - Aggregate stream of pairs into running state per key
+    * merge_running_aggregates - Merge running state of two partial aggregations
+    * finalized_aggregate - Get final aggregated value from running state
+    * get_file_chunks - Split file to byte ranges aligned to line boundaries
+    * get_running_aggregates_from_file - Read file and aggregate column into running state per group
     * get_groupped_data_from_file - Returns froupped data from file
-    * merged_data - Merge Join two sorted datasets (tables) into one on unique key
+    * read_movies_table - Read movies file to Table and split year column from title
+    * split_year_from_title - Move year from title column to year column
+    * read_ratings_summary_table - Read ratings file and aggregate it to count and sum per movie
+    * get_mean_ratings_table - Get mean rating per movie from ratings summary
+    * is_sorted_by - Check if data is sorted by column
+    * merge_join_indices - Match keys of two sorted lists with linear merge algorithm
+    * hash_join_indices - Match keys of two lists with hash table
+    * get_join_index - Get hash table of keys of right data of join
+    * merged_data - Join two datasets (tables) into one on unique key with merge or hash join
     * get_factorized_data - Factorize column of data which contains multiple categorical data by splitting it on list of categories
     * get_categories_of_column - Get list of unique categories of non-atomic column which contains multiple categorical values splitted by delimiter
     * get_data_with_splitted_col - Split column of data and create new column by regular expression
     * filtered_data_col_contains - Filter data in condition if column contains substring
+    * filtered_data_col_has_any - Filter data if multi-valued column contains any of categories
     * filtered_data_col_in_range - Filter data by slicing integer column
     * stacked_data - Return vertically stacked data
     * sliced_data - Dataset safe slicing method
+    * get_top_rated_key - Get sort key of movie by rating, year and title
+    * get_top_n_per_genre - Get top N rated movies for each genre in single pass
+    * get_backend - Get module which implements pipeline operators
+    * load_movies_and_ratings - Read movies and mean rating per movie from files or cache
+    * filter_movies - Filter movies by genres, year and title arguments
+    * select_top_rated - Select top rated movies overall or for each genre
+    * get_top_rated_query - Get lazy query plan of top rated movies
     * get_arguments - Construct the argument parser and get the arguments
     * main - the main function of the script
 """
@@ -28,19 +53,77 @@ functions:
 
 # import the necessary packages
 import csv
+import os
 import re
+import sys
 import time
 import argparse
 import logging as log
-from itertools import groupby
-from statistics import mean
+from heapq import heappush, heapreplace
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import groupby, chain
+from math import sqrt
+from table import Table, Column, DTYPES
+from dataset_cache import cached_table
+from csv_scanner import scan_csv_table, scan_csv_chunks
+from indexes import InvertedIndex, TrigramIndex, SortedIndex
+from result_cache import ResultCache, get_cache_key, get_files_version
+import profiling
 
 
 DATA_FOLDER_PATH = 'data/ml-latest-small/'
+AGG_FUNCTIONS = ('mean', 'count', 'sum', 'min', 'max', 'std')
+MOVIES_SCHEMA = {'movieId': 'int32', 'title': 'str', 'genres': 'category'}
+RATINGS_SCHEMA = {'userId': 'int32', 'movieId': 'int32', 'rating': 'float32', 'timestamp': 'int64'}
+RATINGS_AGG_SCHEMA = {'movieId': 'int32', 'rating': 'float64'}
+RATINGS_SUMMARY_SCHEMA = {'movieId': 'int32', 'rating_count': 'int32', 'rating_sum': 'float64'}
+MOVIES_TABLE_SCHEMA = {**MOVIES_SCHEMA, 'year': 'int16'}
+CACHE_FOLDER_PATH = 'cache/'
+BACKENDS = ('python', 'numpy')
+JOIN_TYPES = ('inner', 'left', 'anti')
+
+
+def get_field_parsers(header: list, schema: dict) -> list:
+    """Resolve columns of schema to positions in header and get parser of every
+    column. Value of schema is name of type from table.DTYPES or tuple
+    (type, nullable, default). Empty values of nullable columns are parsed to
+    default, empty values of text columns are kept as is
 
+    Parameters
+    ----------
+    header : list
+        Column names of csv file
+    schema : dict
+        Columns to read from file with their types
 
-def read_csv(file_path: str, delimiter: str = ',', columns: list = None, encoding: str = 'ascii') -> list:
-    """Read data from CSV file and return it as a list
+    Returns
+    -------
+    list
+        Tuples (column, position, parser)
+    """
+    parsers = []
+    for name, spec in schema.items():
+        spec = (spec,) if isinstance(spec, str) else tuple(spec)
+        dtype, nullable, default = spec + (True, None)[len(spec) - 1:]
+        if dtype not in DTYPES:
+            raise ValueError(f'Unknown type `{dtype}` of column `{name}`, expected one of {tuple(DTYPES)}')
+        if name not in header:
+            raise ValueError(f'Column `{name}` is not found in header {header}')
+
+        parse = int if dtype.startswith('int') else float if dtype.startswith('float') else str
+        if parse is not str and (nullable or default is not None):
+            parse = (lambda convert, default: lambda value: convert(value) if value else default)(parse, default)
+        parsers.append((name, header.index(name), parse))
+    return parsers
+
+
+def read_csv(file_path: str, delimiter: str = ',', columns: list = None, encoding: str = 'ascii',
+             schema: dict = None) -> list:
+    """Read data from CSV file and return it as a list. Positions of columns
+    are resolved once from header and unused fields are skipped. With schema
+    every value is converted to its type exactly once while parsing, so typed
+    rows can be used by other functions without parsing strings again
 
     Parameters
     ----------
@@ -49,9 +132,13 @@ def read_csv(file_path: str, delimiter: str = ',', columns: list = None, encodin
     delimiter : str, optional
         Delimiter of csv file, by default ','
     columns : list, optional
-        Columns to read from file, by default None
+        Columns to read from file as strings, by default None (all columns)
     encoding : str, optional
         File encoding method, by default 'ascii'
+    schema : dict, optional
+        Columns to read from file with their types, see get_field_parsers,
+        e.g. {'movieId': 'int32', 'rating': ('float32', False)},
+        by default None (columns are read as strings)
 
     Returns
     -------
@@ -61,22 +148,291 @@ def read_csv(file_path: str, delimiter: str = ',', columns: list = None, encodin
     data = []
     try:
         with open(file_path, newline='') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=delimiter)
-            if columns:
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            header = next(reader, None)
+            if header is None:
+                return data
+
+            if schema is None:
+                schema = dict.fromkeys(header if columns is None else columns, 'str')
+            parsers = get_field_parsers(header, schema)
+            width = len(header)
+
+            try:
                 for row in reader:
-                    data_row = {col: row.get(col) for col in columns}
-                    data.append(data_row)
-            else:
-                data = [row for row in reader]
+                    if len(row) < width:
+                        if not row:
+                            continue
+                        row += [''] * (width - len(row))
+                    data.append({name: parse(row[i]) for name, i, parse in parsers})
+            except ValueError as e:
+                raise ValueError(f'Line {reader.line_num} of `{file_path}`: {e}') from e
     except Exception as e:
         log.exception(e)
 
     return data
 
 
-def get_groupped_data_from_file(file_path: str, group_by: str, agg_col: str, delimiter: str = ',') -> list:
-    """Returns groupped data with two columns from file. Optimized algorithm 
-    of reading and groupping with mean operations.
+def read_csv_table(file_path: str, schema: dict, delimiter: str = ',', encoding: str = 'utf-8') -> Table:
+    """Read data from CSV file and return it as a columnar Table. File is
+    memory-mapped and numeric fields are parsed from bytes to typed arrays
+    without python objects per row, see csv_scanner.py
+
+    Parameters
+    ----------
+    file_path : str
+        File name of csv file
+    schema : dict
+        Columns to read from file with their types, see table.DTYPES
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    encoding : str, optional
+        Encoding of text fields, by default 'utf-8'
+
+    Returns
+    -------
+    Table
+        Data from file stored in typed columns
+    """
+    try:
+        return scan_csv_table(file_path, schema, delimiter, encoding=encoding)
+    except Exception as e:
+        log.exception(e)
+
+    return Table({name: Column(dtype) for name, dtype in schema.items()})
+
+
+def read_csv_chunks(file_path: str, schema: dict, chunk_size: int = 8192, delimiter: str = ',', encoding: str = 'utf-8'):
+    """Read data from CSV file by chunks of rows stored in Tables. Category
+    columns of all chunks share categories, so chunks can be appended to
+    one table without decoding values
+
+    Parameters
+    ----------
+    file_path : str
+        File name of csv file
+    schema : dict
+        Columns to read from file with their types, see table.DTYPES
+    chunk_size : int, optional
+        Number of rows in chunk, by default 8192
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    encoding : str, optional
+        File encoding method, by default 'utf-8'
+
+    Yields
+    -------
+    Table
+        Chunk of data with schema columns
+    """
+    template = Table({name: Column(dtype) for name, dtype in schema.items()})
+    with open(file_path, newline='', encoding=encoding) as csvfile:
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        header = next(reader)
+        positions = [header.index(name) for name in schema]
+        while True:
+            chunk = template.empty_like()
+            appends = [(i, chunk.column(name).append) for i, name in zip(positions, schema)]
+            n_rows = 0
+            for row in reader:
+                for i, append in appends:
+                    append(row[i])
+                n_rows += 1
+                if n_rows == chunk_size:
+                    break
+            if n_rows:
+                yield chunk
+            if n_rows < chunk_size:
+                return
+
+
+def get_running_aggregates(pairs, agg_function: str = 'mean') -> dict:
+    """Aggregate stream of (key, value) pairs into fixed-size running state per key
+
+    Parameters
+    ----------
+    pairs : iterable
+        Stream of (group key, numeric value) tuples
+    agg_function : str, optional
+        Aggregation function name from AGG_FUNCTIONS, by default 'mean'
+
+    Returns
+    -------
+    dict
+        Running state list per key: [count, sum] for mean, count and sum,
+        [count, sum, min, max] for min and max, [count, sum, mean, m2] for std
+
+    Raises
+    ------
+    ValueError
+        If aggregation function is not supported
+    """
+    if agg_function not in AGG_FUNCTIONS:
+        raise ValueError(f'Unknown aggregation function `{agg_function}`, '
+                         f'expected one of {AGG_FUNCTIONS}')
+
+    states = {}
+    if agg_function in ('mean', 'count', 'sum'):
+        for k, v in pairs:
+            state = states.get(k)
+            if state is None:
+                states[k] = [1, v]
+            else:
+                state[0] += 1
+                state[1] += v
+    elif agg_function in ('min', 'max'):
+        for k, v in pairs:
+            state = states.get(k)
+            if state is None:
+                states[k] = [1, v, v, v]
+            else:
+                state[0] += 1
+                state[1] += v
+                if v < state[2]:
+                    state[2] = v
+                if v > state[3]:
+                    state[3] = v
+    else:
+        # Welford's online algorithm keeps variance numerically stable
+        for k, v in pairs:
+            state = states.get(k)
+            if state is None:
+                states[k] = [1, v, v, 0.0]
+            else:
+                state[0] += 1
+                state[1] += v
+                delta = v - state[2]
+                state[2] += delta / state[0]
+                state[3] += delta * (v - state[2])
+
+    return states
+
+
+def merge_running_aggregates(states: dict, other: dict, agg_function: str = 'mean') -> dict:
+    """Merge running state of `other` into `states` in place
+
+    Parameters
+    ----------
+    states : dict
+        Running state per key, result of get_running_aggregates
+    other : dict
+        Running state per key to merge in
+    agg_function : str, optional
+        Aggregation function both states were built for, by default 'mean'
+
+    Returns
+    -------
+    dict
+        Merged running state per key
+    """
+    for k, o in other.items():
+        s = states.get(k)
+        if s is None:
+            states[k] = list(o)
+            continue
+
+        if agg_function == 'std':
+            count = s[0] + o[0]
+            delta = o[2] - s[2]
+            s[3] += o[3] + delta * delta * s[0] * o[0] / count
+            s[2] += delta * o[0] / count
+        elif agg_function in ('min', 'max'):
+            s[2] = min(s[2], o[2])
+            s[3] = max(s[3], o[3])
+        s[0] += o[0]
+        s[1] += o[1]
+
+    return states
+
+
+def finalized_aggregate(state: list, agg_function: str = 'mean', ndigits: int = 4):
+    """Get final aggregated value from running state of one key
+
+    Parameters
+    ----------
+    state : list
+        Running state of key, see get_running_aggregates
+    agg_function : str, optional
+        Aggregation function name, by default 'mean'
+    ndigits : int, optional
+        Round float result to given precision, by default 4
+
+    Returns
+    -------
+    int or float
+        Aggregated value
+    """
+    if agg_function == 'count':
+        return state[0]
+    if agg_function == 'mean':
+        value = state[1] / state[0]
+    elif agg_function == 'sum':
+        value = state[1]
+    elif agg_function == 'min':
+        value = state[2]
+    elif agg_function == 'max':
+        value = state[3]
+    else:
+        # population standard deviation, same as MySQL STD()
+        value = sqrt(state[3] / state[0])
+
+    return round(value, ndigits)
+
+
+def get_file_chunks(file_path: str, n_chunks: int) -> list:
+    """Split file without header to byte ranges aligned to line boundaries
+
+    Parameters
+    ----------
+    file_path : str
+        File name to split
+    n_chunks : int
+        Desired number of chunks, less chunks are returned for small files
+
+    Returns
+    -------
+    list
+        List of (start, end) byte offsets, end is exclusive
+    """
+    with open(file_path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        size = f.seek(0, 2)
+
+        bounds = [data_start]
+        for i in range(1, n_chunks):
+            f.seek(data_start + (size - data_start) * i // n_chunks)
+            f.readline()
+            pos = f.tell()
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+        bounds.append(size)
+
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+
+def _scan_pairs(file_path: str, group_by: str, agg_col: str, delimiter: str, start: int = None, end: int = None, keys: set = None):
+    chunks = scan_csv_chunks(file_path, {group_by: 'str', agg_col: 'float64'}, delimiter, start, end)
+    pairs = chain.from_iterable(zip(chunk.column(group_by), chunk.column(agg_col)) for chunk in chunks)
+    if keys is not None:
+        pairs = ((k, v) for k, v in pairs if k in keys)
+    return pairs
+
+
+def _aggregate_file_chunk(file_path: str, start: int, end: int, group_by: str, agg_col: str, delimiter: str, agg_function: str, keys: set = None) -> dict:
+    return get_running_aggregates(
+        _scan_pairs(file_path, group_by, agg_col, delimiter, start, end, keys),
+        agg_function)
+
+
+def get_running_aggregates_from_file(file_path: str, group_by: str, agg_col: str, delimiter: str = ',', agg_function: str = 'mean', workers: int = 1, keys: set = None) -> dict:
+    """Read file and aggregate column into running state per group.
+    File is parsed by memory-mapped scanner, see csv_scanner.py, so
+    fields must not contain line breaks.
+
+    With several workers file is splitted to byte ranges aligned to lines,
+    each range is aggregated in separate process and partial running
+    states are merged.
 
     Parameters
     ----------
@@ -88,6 +444,59 @@ def get_groupped_data_from_file(file_path: str, group_by: str, agg_col: str, del
         Aggregation column name
     delimiter : str, optional
         Delimiter of csv file, by default ','
+    agg_function : str, optional
+        Aggregation function name from AGG_FUNCTIONS, by default 'mean'
+    workers : int, optional
+        Number of worker processes, by default 1
+    keys : set, optional
+        Groups to aggregate as strings, rows of other groups are skipped,
+        by default None (all groups)
+
+    Returns
+    -------
+    dict
+        Running state per group, see get_running_aggregates
+    """
+    if workers <= 1:
+        return get_running_aggregates(
+            _scan_pairs(file_path, group_by, agg_col, delimiter, keys=keys),
+            agg_function)
+
+    chunks = get_file_chunks(file_path, workers)
+    log.debug(f'{len(chunks)} chunks of file `{file_path}`: {chunks}')
+    states = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_aggregate_file_chunk, file_path, start, end,
+                                   group_by, agg_col, delimiter, agg_function, keys)
+                   for start, end in chunks]
+        # merge in order of chunks to keep order of groups
+        for future in futures:
+            merge_running_aggregates(states, future.result(), agg_function)
+
+    return states
+
+
+def get_groupped_data_from_file(file_path: str, group_by: str, agg_col: str, delimiter: str = ',', agg_function: str = 'mean', workers: int = 1, keys: set = None) -> list:
+    """Returns groupped data with two columns from file. Streaming algorithm
+    of reading and groupping which keeps only running state per group,
+    so memory depends on number of groups, not rows.
+
+    Parameters
+    ----------
+    file_path : str
+        File name to read
+    group_by : str
+        Group by column name
+    agg_col : str
+        Aggregation column name
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    agg_function : str, optional
+        Aggregation function name from AGG_FUNCTIONS, by default 'mean'
+    workers : int, optional
+        Number of worker processes, by default 1
+    keys : set, optional
+        Groups to aggregate as strings, by default None (all groups)
 
     Returns
     -------
@@ -96,38 +505,107 @@ def get_groupped_data_from_file(file_path: str, group_by: str, agg_col: str, del
     """
     data = []
     try:
-        with open(file_path, newline='') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=delimiter)
-
-            group_vals = {}
-            for row in reader:
-                gr_val = row.get(group_by)
-                agg_val = float(row.get(agg_col))
-
-                if gr_val in group_vals.keys():
-                    group_vals[gr_val] += [agg_val]
-                else:
-                    group_vals[gr_val] = [agg_val]
-
-            for k, v in group_vals.items():
-                data.append({group_by: k, agg_col: round(sum(v)/len(v), 4)})
+        states = get_running_aggregates_from_file(file_path, group_by, agg_col, delimiter,
+                                                  agg_function, workers, keys)
+        data = [{group_by: k, agg_col: finalized_aggregate(v, agg_function)}
+                for k, v in states.items()]
     except Exception as e:
         log.exception(e)
 
     return data
 
 
-def print_data_csv(data: list, delimiter=',', n_rows=None) -> None:
+def read_movies_table(file_path: str) -> Table:
+    """Read movies file to Table and split year column from title
+
+    Parameters
+    ----------
+    file_path : str
+        File name of movies csv file
+
+    Returns
+    -------
+    Table
+        Table with MOVIES_TABLE_SCHEMA columns
+    """
+    return split_year_from_title(read_csv_table(file_path, MOVIES_SCHEMA))
+
+
+def split_year_from_title(movies: Table) -> Table:
+    """Remove year in brackets from `title` column and store it to `year` column
+
+    Parameters
+    ----------
+    movies : Table
+        Table with MOVIES_SCHEMA columns
+
+    Returns
+    -------
+    Table
+        The same table with MOVIES_TABLE_SCHEMA columns
+    """
+    return get_data_with_splitted_col(movies, 'title', 'year',
+                                      r'\s\(\d\d\d\d\)', r'\d\d\d\d', 'int16')
+
+
+def read_ratings_summary_table(file_path: str, workers: int = 1) -> Table:
+    """Read ratings file and aggregate it to count and sum of ratings per movie
+
+    Parameters
+    ----------
+    file_path : str
+        File name of ratings csv file
+    workers : int, optional
+        Number of worker processes, by default 1
+
+    Returns
+    -------
+    Table
+        Table with RATINGS_SUMMARY_SCHEMA columns sorted by movieId
+    """
+    states = get_running_aggregates_from_file(file_path, 'movieId', 'rating', workers=workers)
+    summary = Table.from_records(
+        ({'movieId': k, 'rating_count': v[0], 'rating_sum': v[1]} for k, v in states.items()),
+        RATINGS_SUMMARY_SCHEMA)
+    return get_sorted_data(summary, 'movieId', reverse=False)
+
+
+def get_mean_ratings_table(summary: Table) -> Table:
+    """Get mean rating per movie from ratings summary
+
+    Parameters
+    ----------
+    summary : Table
+        Table with RATINGS_SUMMARY_SCHEMA columns
+
+    Returns
+    -------
+    Table
+        Table with RATINGS_AGG_SCHEMA columns in the same order
+    """
+    means = (finalized_aggregate([c, s]) for c, s in zip(summary.column('rating_count'),
+                                                          summary.column('rating_sum')))
+    return Table({
+        'movieId': summary.column('movieId'),
+        'rating': Column.from_values(means, 'float64'),
+    })
+
+
+def print_data_csv(data: list, delimiter=',', n_rows=None, file=None, header: bool = True) -> None:
     """Print data in csv format
 
     Parameters
     ----------
-    data : list
-        Data stored in list of dict
+    data : list or Table
+        Data stored in list of dict or Table
     delimiter : str, optional
         Separator of csv format, by default ','
     n_rows : int, optional
         Number of rows to display, by default None
+    file : file-like, optional
+        Output stream, by default None (stdout)
+    header : bool, optional
+        Flag to print header, False for next chunks of streamed data, by default True
     """
     try:
         if n_rows and len(data) >= n_rows:
@@ -136,17 +614,18 @@ def print_data_csv(data: list, delimiter=',', n_rows=None) -> None:
         if len(data) == 0:
             return 0
 
-        header = ','.join(get_columns(data))
-        print(header)
+        if header:
+            print(','.join(get_columns(data)), file=file)
 
-        for row in data:
+        rows = data.rows() if isinstance(data, Table) else (row.values() for row in data)
+        for row in rows:
             csv_row = ''
-            for k, v in row.items():
+            for v in row:
                 if delimiter in str(v):
                     v = f'"{v}"'
                 csv_row += delimiter + str(v)
             csv_row = csv_row[1:]
-            print(csv_row)
+            print(csv_row, file=file)
     except Exception as e:
         log.exception(e)
 
@@ -164,6 +643,9 @@ def get_columns(data: list) -> list:
     list
         List of column names
     """
+    if isinstance(data, Table):
+        return data.columns
+
     columns = []
     try:
         assert data[0]
@@ -203,8 +685,9 @@ def data_info(data: list) -> str:
     return f'cols: {cols}, shape: {shape}'
 
 
-def get_sorted_data(data: list, sort_by: str, reverse=True) -> list:
-    """Get sorted data by column and order
+def get_sorted_data(data: list, sort_by: str, reverse=True, index: SortedIndex = None) -> list:
+    """Get sorted data by column and order. Order of index or existing
+    ascending order of data is reused instead of sorting
 
     Parameters
     ----------
@@ -214,13 +697,68 @@ def get_sorted_data(data: list, sort_by: str, reverse=True) -> list:
         Sort data by specific column
     reverse : bool, optional
         Flag to determinate order of sorting (False - asc, True - desc), by default True
+    index : SortedIndex, optional
+        Index built on column of the same data, by default None
 
     Returns
     -------
     list
         Sorted data stored in list of dicts
     """
-    return sorted(data, key=lambda k: (k[sort_by] is not None, k[sort_by]), reverse=reverse)
+    if index is not None:
+        order = index.order(reverse)
+        return data.take(order) if isinstance(data, Table) else [data[i] for i in order]
+
+    if isinstance(data, Table):
+        if not reverse and is_sorted_by(data, sort_by):
+            return data
+        column = data.column(sort_by)
+        values = list(column)
+        null_idx = [i for i, v in enumerate(values) if v is None]
+        if null_idx:
+            not_null = [i for i, v in enumerate(values) if v is not None]
+        else:
+            not_null = range(len(values))
+        order = sorted(not_null, key=values.__getitem__, reverse=reverse)
+        # nulls go first in ascending and last in descending order
+        order = order + null_idx if reverse else null_idx + order
+        return data.take(order)
+
+    # values are parsed once, so numbers from csv are not compared as strings
+    values = get_typed_values([row[sort_by] for row in data])
+    order = sorted(range(len(data)), key=lambda i: (values[i] is not None, values[i]), reverse=reverse)
+    return [data[i] for i in order]
+
+
+def get_typed_values(values: list) -> list:
+    """Parse string values of column to int or float, empty strings are
+    parsed to None. Values are returned as is if any of them is not a number
+
+    Parameters
+    ----------
+    values : list
+        Column values, e.g. strings from csv file
+
+    Returns
+    -------
+    list
+        Typed values
+    """
+    typed = []
+    for value in values:
+        if isinstance(value, str):
+            if not value:
+                value = None
+            else:
+                try:
+                    value = int(value)
+                except ValueError:
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        return values
+        typed.append(value)
+    return typed
 
 
 def get_groupped_data(data: list,  group_by: str, agg_column: str, agg_function='mean') -> list:
@@ -235,7 +773,7 @@ def get_groupped_data(data: list,  group_by: str, agg_column: str, agg_function=
     agg_column : str
         Column of aggregation
     agg_function : str, optional
-        Aggregation function, by default 'mean'
+        Aggregation function name from AGG_FUNCTIONS, by default 'mean'
 
     Returns
     -------
@@ -244,46 +782,198 @@ def get_groupped_data(data: list,  group_by: str, agg_column: str, agg_function=
     """
     groupped_data = []
 
-    for k, v in groupby(data, key=lambda x: x[group_by]):
+    if isinstance(data, Table):
+        pairs = zip(data.column(group_by), data.column(agg_column))
+        groups = ((k, (float(p[1]) for p in v)) for k, v in groupby(pairs, key=lambda p: p[0]))
+    elif data and not isinstance(data[0][agg_column], str):
+        # rows typed by schema of read_csv are aggregated without parsing
+        groups = ((k, (i[agg_column] for i in v)) for k, v in groupby(data, key=lambda x: x[group_by]))
+    else:
+        groups = ((k, (float(i[agg_column]) for i in v)) for k, v in groupby(data, key=lambda x: x[group_by]))
+
+    for k, v in groups:
+        states = get_running_aggregates(((k, i) for i in v), agg_function)
         group_row = {group_by: k}
-        agg_vals = [float(i[agg_column]) for i in v]
-        group_row[agg_column] = round(mean(agg_vals), 4)
+        group_row[agg_column] = finalized_aggregate(states[k], agg_function)
         groupped_data.append(group_row)
 
     return groupped_data
 
 
-def merged_data(data_left: list, data_right: list, join_on: str) -> list:
-    """Merge Join two sorted datasets (tables) into one on unique key
+def is_sorted_by(data: list, column: str) -> bool:
+    """Check if data is sorted by column in ascending order without nulls
+
+    Parameters
+    ----------
+    data : list or Table
+        Data stored in list of dicts or Table
+    column : str
+        Column name
+
+    Returns
+    -------
+    bool
+        True if values of column are not null and non-decreasing
+    """
+    values = data.column(column) if isinstance(data, Table) else [row[column] for row in data]
+    prev = None
+    for value in values:
+        if value is None or (prev is not None and value < prev):
+            return False
+        prev = value
+    return True
+
+
+def merge_join_indices(keys_left: list, keys_right: list) -> list:
+    """Match keys of two sorted lists with linear merge algorithm
+
+    Parameters
+    ----------
+    keys_left : list
+        Sorted keys of left data
+    keys_right : list
+        Sorted unique keys of right data
+
+    Returns
+    -------
+    list
+        Position of matched right key for each left key, None if not matched
+    """
+    indices = []
+    j = 0
+    n_right = len(keys_right)
+    for key in keys_left:
+        while j < n_right and keys_right[j] < key:
+            j += 1
+        indices.append(j if j < n_right and keys_right[j] == key else None)
+    return indices
+
+
+def hash_join_indices(keys_left: list, keys_right: list) -> list:
+    """Match keys of two lists with hash table built on right keys
 
     Parameters
     ----------
-    data_left : list
-        Left data stored in list of dicts 
-    data_right : list
-        Right data stored in list of dicts
+    keys_left : list
+        Keys of left data
+    keys_right : list
+        Unique keys of right data, first position is used for duplicates
+
+    Returns
+    -------
+    list
+        Position of matched right key for each left key, None if not matched
+    """
+    positions = {}
+    for i, key in enumerate(keys_right):
+        positions.setdefault(key, i)
+    return [positions.get(key) for key in keys_left]
+
+
+def get_join_index(data: list, join_on: str) -> dict:
+    """Get hash table of keys of right data of join, which can be reused by
+    merged_data for many left datasets, e.g. chunks of streamed data
+
+    Parameters
+    ----------
+    data : list or Table
+        Right data stored in list of dicts or Table
     join_on : str
         Common unique column key of two datasets
 
     Returns
     -------
-    list
-        Merged data stored in list of dicts
+    dict
+        First position of every key
     """
+    keys = data.column(join_on) if isinstance(data, Table) else (row[join_on] for row in data)
+    positions = {}
+    for i, key in enumerate(keys):
+        positions.setdefault(key, i)
+    return positions
+
+
+def merged_data(data_left: list, data_right: list, join_on: str, how: str = 'left', algorithm: str = 'auto',
+                index: dict = None) -> list:
+    """Join two datasets (tables) into one on unique key. Merge join is used
+    if both datasets are sorted by key, otherwise hash join
+
+    Parameters
+    ----------
+    data_left : list or Table
+        Left data stored in list of dicts or Table
+    data_right : list or Table
+        Right data stored in list of dicts or Table
+    join_on : str
+        Common unique column key of two datasets
+    how : str, optional
+        Join type from JOIN_TYPES: `inner` keeps matched left rows, `left` keeps
+        all left rows with None in right columns if not matched, `anti` keeps
+        not matched left rows only, by default 'left'
+    algorithm : str, optional
+        `merge`, `hash` or `auto`, by default 'auto'
+    index : dict, optional
+        Hash table of right keys from get_join_index, which is probed
+        instead of building join algorithm from right keys, by default None
+
+    Returns
+    -------
+    list or Table
+        Merged data of the same type as left data
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f'Unknown join type `{how}`, expected one of {JOIN_TYPES}')
+
+    is_table = isinstance(data_left, Table)
+    if is_table and not isinstance(data_right, Table):
+        data_right = Table.from_records(data_right)
+
+    if is_table:
+        keys_left = list(data_left.column(join_on))
+    else:
+        keys_left = [row[join_on] for row in data_left]
+
+    if index is not None:
+        log.debug(f'{how} join on `{join_on}` with index')
+        indices = [index.get(key) for key in keys_left]
+    else:
+        keys_right = list(data_right.column(join_on)) if is_table else [row[join_on] for row in data_right]
+        if algorithm == 'auto':
+            sorted_inputs = is_sorted_by(data_left, join_on) and is_sorted_by(data_right, join_on)
+            algorithm = 'merge' if sorted_inputs else 'hash'
+        log.debug(f'{how} {algorithm} join on `{join_on}`')
+
+        if algorithm == 'merge':
+            indices = merge_join_indices(keys_left, keys_right)
+        else:
+            indices = hash_join_indices(keys_left, keys_right)
+
+    if how == 'anti':
+        rows_left = [i for i, j in enumerate(indices) if j is None]
+        return data_left.take(rows_left) if is_table else [data_left[i] for i in rows_left]
+    if how == 'inner':
+        rows_left = [i for i, j in enumerate(indices) if j is not None]
+        indices = [indices[i] for i in rows_left]
+    else:
+        rows_left = range(len(keys_left))
+
+    if is_table:
+        merged = data_left.take(rows_left)
+        for name in data_right.columns:
+            if name != join_on:
+                merged.with_column(name, data_right.column(name).take(indices))
+        return merged
+
     # get data right columns with None values in case when right table don`t match with left
-    columns_right = data_right[0].keys()
+    columns_right = data_right[0].keys() if data_right else []
     right_none = {e: None for e in columns_right if e != join_on}
 
     merged_data = []
-    data_r_start = 0
-    for row_left in data_left:
-        merged_row = {**row_left, **right_none}
-        for i in range(data_r_start, len(data_right)):
-            if row_left[join_on] == data_right[i][join_on]:
-                merged_row = {**row_left, **data_right[i]}
-                data_r_start = i
-                break
-        merged_data.append(merged_row)
+    for i, j in zip(rows_left, indices):
+        if j is None:
+            merged_data.append({**data_left[i], **right_none})
+        else:
+            merged_data.append({**data_left[i], **data_right[j]})
 
     return merged_data
 
@@ -306,7 +996,8 @@ def get_factorized_data(data: list, column: str, delimiter=',') -> list:
     list
         Factorized data stored in list of dicts
     """
-    # factorized_data = []
+    if isinstance(data, Table):
+        data = data.to_records()
 
     for row in data:
         row[column] = row[column].split(delimiter)
@@ -332,17 +1023,19 @@ def get_categories_of_column(data: list, column: str, delimiter=',') -> list:
     list
         Unique list of categories in variable
     """
-    column_values = ''
-    for row in data:
-        column_values += delimiter + str(row[column])
+    if isinstance(data, Table):
+        column = data.column(column)
+        values = column.categories if column.categories is not None else column
+        return list({c for v in values if v is not None for c in v.split(delimiter)})
 
-    splitted = column_values.split(delimiter)[1:]
-    categories = list(set(splitted))
+    # split each distinct value once instead of concatenating all values
+    values = {str(row[column]) for row in data}
+    categories = list({c for v in values for c in v.split(delimiter)})
 
     return categories
 
 
-def get_data_with_splitted_col(data: list, column: str, new_column: str, old_col_regex: str, new_col_regex: str) -> list:
+def get_data_with_splitted_col(data: list, column: str, new_column: str, old_col_regex: str, new_col_regex: str, new_col_type: str = 'str') -> list:
     """Split column of data and create new column by regular expression
 
     Parameters
@@ -357,12 +1050,32 @@ def get_data_with_splitted_col(data: list, column: str, new_column: str, old_col
         RegEx used to remove data from first column
     new_col_regex : str
         RegEx used to create new column
+    new_col_type : str, optional
+        Type of new column if data is Table, by default 'str'
 
     Returns
     -------
     list
         Data stored in list of dicts
     """
+    if isinstance(data, Table):
+        old_pattern = re.compile(old_col_regex)
+        new_pattern = re.compile(new_col_regex)
+        old_col = data.column(column)
+        old_vals = []
+        new_vals = []
+        for i, val in enumerate(old_col):
+            match = new_pattern.search(val)
+            if match:
+                new_vals.append(match.group())
+            else:
+                new_vals.append(None)
+                log.warning(f'Can`t split column `{column}` in row: {data[i]}')
+            old_vals.append(old_pattern.sub('', val))
+        data.with_column(new_column, Column.from_values(new_vals, new_col_type))
+        data.with_column(column, Column.from_values(old_vals, old_col.dtype))
+        return data
+
     for row in data:
         if re.search(new_col_regex, row[column]):
             new_col_val = re.search(new_col_regex, row[column]).group()
@@ -375,7 +1088,7 @@ def get_data_with_splitted_col(data: list, column: str, new_column: str, old_col
     return data
 
 
-def filtered_data_col_contains(data: list, column: str, substring: str) -> list:
+def filtered_data_col_contains(data: list, column: str, substring: str, index: TrigramIndex = None) -> list:
     """Filter data in condition if column contains substring
 
     Parameters
@@ -386,23 +1099,72 @@ def filtered_data_col_contains(data: list, column: str, substring: str) -> list:
         Filtering column
     substring : str
         Substring of column value
+    index : TrigramIndex, optional
+        Index built on column of the same data, by default None (scan data)
 
     Returns
     -------
     list
         Filtered data stored in list of dicts
     """
+    pattern = re.compile(substring)
+    if isinstance(data, Table):
+        col = data.column(column)
+        return data.take(index.search(pattern, col) if index is not None else col.where(pattern.search))
+
+    # rows without required literals of pattern are skipped by index
+    rows = index.candidates(substring) if index is not None else None
     filtered_data = []
 
-    for row in data:
-        if re.search(substring, row[column]):
+    for row in (data if rows is None else (data[i] for i in rows)):
+        if pattern.search(row[column]):
             filtered_data.append(row)
 
     return filtered_data
 
 
-def filtered_data_col_in_range(data: list, column: str, start=None, end=None) -> list:
-    """Filter data by slicing integer column
+def filtered_data_col_has_any(data: list, column: str, categories: list, delimiter: str = '|', index: InvertedIndex = None) -> list:
+    """Filter data in condition if multi-valued column contains any of
+    categories. Categories are matched exactly, not as RegEx
+
+    Parameters
+    ----------
+    data : list or Table
+        Data stored in list of dicts or Table
+    column : str
+        Filtering column with categories splitted by delimiter
+    categories : list
+        Categories to search
+    delimiter : str, optional
+        Delimiter of categories in column, by default '|'
+    index : InvertedIndex, optional
+        Index built on column of the same data, by default None (scan data)
+
+    Returns
+    -------
+    list or Table
+        Filtered data
+    """
+    if index is not None:
+        rows = index.union(categories)
+    else:
+        categories = set(categories)
+        values = data.column(column) if isinstance(data, Table) else (row[column] for row in data)
+        matched = {}
+        rows = []
+        for i, value in enumerate(values):
+            is_matched = matched.get(value)
+            if is_matched is None:
+                is_matched = matched[value] = (value is not None
+                                               and not categories.isdisjoint(value.split(delimiter)))
+            if is_matched:
+                rows.append(i)
+
+    return data.take(rows) if isinstance(data, Table) else [data[i] for i in rows]
+
+
+def filtered_data_col_in_range(data: list, column: str, start=None, end=None, index: SortedIndex = None) -> list:
+    """Filter data by slicing integer column, boundaries are included
 
     Parameters
     ----------
@@ -414,41 +1176,45 @@ def filtered_data_col_in_range(data: list, column: str, start=None, end=None) ->
         Lower boundary of range, by default None
     end : int, optional
         Higher boundary of range, by default None
+    index : SortedIndex, optional
+        Index built on column of the same data, by default None (scan data)
 
     Returns
     -------
     list
-        Filtered data stored in list of dict
+        Filtered data stored in list of dict, empty if start is greater than end
     """
-    filtered_data = []
+    if not start and not end:
+        return data
+    start = start or None
+    end = end or None
 
-    if start and end:
+    if index is not None:
+        rows = index.range(start, end)
+        return data.take(rows) if isinstance(data, Table) else [data[i] for i in rows]
+
+    if start is not None and end is not None:
         if start > end:
-            return None
-
-        for row in data:
-            if not row[column]:
-                continue
-
-            val = int(row[column])
-            if start >= val and val <= end:
-                filtered_data.append(row)
-    elif start:
-        for row in data:
-            if not row[column]:
-                continue
-
-            if start <= int(row[column]):
-                filtered_data.append(row)
-    elif end:
-        for row in data:
-            if not row[column]:
-                continue
-
-            if int(row[column]) <= end:
-                filtered_data.append(row)
+            return data.take([]) if isinstance(data, Table) else []
+        predicate = lambda val: start <= val <= end
+    elif start is not None:
+        predicate = lambda val: start <= val
     else:
-        return data
+        predicate = lambda val: val <= end
+
+    if isinstance(data, Table):
+        return data.take(data.column(column).where(predicate))
+
+    filtered_data = []
+    typed = bool(data) and not isinstance(data[0][column], str)
+
+    for row in data:
+        value = row[column]
+        if value is None or value == '':
+            continue
+
+        if predicate(value if typed else int(value)):
+            filtered_data.append(row)
 
     return filtered_data
 
@@ -496,6 +1262,352 @@ def sliced_data(data: list, start=None, end=None) -> list:
     return data
 
 
+def get_backend(name: str = 'python'):
+    """Get module which implements pipeline operators
+
+    Parameters
+    ----------
+    name : str, optional
+        Backend name from BACKENDS, by default 'python'
+
+    Returns
+    -------
+    module
+        Module with get_sorted_data, get_groupped_data_from_file, get_join_index,
+        merged_data, filtered_data_col_contains and filtered_data_col_in_range functions
+    """
+    if name == 'numpy':
+        import numpy_backend
+        numpy_backend.check_numpy()
+        return numpy_backend
+    if name != 'python':
+        raise ValueError(f'Unknown backend `{name}`, expected one of {BACKENDS}')
+    return sys.modules[__name__]
+
+
+def load_movies_and_ratings(movies_path: str, ratings_path: str, cache_dir: str = None, workers: int = 1, ops=None) -> tuple:
+    """Read movies with year column and mean rating per movie from files
+    or from binary cache of parsed data
+
+    Parameters
+    ----------
+    movies_path : str
+        File name of movies
+    ratings_path : str
+        File name of ratings
+    cache_dir : str, optional
+        Cache directory, by default None (files are parsed without cache)
+    workers : int, optional
+        Number of processes reading ratings file, by default 1
+    ops : module, optional
+        Backend from get_backend, by default python backend
+
+    Returns
+    -------
+    tuple
+        Movies and ratings tables
+    """
+    ops = ops or get_backend()
+
+    # read movies.csv and get year column from title
+    log.info('reading movies.csv and splitting title to year')
+    with profiling.stage('read_movies') as st:
+        if cache_dir is None:
+            movies = read_movies_table(movies_path)
+        else:
+            movies = cached_table(cache_dir, 'movies', [movies_path],
+                                  lambda: read_movies_table(movies_path))
+        st.rows_out = len(movies)
+    log.info('Done!')
+    log.debug(data_info(movies))
+
+    # read ratings.csv
+    log.info('reading ratings.csv')
+    with profiling.stage('read_ratings') as st:
+        if cache_dir is None:
+            ratings = ops.get_groupped_data_from_file(
+                ratings_path, 'movieId', 'rating', workers=workers)
+            if not isinstance(ratings, Table):
+                ratings = Table.from_records(ratings, RATINGS_AGG_SCHEMA)
+        else:
+            summary = cached_table(cache_dir, 'ratings_summary', [ratings_path],
+                                   lambda: read_ratings_summary_table(ratings_path, workers))
+            ratings = get_mean_ratings_table(summary)
+        st.rows_out = len(ratings)
+    log.info('Done!')
+    log.debug(data_info(ratings))
+
+    return movies, ratings
+
+
+def filter_movies(data: Table, args: dict, ops=None, genre_index: InvertedIndex = None,
+                  title_index: TrigramIndex = None, year_index: SortedIndex = None) -> Table:
+    """Filter movies by `genres`, `year_from`, `year_to` and `regexp`
+    arguments. Order of rows is kept
+
+    Parameters
+    ----------
+    data : Table
+        Movies with `genres`, `year` and `title` columns
+    args : dict
+        Dictionary of arguments from get_arguments
+    ops : module, optional
+        Backend from get_backend, by default python backend
+    genre_index : InvertedIndex, optional
+        Index of genres column of data, by default built if genres are given
+    title_index : TrigramIndex, optional
+        Index of title column of data, by default None (scan titles)
+    year_index : SortedIndex, optional
+        Index of year column of data, by default None (scan years)
+
+    Returns
+    -------
+    Table
+        Filtered data
+    """
+    ops = ops or get_backend()
+
+    # filter by genres, year and title with indexes before other filters,
+    # row ids of all indexes are positions in unfiltered data
+    rows = None
+    if args.get('genres'):
+        log.info('building genre index and filtering data by genres')
+        with profiling.stage('filter_genres', len(data)) as st:
+            if genre_index is None:
+                genre_index = InvertedIndex.from_column(data.column('genres'))
+            rows = genre_index.union(args['genres'].split('|'))
+            st.rows_out = len(rows)
+        log.info('Done!')
+
+    by_year_index = year_index is not None
+    if by_year_index and (args.get('year_from') or args.get('year_to')):
+        log.info('filtering data by year_from and year_to with year index')
+        with profiling.stage('filter_year', len(data) if rows is None else len(rows)) as st:
+            rows = year_index.range(args.get('year_from') or None, args.get('year_to') or None, rows)
+            st.rows_out = len(rows)
+        log.info('Done!')
+
+    by_title_index = bool(args.get('regexp')) and title_index is not None
+    if by_title_index:
+        log.info('filtering data by regexp with title index')
+        with profiling.stage('filter_regexp', len(data) if rows is None else len(rows)) as st:
+            rows = title_index.search(args['regexp'], data.column('title'), rows)
+            st.rows_out = len(rows)
+        log.info('Done!')
+
+    if rows is not None:
+        data = data.take(rows)
+        log.debug(data_info(data))
+
+    # filter by year
+    if not by_year_index:
+        log.info('filtering data by year_from and year_to')
+        with profiling.stage('filter_year', len(data)) as st:
+            data = ops.filtered_data_col_in_range(
+                data, 'year',
+                start=args.get('year_from'),
+                end=args.get('year_to')
+            )
+            st.rows_out = len(data)
+        log.info('Done!')
+        log.debug(data_info(data))
+
+    # filter by title
+    if args.get('regexp') and not by_title_index:
+        log.info('filtering data by regexp')
+        with profiling.stage('filter_regexp', len(data)) as st:
+            data = ops.filtered_data_col_contains(data, 'title', args['regexp'])
+            st.rows_out = len(data)
+        log.info('Done!')
+        log.debug(data_info(data))
+
+    return data
+
+
+def select_top_rated(data: Table, args: dict, ops=None, presorted: bool = False) -> tuple:
+    """Select top `topN` rated movies for each genre if `genres` or
+    `all_genres` argument is given, otherwise sort all movies by rating
+
+    Parameters
+    ----------
+    data : Table
+        Movies with `rating` column
+    args : dict
+        Dictionary of arguments from get_arguments
+    ops : module, optional
+        Backend from get_backend, by default python backend
+    presorted : bool, optional
+        Flag that data is already sorted by rating in descending order, by default False
+
+    Returns
+    -------
+    tuple
+        Selected data and number of rows to print (None for all rows)
+    """
+    ops = ops or get_backend()
+    if args.get('genres') or args.get('all_genres'):
+        genres = args['genres'].split('|') if args.get('genres') else None
+        log.info(f'selecting top {args.get("topN")} movies for genres {genres or "all"}')
+        with profiling.stage('top_n_per_genre', len(data)) as st:
+            data = get_top_n_per_genre(data, args.get('topN'), genres)
+            st.rows_out = len(data)
+        log.info('Done!')
+        log.debug(data_info(data))
+        return data, None
+
+    if not presorted:
+        # sort data
+        log.info('sorting data by rating')
+        with profiling.stage('sort', len(data)) as st:
+            data = ops.get_sorted_data(data, 'rating', reverse=True)
+            st.rows_out = len(data)
+        log.info('Done!')
+    return data, args.get('topN')
+
+
+class _Worst:
+    """Heap item which puts the worst row on top of heapq min-heap"""
+
+    __slots__ = ('key', 'index')
+
+    def __init__(self, key: tuple, index: int):
+        self.key = key
+        self.index = index
+
+    def __lt__(self, other) -> bool:
+        return self.key > other.key
+
+
+def get_top_rated_key(rating, year, title: str) -> tuple:
+    """Get sort key of movie, smaller key is better: rating desc, year desc,
+    title asc, the same order as in spr_find_top_rated_movies. Nulls go last
+
+    Parameters
+    ----------
+    rating : float
+        Movie rating, can be None
+    year : int
+        Movie year, can be None
+    title : str
+        Movie title
+
+    Returns
+    -------
+    tuple
+        Sort key
+    """
+    return (rating is None, -(rating or 0), year is None, -int(year or 0), title)
+
+
+def get_top_n_per_genre(data: list, n: int = None, genres: list = None, column: str = 'genres', delimiter: str = '|') -> list:
+    """Get top N rated movies for each genre in single pass over data with
+    bounded heap per genre. Takes O(rows * log N) time and O(genres * N) memory
+
+    Parameters
+    ----------
+    data : list or Table
+        Data with `rating`, `year`, `title` and genres columns
+    n : int, optional
+        Number of movies for each genre, by default None (all movies)
+    genres : list, optional
+        Genres to select, by default None (every genre found in data, sorted
+        by name). Genres are matched exactly, see InvertedIndex
+    column : str, optional
+        Column of genres, by default 'genres'
+    delimiter : str, optional
+        Delimiter of genres in column, by default '|'
+
+    Returns
+    -------
+    list or Table
+        Stacked top N movies of each genre in order of genres, ordered by
+        rating desc, year desc, title in each genre
+    """
+    is_table = isinstance(data, Table)
+    if is_table:
+        values = data.column(column)
+        ratings, years, titles = data.column('rating'), data.column('year'), data.column('title')
+    else:
+        values = [row[column] for row in data]
+
+    groups = {genre: i for i, genre in enumerate(genres)} if genres else {}
+    heaps = [[] for _ in groups]
+
+    # genres of each distinct column value are found once
+    value_groups = {}
+    for i, value in enumerate(values):
+        matched = value_groups.get(value)
+        if matched is None:
+            matched = []
+            for genre in (value.split(delimiter) if value is not None else []):
+                if genre not in groups:
+                    if genres:
+                        continue
+                    groups[genre] = len(heaps)
+                    heaps.append([])
+                matched.append(groups[genre])
+            value_groups[value] = matched
+        if not matched:
+            continue
+
+        if is_table:
+            key = get_top_rated_key(ratings[i], years[i], titles[i])
+        else:
+            row = data[i]
+            key = get_top_rated_key(row['rating'], row['year'], row['title'])
+        key += (i,)
+        for g in matched:
+            heap = heaps[g]
+            if n is None or len(heap) < n:
+                heappush(heap, _Worst(key, i))
+            elif key < heap[0].key:
+                heapreplace(heap, _Worst(key, i))
+
+    order = sorted(groups) if not genres else list(groups)
+    indices = []
+    for genre in order:
+        indices.extend(item.index for item in sorted(heaps[groups[genre]], key=lambda item: item.key))
+
+    return data.take(indices) if is_table else [data[i] for i in indices]
+
+
+def get_top_rated_query(args: dict, movies_path: str, ratings_path: str):
+    """Get lazy query of top rated movies filtered by `genres`, `year_from`,
+    `year_to` and `regexp` arguments, see query_plan
+
+    Parameters
+    ----------
+    args : dict
+        Dictionary of arguments from get_arguments
+    movies_path : str
+        File name of movies
+    ratings_path : str
+        File name of ratings
+
+    Returns
+    -------
+    query_plan.Query
+        Query of top `topN` movies for each genre if `genres` or
+        `all_genres` argument is given, otherwise of top `topN` movies
+    """
+    from query_plan import scan, has_any, in_range, contains
+
+    genres = args['genres'].split('|') if args.get('genres') else None
+    ratings = scan('ratings', ratings_path).aggregate('movieId', 'rating')
+    query = scan('movies', movies_path).join(ratings, on='movieId')
+    if genres:
+        query = query.filter(has_any('genres', genres))
+    if args.get('year_from') or args.get('year_to'):
+        query = query.filter(in_range('year', args.get('year_from'), args.get('year_to')))
+    if args.get('regexp'):
+        query = query.filter(contains('title', args['regexp']))
+
+    if genres or args.get('all_genres'):
+        return query.top_n_per('genres', args.get('topN'), genres)
+    query = query.sort('rating')
+    return query.limit(args['topN']) if args.get('topN') else query
+
+
 def get_arguments() -> dict:
     """Construct the argument parser and get the arguments
 
@@ -509,12 +1621,27 @@ def get_arguments() -> dict:
                     help="the number of top rated movies for each genre. (example: 3)")
     ap.add_argument("-g", "--genres", type=str,
                     help="user-defined genre filter. can be multiple. (example: Comedy|Adventure)")
+    ap.add_argument("-a", "--all_genres", action='store_true',
+                    help="top rated movies for each genre found in data")
     ap.add_argument("-f", "--year_from", type=int,
                     help="the lower boundary of year filter (example: 1980)")
     ap.add_argument("-t", "--year_to", type=int,
                     help="the lower boundary of year filter (example: 2010)")
     ap.add_argument("-r", "--regexp", type=str,
                     help="filter on name of the film (example: love)")
+    ap.add_argument("-w", "--workers", type=int, default=1,
+                    help="number of processes reading ratings file (default: 1)")
+    ap.add_argument("--cache_dir", type=str, default=CACHE_FOLDER_PATH,
+                    help=f"directory of cache of parsed data files (default: {CACHE_FOLDER_PATH})")
+    ap.add_argument("--no_cache", action='store_true',
+                    help="parse data files without reading and writing cache")
+    ap.add_argument("--no_result_cache", action='store_true',
+                    help="run query without reading and writing cache of results")
+    ap.add_argument("--stream", action='store_true',
+                    help="read and filter files by chunks, memory is bounded by aggregated ratings and top N movies")
+    profiling.add_arguments(ap)
+    ap.add_argument("-b", "--backend", type=str, choices=BACKENDS, default='python',
+                    help="execution backend of pipeline, numpy requires numpy package (default: python)")
 
     return vars(ap.parse_args())
 
@@ -534,85 +1661,55 @@ def main():
     args = get_arguments()
     log.info('Done!')
     log.debug(f'arguments: {args}')
-
-    # read movies.csv
-    log.info('reading movies.csv')
-    movies = read_csv(DATA_FOLDER_PATH + 'movies.csv')
-    log.info('Done!')
-    log.debug(data_info(movies))
-
-    # get year column from title
-    log.info('splitting title to year')
-    movies = get_data_with_splitted_col(movies, 'title', 'year',
-                                        r'\s\(\d\d\d\d\)', r'\d\d\d\d')
-    log.info('Done!')
-    log.debug(data_info(movies))
-
-    # filter by year
-    log.info('filtering data by year_from and year_to')
-    movies = filtered_data_col_in_range(
-        movies, 'year',
-        start=args['year_from'],
-        end=args['year_to']
-    )
-    log.info('Done!')
-    log.debug(data_info(movies))
-
-    # filter by title
-    if args['regexp']:
-        log.info('filtering data by regexp')
-        movies = filtered_data_col_contains(movies, 'title', args['regexp'])
-        log.info('Done!')
-        log.debug(data_info(movies))
-
-    # sort movies
-    log.info('sorting movies by movieId')
-    movies = get_sorted_data(movies, 'movieId', reverse=False)
-    log.info('Done!')
-
-    # read ratings.csv
-    log.info('reading ratings.csv')
-    ratings = get_groupped_data_from_file(
-        DATA_FOLDER_PATH + 'ratings.csv', 'movieId', 'rating')
-    log.info('Done!')
-    log.debug(data_info(ratings))
-
-    # sort ratings
-    log.info('sorting ratings by movieId')
-    ratings = get_sorted_data(ratings, 'movieId', reverse=False)
-    log.info('Done!')
-
-    # merge data
-    log.info('merging movies and ratings')
-    data = merged_data(movies, ratings, 'movieId')
-    log.info('Done!')
-    log.debug(data_info(data))
-
-    # sort data
-    log.info('sorting data by rating')
-    data = get_sorted_data(data, 'rating', reverse=True)
-    log.info('Done!')
-
-    if args['genres']:
-        genres = args['genres'].split('|')
-        stacked_data = []
-        for genre in genres:
-            log.info(f'working with {genre}')
-            stacked_data.extend(
-                sliced_data(
-                    filtered_data_col_contains(data, 'genres', genre),
-                    end=args['topN'])
-            )
-            log.info(f'{genre} genre added to output')
-        print_data_csv(stacked_data)
-        log.info('result printed')
-        log.debug(data_info(stacked_data))
+    ops = get_backend(args['backend'])
+    profiling.setup_from_arguments(args)
+
+    movies_path = DATA_FOLDER_PATH + 'movies.csv'
+    ratings_path = DATA_FOLDER_PATH + 'ratings.csv'
+
+    # print cached result of the same query on the same files
+    result_cache = None
+    if not args['no_result_cache']:
+        with profiling.stage('result_cache_lookup'):
+            result_cache = ResultCache(os.path.join(args['cache_dir'], 'results'))
+            cache_key = get_cache_key('movies', args, get_files_version([movies_path, ratings_path]))
+            result = result_cache.get(cache_key)
+        if result is not None:
+            sys.stdout.write(result)
+            log.info('result printed from result cache')
+            log.debug(f'result cache: {result_cache.stats()}')
+            time_elapsed = time.perf_counter() - time_start
+            log.info(f'Finish in {time_elapsed:.4f} secs')
+            if args['profile']:
+                profiling.write_report(args['profile'])
+            return
+
+    # build and run query plan
+    query = get_top_rated_query(args, movies_path, ratings_path)
+    log.debug(f'query plan:\n{query.explain()}')
+    cache_dir = None if args['no_cache'] else args['cache_dir']
+    if args['stream']:
+        # chunks are printed as soon as they are known
+        chunks = query.stream(ops, cache_dir, args['workers'])
     else:
-        print_data_csv(data, n_rows=args['topN'])
-        log.info('result printed')
+        chunks = [query.collect(ops, cache_dir, args['workers'])]
+
+    # print result and save it to result cache
+    output = result_cache.recording(cache_key, sys.stdout) if result_cache else nullcontext(sys.stdout)
+    with profiling.stage('print') as st, output as stream:
+        n_rows = 0
+        for data in chunks:
+            print_data_csv(data, file=stream, header=not n_rows)
+            n_rows += len(data)
+        st.rows_out = n_rows
+    log.info('result printed')
+    if result_cache:
+        log.debug(f'result cache: {result_cache.stats()}')
 
     time_elapsed = time.perf_counter() - time_start
     log.info(f'Finish in {time_elapsed:.4f} secs')
+    if args['profile']:
+        profiling.write_report(args['profile'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,447 @@
+"""Query daemon of top rated movies
+
+This script loads movies and mean rating per movie once, keeps them in
+memory as columnar tables and answers queries over localhost HTTP, so
+queries don't pay interpreter start, parsing and aggregation of csv files.
+
+Query parameters are the same as arguments of movies.py:
+
+    GET  /movies?topN=3&genres=Comedy|Adventure&year_from=2000 - csv result
+    GET  /stats  - loaded dataset, number of queries and latency percentiles
+    POST /reload - reload dataset if csv files were changed
+
+Dataset is reloaded in background when csv files change. New dataset is
+built while old one keeps answering queries and then replaced with single
+assignment, so every query is answered with one consistent dataset.
+
+Example:
+    $python movies_daemon.py --port 8765 &
+    $curl -sG http://127.0.0.1:8765/movies --data-urlencode "genres=Comedy" -d topN=3
+
+This file can also be imported as a module and contains the following:
+
+    * QUERY_PARAMETERS - Query parameters and their types
+    * Dataset - Movies merged with ratings and indexes used by queries
+    * load_dataset - Read files and build dataset
+    * parse_query - Get arguments of query from URL query string
+    * query_dataset - Answer query in csv format
+    * MoviesDaemon - HTTP server with warm dataset and background reloads
+    * get_arguments - Construct the argument parser and get the arguments
+    * main - the main function of the script
+"""
+
+
+# import the necessary packages
+import io
+import json
+import time
+import argparse
+import threading
+import logging as log
+from collections import deque, OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from movies import (DATA_FOLDER_PATH, CACHE_FOLDER_PATH, BACKENDS, get_backend, load_movies_and_ratings,
+                    get_sorted_data, filter_movies, select_top_rated, print_data_csv)
+from indexes import InvertedIndex, TrigramIndex, SortedIndex
+from result_cache import get_files_version, get_cache_key
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+QUERY_PARAMETERS = {
+    'topN': int,
+    'genres': str,
+    'all_genres': bool,
+    'year_from': int,
+    'year_to': int,
+    'regexp': str,
+}
+LATENCY_WINDOW = 10000
+RESULTS_CACHE_SIZE = 256
+
+
+class Dataset:
+    """Movies merged with mean ratings and indexes used by queries.
+    Tables of dataset are never changed after creation, so they are shared
+    by threads. Results of recent queries are kept with dataset, so they
+    are dropped together with it on reload
+
+    Parameters
+    ----------
+    data : Table
+        Movies merged with ratings in order of movies file
+    version : str
+        Version of source files
+    ops : module
+        Backend from get_backend
+    """
+
+    def __init__(self, data, version: str, ops):
+        self.data = data
+        self.version = version
+        self.ops = ops
+        self.loaded_at = time.time()
+        self.genre_index = InvertedIndex.from_column(data.column('genres'))
+        self.title_index = TrigramIndex.from_column(data.column('title'))
+        self.year_index = SortedIndex.from_column(data.column('year'))
+        self.rating_index = SortedIndex.from_column(data.column('rating'))
+        # filters keep order of rows, so movies filtered from sorted table
+        # are sorted too and queries without genres don't sort data
+        self.by_rating = get_sorted_data(data, 'rating', reverse=True, index=self.rating_index)
+        self.by_rating_genre_index = InvertedIndex.from_column(self.by_rating.column('genres'))
+        self.by_rating_title_index = TrigramIndex.from_column(self.by_rating.column('title'))
+        self.by_rating_year_index = SortedIndex.from_column(self.by_rating.column('year'))
+        self.results = OrderedDict()
+        self.results_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'Dataset(rows={len(self.data)}, genres={len(self.genre_index)})'
+
+
+def load_dataset(movies_path: str, ratings_path: str, cache_dir: str = None, workers: int = 1, ops=None) -> Dataset:
+    """Read files and build dataset
+
+    Parameters
+    ----------
+    movies_path : str
+        File name of movies
+    ratings_path : str
+        File name of ratings
+    cache_dir : str, optional
+        Cache directory of parsed files, by default None (no cache)
+    workers : int, optional
+        Number of processes reading ratings file, by default 1
+    ops : module, optional
+        Backend from get_backend, by default python backend
+
+    Returns
+    -------
+    Dataset
+        New dataset
+    """
+    ops = ops or get_backend()
+    # version is taken before reading, so files changed while reading are reloaded again
+    version = get_files_version([movies_path, ratings_path])
+    movies, ratings = load_movies_and_ratings(movies_path, ratings_path, cache_dir, workers, ops)
+    data = ops.merged_data(movies, ratings, 'movieId')
+    return Dataset(data, version, ops)
+
+
+def parse_query(query_string: str) -> dict:
+    """Get arguments of query from URL query string
+
+    Parameters
+    ----------
+    query_string : str
+        URL query string, e.g. `topN=3&genres=Comedy`
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments like in movies.get_arguments
+
+    Raises
+    ------
+    ValueError
+        Unknown parameter or value of wrong type
+    """
+    args = dict.fromkeys(QUERY_PARAMETERS)
+    args['all_genres'] = False
+    for name, values in parse_qs(query_string, keep_blank_values=True).items():
+        if name not in QUERY_PARAMETERS:
+            raise ValueError(f'Unknown parameter `{name}`, expected one of {tuple(QUERY_PARAMETERS)}')
+        value = values[-1]
+        if QUERY_PARAMETERS[name] is bool:
+            args[name] = value.lower() not in ('', '0', 'false', 'no')
+        elif value != '':
+            args[name] = QUERY_PARAMETERS[name](value)
+    return args
+
+
+def query_dataset(dataset: Dataset, args: dict) -> str:
+    """Answer query in the same csv format as movies.py
+
+    Parameters
+    ----------
+    dataset : Dataset
+        Loaded dataset
+    args : dict
+        Dictionary of arguments from parse_query
+
+    Returns
+    -------
+    str
+        Result in csv format
+    """
+    if args.get('genres') or args.get('all_genres'):
+        data = filter_movies(dataset.data, args, dataset.ops, dataset.genre_index, dataset.title_index,
+                             dataset.year_index)
+        presorted = False
+    else:
+        data = filter_movies(dataset.by_rating, args, dataset.ops, dataset.by_rating_genre_index,
+                             dataset.by_rating_title_index, dataset.by_rating_year_index)
+        presorted = True
+    data, n_rows = select_top_rated(data, args, dataset.ops, presorted=presorted)
+
+    output = io.StringIO()
+    print_data_csv(data, n_rows=n_rows, file=output)
+    return output.getvalue()
+
+
+class MoviesDaemon:
+    """HTTP server which answers queries with warm dataset and reloads it
+    in background when source files change
+
+    Parameters
+    ----------
+    movies_path : str
+        File name of movies
+    ratings_path : str
+        File name of ratings
+    cache_dir : str, optional
+        Cache directory of parsed files, by default None (no cache)
+    workers : int, optional
+        Number of processes reading ratings file, by default 1
+    ops : module, optional
+        Backend from get_backend, by default python backend
+    reload_interval : float, optional
+        Seconds between checks of source files, 0 disables checks, by default 5
+    """
+
+    def __init__(self, movies_path: str, ratings_path: str, cache_dir: str = None, workers: int = 1, ops=None, reload_interval: float = 5):
+        self.movies_path = movies_path
+        self.ratings_path = ratings_path
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.ops = ops or get_backend()
+        self.reload_interval = reload_interval
+        self.dataset = None
+        self.server = None
+        self._reload_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.queries = 0
+        self.errors = 0
+        self.reloads = 0
+
+    def reload(self, force: bool = False) -> bool:
+        """Build new dataset if source files changed and replace current one.
+        Only one reload runs at a time, queries use old dataset meanwhile
+
+        Parameters
+        ----------
+        force : bool, optional
+            Flag to reload dataset even if files are unchanged, by default False
+
+        Returns
+        -------
+        bool
+            True if dataset was replaced
+        """
+        with self._reload_lock:
+            current = self.dataset
+            if (not force and current is not None
+                    and current.version == get_files_version([self.movies_path, self.ratings_path])):
+                return False
+            log.info('loading dataset')
+            dataset = load_dataset(self.movies_path, self.ratings_path, self.cache_dir, self.workers, self.ops)
+            self.dataset = dataset
+            self.reloads += 1
+            log.info(f'Done! {dataset}')
+            return True
+
+    def query(self, args: dict) -> str:
+        """Answer query with current dataset and record latency. Results of
+        RESULTS_CACHE_SIZE recent queries are reused
+
+        Parameters
+        ----------
+        args : dict
+            Dictionary of arguments from parse_query
+
+        Returns
+        -------
+        str
+            Result in csv format
+        """
+        time_start = time.perf_counter()
+        dataset = self.dataset
+        key = get_cache_key('daemon', args, dataset.version)
+        try:
+            with dataset.results_lock:
+                result = dataset.results.get(key)
+                if result is not None:
+                    dataset.results.move_to_end(key)
+                    return result
+            result = query_dataset(dataset, args)
+            with dataset.results_lock:
+                dataset.results[key] = result
+                if len(dataset.results) > RESULTS_CACHE_SIZE:
+                    dataset.results.popitem(last=False)
+            return result
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - time_start
+            with self._stats_lock:
+                self.queries += 1
+                self._latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        """Get loaded dataset, counters and latency percentiles in milliseconds
+
+        Returns
+        -------
+        dict
+            Statistics of daemon
+        """
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = {'queries': self.queries, 'errors': self.errors, 'reloads': self.reloads}
+        for name, q in (('p50_ms', 0.5), ('p90_ms', 0.9), ('p99_ms', 0.99)):
+            stats[name] = round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 3) if latencies else None
+        dataset = self.dataset
+        if dataset is not None:
+            stats['rows'] = len(dataset.data)
+            stats['loaded_at'] = dataset.loaded_at
+        return stats
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                log.exception(e)
+
+    def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """Load dataset and answer queries until shutdown is called
+
+        Parameters
+        ----------
+        host : str, optional
+            Host name to listen, by default DEFAULT_HOST
+        port : int, optional
+            Port to listen, by default DEFAULT_PORT
+        """
+        if self.dataset is None:
+            self.reload(force=True)
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.server.daemon_threads = True
+        if self.reload_interval:
+            threading.Thread(target=self._watch, name='reload', daemon=True).start()
+        log.info(f'listening on http://{host}:{self.server.server_port}')
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stopped.set()
+            self.server.server_close()
+
+    def shutdown(self) -> None:
+        """Stop answering queries"""
+        self._stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def _make_handler(daemon: MoviesDaemon):
+    """Create request handler class bound to daemon"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body are written separately, don't wait for ACK between them
+        disable_nagle_algorithm = True
+
+        def _send(self, code: int, body: str, content_type: str = 'text/plain') -> None:
+            payload = body.encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/movies':
+                try:
+                    args = parse_query(url.query)
+                except ValueError as e:
+                    return self._send(400, f'{e}\n')
+                try:
+                    return self._send(200, daemon.query(args), 'text/csv')
+                except Exception as e:
+                    log.exception(e)
+                    return self._send(500, f'{e}\n')
+            if url.path == '/stats':
+                return self._send(200, json.dumps(daemon.stats()) + '\n', 'application/json')
+            return self._send(404, 'Not found\n')
+
+        def do_POST(self):
+            if urlsplit(self.path).path == '/reload':
+                try:
+                    reloaded = daemon.reload()
+                except Exception as e:
+                    log.exception(e)
+                    return self._send(500, f'{e}\n')
+                return self._send(200, json.dumps({'reloaded': reloaded}) + '\n', 'application/json')
+            return self._send(404, 'Not found\n')
+
+        def log_message(self, format, *args):
+            log.debug(f'{self.address_string()} - {format % args}')
+
+    return Handler
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", type=str, default=DEFAULT_HOST,
+                    help=f"host name to listen (default: {DEFAULT_HOST})")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT,
+                    help=f"port to listen (default: {DEFAULT_PORT})")
+    ap.add_argument("--reload_interval", type=float, default=5,
+                    help="seconds between checks of data files, 0 disables reloads (default: 5)")
+    ap.add_argument("-w", "--workers", type=int, default=1,
+                    help="number of processes reading ratings file (default: 1)")
+    ap.add_argument("--cache_dir", type=str, default=CACHE_FOLDER_PATH,
+                    help=f"directory of cache of parsed data files (default: {CACHE_FOLDER_PATH})")
+    ap.add_argument("--no_cache", action='store_true',
+                    help="parse data files without reading and writing cache")
+    ap.add_argument("-b", "--backend", type=str, choices=BACKENDS, default='python',
+                    help="execution backend of queries, numpy requires numpy package (default: python)")
+
+    return vars(ap.parse_args())
+
+
+def main():
+    log.basicConfig(level=log.INFO,
+                    filename='log/daemon.log',
+                    filemode='w',
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
+                    datefmt='%H:%M:%S')
+    log.info('Start')
+
+    args = get_arguments()
+    log.debug(f'arguments: {args}')
+
+    daemon = MoviesDaemon(DATA_FOLDER_PATH + 'movies.csv', DATA_FOLDER_PATH + 'ratings.csv',
+                          None if args['no_cache'] else args['cache_dir'], args['workers'],
+                          get_backend(args['backend']), args['reload_interval'])
+    try:
+        daemon.serve_forever(args['host'], args['port'])
+    except KeyboardInterrupt:
+        log.info('Interrupted')
+    log.info('Finish')
+
+
+if __name__ == "__main__":
+    main()
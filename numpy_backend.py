@@ -0,0 +1,313 @@
+"""NumPy execution backend for movies.py
+
+This module contains vectorized versions of movies.py operators which
+work on columnar Table with whole-column NumPy operations. Results are
+materialized back to Table, so output of both backends is identical.
+
+NumPy is optional dependency, install it with `pip install numpy` to use
+`--backend numpy` option of movies.py.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * check_numpy - Raise ImportError if numpy package is not installed
+    * column_array - Get column of Table as NumPy array
+    * null_mask - Get boolean mask of null values of column
+    * get_sorted_data - Get sorted data by column and order
+    * get_groupped_data_from_file - Returns groupped data from file
+    * get_join_index - Get sorted order of keys of right table of join
+    * merged_data - Join two tables on unique key
+    * filtered_data_col_contains - Filter data in condition if column contains substring
+    * filtered_data_col_in_range - Filter data by slicing integer column
+"""
+
+
+# import the necessary packages
+import re
+from table import Table, Column
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NUMPY_DTYPES = {
+    'int16': 'int16',
+    'int32': 'int32',
+    'int64': 'int64',
+    'float32': 'float32',
+    'float64': 'float64',
+    'category': 'int32',
+}
+
+
+def check_numpy() -> None:
+    """Raise ImportError if numpy package is not installed"""
+    if np is None:
+        raise ImportError('NumPy backend requires numpy package, install it with `pip install numpy`')
+
+
+def column_array(data: Table, column: str):
+    """Get column of Table as NumPy array without copying data
+
+    Parameters
+    ----------
+    data : Table
+        Columnar data
+    column : str
+        Column name, must be numeric or category (codes are returned)
+
+    Returns
+    -------
+    numpy.ndarray
+        Column values
+    """
+    check_numpy()
+    col = data.column(column)
+    if col.dtype not in NUMPY_DTYPES:
+        raise TypeError(f'Column `{column}` of type `{col.dtype}` can`t be converted to array')
+    return np.frombuffer(col.data, dtype=NUMPY_DTYPES[col.dtype])
+
+
+def null_mask(data: Table, column: str):
+    """Get boolean mask of null values of column
+
+    Parameters
+    ----------
+    data : Table
+        Columnar data
+    column : str
+        Column name
+
+    Returns
+    -------
+    numpy.ndarray
+        True for null values
+    """
+    check_numpy()
+    col = data.column(column)
+    if col.nulls is None:
+        return np.zeros(len(col), dtype=bool)
+    return np.frombuffer(col.nulls, dtype=np.uint8).astype(bool)
+
+
+def get_sorted_data(data: Table, sort_by: str, reverse=True) -> Table:
+    """Get sorted data by column and order with stable argsort.
+    Nulls go first in ascending and last in descending order.
+
+    Parameters
+    ----------
+    data : Table
+        Columnar data
+    sort_by : str
+        Sort data by specific column
+    reverse : bool, optional
+        Flag to determinate order of sorting (False - asc, True - desc), by default True
+
+    Returns
+    -------
+    Table
+        Sorted data
+    """
+    values = column_array(data, sort_by)
+    nulls = null_mask(data, sort_by)
+    not_null = np.flatnonzero(~nulls)
+    keys = values[not_null]
+    if reverse:
+        # stable sort of negated keys keeps equal values in original order
+        order = not_null[np.argsort(-keys.astype(np.float64), kind='stable')]
+        order = np.concatenate((order, np.flatnonzero(nulls)))
+    else:
+        order = not_null[np.argsort(keys, kind='stable')]
+        order = np.concatenate((np.flatnonzero(nulls), order))
+
+    return data.take(order.tolist())
+
+
+def get_groupped_data_from_file(file_path: str, group_by: str, agg_col: str, delimiter: str = ',', workers: int = 1) -> Table:
+    """Returns groupped data with mean of aggregation column from file.
+    Means are computed with np.bincount over group codes. With several
+    workers file is aggregated by movies.get_groupped_data_from_file in
+    parallel, because parsing dominates time of this operation.
+
+    Parameters
+    ----------
+    file_path : str
+        File name to read
+    group_by : str
+        Group by column name, must be integer
+    agg_col : str
+        Aggregation column name
+    delimiter : str, optional
+        Delimiter of csv file, by default ','
+    workers : int, optional
+        Number of worker processes, by default 1
+
+    Returns
+    -------
+    Table
+        Data sorted by group_by column
+    """
+    # import here to avoid circular import with movies.py
+    from movies import read_csv_table, get_groupped_data_from_file as read_groupped
+
+    check_numpy()
+    if workers > 1:
+        groupped = Table.from_records(read_groupped(file_path, group_by, agg_col, delimiter, workers=workers),
+                                      {group_by: 'int32', agg_col: 'float64'})
+        return get_sorted_data(groupped, group_by, reverse=False)
+
+    raw = read_csv_table(file_path, {group_by: 'int32', agg_col: 'float64'}, delimiter=delimiter)
+    keys = column_array(raw, group_by)
+    values = column_array(raw, agg_col)
+
+    groups, codes = np.unique(keys, return_inverse=True)
+    counts = np.bincount(codes, minlength=len(groups))
+    sums = np.bincount(codes, weights=values, minlength=len(groups))
+    # python round keeps output identical to pure python backend
+    means = [round(v, 4) for v in (sums / counts).tolist()]
+
+    return Table({
+        group_by: Column.from_values(groups.tolist(), 'int32'),
+        agg_col: Column.from_values(means, 'float64'),
+    })
+
+
+def get_join_index(data: Table, join_on: str) -> tuple:
+    """Get right keys of join and their sort order, which can be reused by
+    merged_data for many left tables, e.g. chunks of streamed data
+
+    Parameters
+    ----------
+    data : Table
+        Right data
+    join_on : str
+        Common unique column key of two datasets
+
+    Returns
+    -------
+    tuple
+        Keys array and its argsort, None if keys are sorted
+    """
+    keys = column_array(data, join_on)
+    sorter = None
+    if len(keys) > 1 and not (keys[1:] >= keys[:-1]).all():
+        sorter = np.argsort(keys, kind='stable')
+    return keys, sorter
+
+
+def merged_data(data_left: Table, data_right: Table, join_on: str, how: str = 'left', index: tuple = None) -> Table:
+    """Join two tables on unique key with np.searchsorted. Right keys are
+    argsorted first if right table is not sorted by key
+
+    Parameters
+    ----------
+    data_left : Table
+        Left data
+    data_right : Table
+        Right data
+    join_on : str
+        Common unique column key of two datasets
+    how : str, optional
+        Join type: `inner`, `left` or `anti`, by default 'left'
+    index : tuple, optional
+        Right keys and their sort order from get_join_index, by default None
+
+    Returns
+    -------
+    Table
+        Merged data
+    """
+    keys_left = column_array(data_left, join_on)
+    keys_right, sorter = get_join_index(data_right, join_on) if index is None else index
+    positions = np.searchsorted(keys_right, keys_left, sorter=sorter)
+    found = positions < len(keys_right)
+    if sorter is not None:
+        positions[found] = sorter[positions[found]]
+    found[found] = keys_right[positions[found]] == keys_left[found]
+
+    if how == 'anti':
+        return data_left.take(np.flatnonzero(~found).tolist())
+    if how == 'inner':
+        rows_left = np.flatnonzero(found)
+        merged = data_left.take(rows_left.tolist())
+        indices = positions[rows_left].tolist()
+    else:
+        merged = data_left.take(range(len(data_left)))
+        indices = [p if f else None for p, f in zip(positions.tolist(), found.tolist())]
+
+    for name in data_right.columns:
+        if name != join_on:
+            merged.with_column(name, data_right.column(name).take(indices))
+    return merged
+
+
+def filtered_data_col_contains(data: Table, column: str, substring: str) -> Table:
+    """Filter data in condition if column contains substring.
+    RegEx is evaluated once per category for `category` columns.
+
+    Parameters
+    ----------
+    data : Table
+        Columnar data
+    column : str
+        Filtering column
+    substring : str
+        Substring of column value
+
+    Returns
+    -------
+    Table
+        Filtered data
+    """
+    check_numpy()
+    pattern = re.compile(substring)
+    col = data.column(column)
+    if col.categories is not None:
+        matched = np.fromiter((bool(pattern.search(c)) for c in col.categories),
+                              dtype=bool, count=len(col.categories))
+        mask = matched[column_array(data, column)]
+    else:
+        mask = np.fromiter((bool(pattern.search(v)) for v in col.data),
+                           dtype=bool, count=len(col))
+    mask &= ~null_mask(data, column)
+
+    return data.take(np.flatnonzero(mask).tolist())
+
+
+def filtered_data_col_in_range(data: Table, column: str, start=None, end=None) -> Table:
+    """Filter data by slicing integer column with boolean masks,
+    boundaries are included
+
+    Parameters
+    ----------
+    data : Table
+        Columnar data
+    column : str
+        Filtered data column
+    start : int, optional
+        Lower boundary of range, by default None
+    end : int, optional
+        Higher boundary of range, by default None
+
+    Returns
+    -------
+    Table
+        Filtered data, empty if start is greater than end
+    """
+    values = column_array(data, column)
+    mask = ~null_mask(data, column)
+
+    if start and end:
+        if start > end:
+            return data.take([])
+        mask &= (start <= values) & (values <= end)
+    elif start:
+        mask &= start <= values
+    elif end:
+        mask &= values <= end
+    else:
+        return data
+
+    return data.take(np.flatnonzero(mask).tolist())
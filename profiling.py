@@ -0,0 +1,348 @@
+"""Stage-level profiling of scripts
+
+This module measures named stages of pipeline: wall time, CPU time of
+process and its child processes, rows in and out, high-water mark of RSS
+of process at the end of stage and optionally peak of memory allocated by
+python during stage (tracemalloc). Measurements are
+collected only when profiling is enabled, otherwise stages cost one
+function call. Report is dumped in JSON format, one stage can also be
+profiled with cProfile.
+
+Example:
+    profiling.enable(trace_memory=True)
+    with profiling.stage('read_movies') as st:
+        movies = read_movies_table(path)
+        st.rows_out = len(movies)
+    profiling.write_report('-')
+
+This file can also be imported as a module and contains the following:
+
+    * Stage - Measurements of one stage
+    * Profiler - Collector of stage measurements
+    * enable - Enable profiling of stages
+    * get_profiler - Get current profiler
+    * stage - Context manager which measures stage
+    * timed - Decorator which measures every call of function as stage
+    * write_report - Write JSON report of current profiler
+    * add_arguments - Add profiling arguments to argument parser
+    * setup_from_arguments - Enable profiling from parsed arguments
+"""
+
+
+# import the necessary packages
+import os
+import sys
+import json
+import time
+import cProfile
+import resource
+import threading
+import functools
+import tracemalloc
+import logging as log
+from contextlib import contextmanager
+
+
+class Stage:
+    """Measurements of one stage, `rows_in` and `rows_out` are set by
+    measured code. `process_max_rss_kb` is peak RSS of whole process so far,
+    not of the stage, `traced_peak_kb` is peak of python memory during stage
+    including its nested and concurrent stages
+
+    Parameters
+    ----------
+    name : str
+        Stage name
+    rows_in : int, optional
+        Number of input rows, by default None
+    """
+
+    __slots__ = ('name', 'parent', 'rows_in', 'rows_out', 'wall_secs', 'cpu_secs',
+                 'children_cpu_secs', 'process_max_rss_kb', 'children_process_max_rss_kb', 'traced_peak_kb')
+
+    def __init__(self, name: str, rows_in: int = None):
+        self.name = name
+        self.parent = None
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_secs = None
+        self.cpu_secs = None
+        self.children_cpu_secs = None
+        self.process_max_rss_kb = None
+        self.children_process_max_rss_kb = None
+        self.traced_peak_kb = None
+
+    def to_dict(self) -> dict:
+        """Get measurements stored in dict"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _NullStage:
+    """Stage of disabled profiler, assigned values are ignored"""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """Collector of stage measurements
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Flag to measure stages, by default True
+    trace_memory : bool, optional
+        Flag to trace python allocations with tracemalloc, which slows
+        execution, by default False
+    cprofile_stage : str, optional
+        Name of stage profiled with cProfile, by default None
+    cprofile_path : str, optional
+        File name of cProfile stats, by default `<cprofile_stage>.prof`
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False, cprofile_stage: str = None, cprofile_path: str = None):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile_stage = cprofile_stage
+        self.cprofile_path = cprofile_path or (f'{cprofile_stage}.prof' if cprofile_stage else None)
+        self.stages = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # peak of traced memory of every open stage of all threads
+        self._traced_peaks = {}
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if enabled and trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """Measure stage
+
+        Parameters
+        ----------
+        name : str
+            Stage name
+        rows_in : int, optional
+            Number of input rows, by default None
+
+        Yields
+        -------
+        Stage
+            Measurements, set `rows_out` of it in measured code
+        """
+        if not self.enabled:
+            yield _NULL_STAGE
+            return
+
+        current = Stage(name, rows_in)
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        current.parent = stack[-1].name if stack else None
+        stack.append(current)
+
+        profile = None
+        if name == self.cprofile_stage:
+            profile = cProfile.Profile()
+        if self.trace_memory:
+            with self._lock:
+                self._update_traced_peaks()
+                self._traced_peaks[current] = tracemalloc.get_traced_memory()[0]
+        children_start = os.times()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield current
+        finally:
+            if profile is not None:
+                profile.disable()
+            current.wall_secs = round(time.perf_counter() - wall_start, 6)
+            current.cpu_secs = round(time.process_time() - cpu_start, 6)
+            children_end = os.times()
+            current.children_cpu_secs = round(abs(children_end.children_user + children_end.children_system
+                                                  - children_start.children_user - children_start.children_system), 6)
+            current.process_max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            current.children_process_max_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            if self.trace_memory:
+                with self._lock:
+                    self._update_traced_peaks()
+                    current.traced_peak_kb = self._traced_peaks.pop(current) // 1024
+            stack.pop()
+            with self._lock:
+                self.stages.append(current)
+            if profile is not None:
+                profile.dump_stats(self.cprofile_path)
+            log.debug(f'stage {current.to_dict()}')
+
+    def _update_traced_peaks(self) -> None:
+        """Add peak of traced memory since last reset to peaks of open stages
+        and reset it, so any stage can reset peak without losing peak of
+        its parent or concurrent stages. Must be called with lock"""
+        peak = tracemalloc.get_traced_memory()[1]
+        for open_stage, traced_peak in self._traced_peaks.items():
+            self._traced_peaks[open_stage] = max(traced_peak, peak)
+        tracemalloc.reset_peak()
+
+    def report(self) -> dict:
+        """Get report of all measured stages in order of their end
+
+        Returns
+        -------
+        dict
+            Report with `script`, `wall_secs`, `cpu_secs`, `max_rss_kb`
+            and `stages` keys
+        """
+        with self._lock:
+            stages = [s.to_dict() for s in self.stages]
+        report = {
+            'script': os.path.basename(sys.argv[0]),
+            'argv': sys.argv[1:],
+            'wall_secs': round(time.perf_counter() - self._wall_start, 6),
+            'cpu_secs': round(time.process_time() - self._cpu_start, 6),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'trace_memory': self.trace_memory,
+            'stages': stages,
+        }
+        if self.cprofile_stage:
+            report['cprofile'] = {'stage': self.cprofile_stage, 'path': self.cprofile_path}
+        return report
+
+
+_profiler = Profiler(enabled=False)
+
+
+def enable(trace_memory: bool = False, cprofile_stage: str = None, cprofile_path: str = None) -> Profiler:
+    """Enable profiling of stages with new current profiler
+
+    Parameters
+    ----------
+    trace_memory : bool, optional
+        Flag to trace python allocations with tracemalloc, by default False
+    cprofile_stage : str, optional
+        Name of stage profiled with cProfile, by default None
+    cprofile_path : str, optional
+        File name of cProfile stats, by default `<cprofile_stage>.prof`
+
+    Returns
+    -------
+    Profiler
+        Current profiler
+    """
+    global _profiler
+    _profiler = Profiler(True, trace_memory, cprofile_stage, cprofile_path)
+    return _profiler
+
+
+def get_profiler() -> Profiler:
+    """Get current profiler"""
+    return _profiler
+
+
+def stage(name: str, rows_in: int = None):
+    """Context manager which measures stage with current profiler
+
+    Parameters
+    ----------
+    name : str
+        Stage name
+    rows_in : int, optional
+        Number of input rows, by default None
+
+    Returns
+    -------
+    contextmanager
+        Context manager yielding Stage
+    """
+    return _profiler.stage(name, rows_in)
+
+
+def timed(name: str = None):
+    """Decorator which measures every call of function as stage. Number of
+    output rows is returned int or length of returned list or table
+
+    Parameters
+    ----------
+    name : str, optional
+        Stage name, by default name of function
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+            with _profiler.stage(stage_name) as current:
+                result = func(*args, **kwargs)
+                if isinstance(result, int) and not isinstance(result, bool):
+                    current.rows_out = result
+                elif hasattr(result, '__len__') and not isinstance(result, (dict, str)):
+                    current.rows_out = len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def write_report(file_path: str = '-') -> dict:
+    """Write JSON report of current profiler
+
+    Parameters
+    ----------
+    file_path : str, optional
+        File name of report, `-` for stderr, by default '-'
+
+    Returns
+    -------
+    dict
+        Written report
+    """
+    report = _profiler.report()
+    if file_path == '-':
+        print(json.dumps(report), file=sys.stderr)
+    else:
+        with open(file_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def add_arguments(ap) -> None:
+    """Add `--profile`, `--profile_memory` and `--cprofile` arguments to argument parser
+
+    Parameters
+    ----------
+    ap : argparse.ArgumentParser
+        Argument parser of script
+    """
+    ap.add_argument("--profile", type=str, nargs='?', const='-',
+                    help="write JSON report of time and memory of every stage to file, stderr if file is omitted")
+    ap.add_argument("--profile_memory", action='store_true',
+                    help="trace peak of python memory of every stage with tracemalloc, slows execution")
+    ap.add_argument("--cprofile", type=str, metavar='STAGE',
+                    help="profile one stage with cProfile and save stats to log/<STAGE>.prof")
+
+
+def setup_from_arguments(args: dict) -> Profiler:
+    """Enable profiling if `--profile` argument is given
+
+    Parameters
+    ----------
+    args : dict
+        Dictionary of arguments with keys added by add_arguments
+
+    Returns
+    -------
+    Profiler
+        Current profiler
+    """
+    if args.get('profile') or args.get('cprofile'):
+        cprofile_path = f"log/{args['cprofile']}.prof" if args.get('cprofile') else None
+        return enable(args.get('profile_memory', False), args.get('cprofile'), cprofile_path)
+    return _profiler
@@ -0,0 +1,769 @@
+"""Lazy query plans of movies pipeline
+
+Query is built as chain of operations and nothing is read until it is
+collected:
+
+    query = (scan('movies')
+             .filter(in_range('year', 1990, 2000))
+             .filter(contains('title', 'love'))
+             .join(scan('ratings').aggregate('movieId', 'rating'), on='movieId')
+             .top_n_per('genres', 5))
+    data = query.collect()
+
+Logical plan is optimized before execution:
+
+    * predicate pushdown - filters are moved below joins, sorts and
+      projections into csv scan, which applies them to every chunk of
+      rows, so rejected rows are never stored
+    * projection pushdown - scans read only columns used by query
+    * semi-join reduction - ratings are aggregated only for keys which
+      are left after filters of other side of join
+
+Functions of movies.py are physical operators of plan, sort, merge and
+filters are taken from backend (see movies.get_backend).
+
+Plan can also be executed in streaming mode (Query.stream): chunks of
+scanned rows flow through filters and joins one by one and only blocking
+operators keep state - aggregate keeps running state per group, sort with
+limit and top N per genre keep only candidate rows. Memory is bounded by
+aggregate state instead of size of files, unless plan sorts all rows.
+
+This file can also be imported as a module and contains the following:
+
+    * SOURCES - File names and schemas of datasets
+    * Predicate - Filter condition on one column
+    * in_range - Get predicate of integer column in range
+    * contains - Get predicate of column matching RegEx
+    * has_any - Get predicate of multi-valued column with any of categories
+    * Scan, Filter, Aggregate, Join, Sort, TopNPer, Limit, Project - Plan nodes
+    * Query - Lazy query
+    * scan - Start query with scan of dataset
+    * optimize - Get optimized plan
+    * explain - Get plan as indented text
+    * execute - Execute plan and get data
+    * execute_stream - Execute plan and yield data by chunks
+"""
+
+
+# import the necessary packages
+import os
+import copy
+import logging as log
+from table import Table, Column
+from dataset_cache import cached_table
+import profiling
+import movies
+from movies import (read_csv_chunks, read_movies_table, read_ratings_summary_table, get_mean_ratings_table,
+                    split_year_from_title, get_groupped_data_from_file, get_groupped_data, get_sorted_data,
+                    filtered_data_col_has_any, get_top_n_per_genre, sliced_data, data_info,
+                    get_backend, MOVIES_TABLE_SCHEMA, RATINGS_SCHEMA)
+
+
+SOURCES = {
+    'movies': ('movies.csv', MOVIES_TABLE_SCHEMA),
+    'ratings': ('ratings.csv', RATINGS_SCHEMA),
+}
+# columns of movies computed from other columns of file
+DERIVED_COLUMNS = {'movies': {'year': 'title'}}
+# cheaper predicates are evaluated first
+PREDICATE_COSTS = {'has_any': 0, 'in_range': 1, 'contains': 2}
+TOP_RATED_COLUMNS = ('rating', 'year', 'title')
+CHUNK_SIZE = 8192
+# column of row positions used by streaming top N operators
+POSITION_COLUMN = '__position'
+
+
+class Predicate:
+    """Filter condition on one column, evaluated by filter functions of
+    movies.py
+
+    Parameters
+    ----------
+    kind : str
+        Condition from PREDICATE_COSTS
+    column : str
+        Filtered column
+    args : tuple
+        Arguments of filter function after column
+    """
+
+    __slots__ = ('kind', 'column', 'args')
+
+    def __init__(self, kind: str, column: str, *args):
+        if kind not in PREDICATE_COSTS:
+            raise ValueError(f'Unknown predicate `{kind}`, expected one of {tuple(PREDICATE_COSTS)}')
+        self.kind = kind
+        self.column = column
+        self.args = args
+
+    def apply(self, data: Table, ops=None) -> Table:
+        """Get rows of data which satisfy condition
+
+        Parameters
+        ----------
+        data : Table
+            Data with column of predicate
+        ops : module, optional
+            Backend from movies.get_backend, by default python backend
+
+        Returns
+        -------
+        Table
+            Filtered data
+        """
+        ops = ops or get_backend()
+        if self.kind == 'has_any':
+            return filtered_data_col_has_any(data, self.column, *self.args)
+        if self.kind == 'in_range':
+            return ops.filtered_data_col_in_range(data, self.column, *self.args)
+        return ops.filtered_data_col_contains(data, self.column, *self.args)
+
+    def __repr__(self) -> str:
+        return f'{self.kind}({self.column}, {", ".join(map(repr, self.args))})'
+
+
+def in_range(column: str, start: int = None, end: int = None) -> Predicate:
+    """Get predicate of integer column in range, see movies.filtered_data_col_in_range"""
+    return Predicate('in_range', column, start, end)
+
+
+def contains(column: str, pattern: str) -> Predicate:
+    """Get predicate of column matching RegEx, see movies.filtered_data_col_contains"""
+    return Predicate('contains', column, pattern)
+
+
+def has_any(column: str, categories: list, delimiter: str = '|') -> Predicate:
+    """Get predicate of multi-valued column with any of categories, see
+    movies.filtered_data_col_has_any"""
+    return Predicate('has_any', column, list(categories), delimiter)
+
+
+class Node:
+    """Node of logical plan"""
+
+    def columns_out(self) -> list:
+        """Get output columns of node"""
+        return self.children[0].columns_out()
+
+    def replace(self, **kwargs) -> 'Node':
+        """Get copy of node with replaced attributes"""
+        node = copy.copy(self)
+        for name, value in kwargs.items():
+            setattr(node, name, value)
+        return node
+
+    def with_children(self, children: list) -> 'Node':
+        """Get copy of node with replaced children"""
+        return self.replace(child=children[0])
+
+    @property
+    def children(self) -> tuple:
+        return (self.child,)
+
+
+class Scan(Node):
+    """Read dataset file, only `columns` are kept and only rows which
+    satisfy all `predicates`"""
+
+    def __init__(self, source: str, path: str, columns: list = None, predicates: tuple = ()):
+        self.source = source
+        self.path = path
+        self.schema = SOURCES[source][1]
+        self.columns = list(columns) if columns else list(self.schema)
+        self.predicates = tuple(predicates)
+
+    @property
+    def children(self) -> tuple:
+        return ()
+
+    def columns_out(self) -> list:
+        return self.columns
+
+    def __repr__(self) -> str:
+        where = f' where {" and ".join(map(repr, self.predicates))}' if self.predicates else ''
+        return f'Scan {self.source} {self.columns}{where}'
+
+
+class Filter(Node):
+    """Keep rows which satisfy predicate"""
+
+    def __init__(self, child: Node, predicate: Predicate):
+        self.child = child
+        self.predicate = predicate
+
+    def __repr__(self) -> str:
+        return f'Filter {self.predicate}'
+
+
+class Aggregate(Node):
+    """Group rows by column and aggregate other column"""
+
+    def __init__(self, child: Node, group_by: str, column: str, agg_function: str = 'mean'):
+        self.child = child
+        self.group_by = group_by
+        self.column = column
+        self.agg_function = agg_function
+
+    def columns_out(self) -> list:
+        return [self.group_by, self.column]
+
+    def __repr__(self) -> str:
+        return f'Aggregate {self.agg_function}({self.column}) by {self.group_by}'
+
+
+class Join(Node):
+    """Join right data to left data on unique key, with `semi_join` right
+    side is computed only for keys of left side"""
+
+    def __init__(self, left: Node, right: Node, on: str, how: str = 'left', semi_join: bool = False):
+        self.left = left
+        self.right = right
+        self.on = on
+        self.how = how
+        self.semi_join = semi_join
+
+    @property
+    def children(self) -> tuple:
+        return (self.left, self.right)
+
+    def with_children(self, children: list) -> 'Node':
+        return self.replace(left=children[0], right=children[1])
+
+    def columns_out(self) -> list:
+        return self.left.columns_out() + [c for c in self.right.columns_out() if c != self.on]
+
+    def __repr__(self) -> str:
+        return f'Join {self.how} on {self.on}' + (' (semi-join keys to right)' if self.semi_join else '')
+
+
+class Sort(Node):
+    """Sort rows by column"""
+
+    def __init__(self, child: Node, by: str, reverse: bool = True):
+        self.child = child
+        self.by = by
+        self.reverse = reverse
+
+    def __repr__(self) -> str:
+        return f'Sort {self.by} {"desc" if self.reverse else "asc"}'
+
+
+class TopNPer(Node):
+    """Get top N rated rows for each category of multi-valued column"""
+
+    def __init__(self, child: Node, column: str, n: int = None, categories: list = None):
+        self.child = child
+        self.column = column
+        self.n = n
+        self.categories = categories
+
+    def __repr__(self) -> str:
+        return f'TopNPer {self.column} n={self.n} categories={self.categories or "all"}'
+
+
+class Limit(Node):
+    """Keep first n rows"""
+
+    def __init__(self, child: Node, n: int):
+        self.child = child
+        self.n = n
+
+    def __repr__(self) -> str:
+        return f'Limit {self.n}'
+
+
+class Project(Node):
+    """Keep columns in given order"""
+
+    def __init__(self, child: Node, columns: list):
+        self.child = child
+        self.columns = list(columns)
+
+    def columns_out(self) -> list:
+        return self.columns
+
+    def __repr__(self) -> str:
+        return f'Project {self.columns}'
+
+
+class Query:
+    """Lazy query, every method returns new query with one more operation
+
+    Parameters
+    ----------
+    node : Node
+        Root of logical plan
+    """
+
+    def __init__(self, node: Node):
+        self.node = node
+
+    def filter(self, predicate: Predicate) -> 'Query':
+        return Query(Filter(self.node, predicate))
+
+    def select(self, *columns) -> 'Query':
+        return Query(Project(self.node, columns))
+
+    def aggregate(self, group_by: str, column: str, agg_function: str = 'mean') -> 'Query':
+        return Query(Aggregate(self.node, group_by, column, agg_function))
+
+    def join(self, other: 'Query', on: str, how: str = 'left') -> 'Query':
+        return Query(Join(self.node, other.node, on, how))
+
+    def sort(self, by: str, reverse: bool = True) -> 'Query':
+        return Query(Sort(self.node, by, reverse))
+
+    def top_n_per(self, column: str, n: int = None, categories: list = None) -> 'Query':
+        return Query(TopNPer(self.node, column, n, categories))
+
+    def limit(self, n: int) -> 'Query':
+        return Query(Limit(self.node, n))
+
+    def plan(self) -> Node:
+        """Get optimized plan"""
+        return optimize(self.node)
+
+    def explain(self) -> str:
+        """Get optimized plan as indented text"""
+        return explain(self.plan())
+
+    def collect(self, ops=None, cache_dir: str = None, workers: int = 1) -> Table:
+        """Optimize and execute query
+
+        Parameters
+        ----------
+        ops : module, optional
+            Backend from movies.get_backend, by default python backend
+        cache_dir : str, optional
+            Cache directory of parsed files, by default None (files are
+            scanned without cache)
+        workers : int, optional
+            Number of processes aggregating file, by default 1
+
+        Returns
+        -------
+        Table
+            Result of query
+        """
+        return execute(self.plan(), ops, cache_dir, workers)
+
+    def stream(self, ops=None, cache_dir: str = None, workers: int = 1):
+        """Optimize and execute query in streaming mode
+
+        Parameters
+        ----------
+        ops : module, optional
+            Backend from movies.get_backend, by default python backend
+        cache_dir : str, optional
+            Cache directory of aggregated files, by default None
+        workers : int, optional
+            Number of processes aggregating file, by default 1
+
+        Yields
+        -------
+        Table
+            Chunks of result of query
+        """
+        return execute_stream(self.plan(), ops, cache_dir, workers)
+
+
+def scan(source: str, path: str = None) -> Query:
+    """Start query with scan of dataset
+
+    Parameters
+    ----------
+    source : str
+        Dataset name from SOURCES
+    path : str, optional
+        File name, by default file of source in movies.DATA_FOLDER_PATH
+
+    Returns
+    -------
+    Query
+        New query
+    """
+    if source not in SOURCES:
+        raise ValueError(f'Unknown source `{source}`, expected one of {tuple(SOURCES)}')
+    return Query(Scan(source, path or os.path.join(movies.DATA_FOLDER_PATH, SOURCES[source][0])))
+
+
+def _push_predicate(node: Node, predicate: Predicate):
+    """Get node with predicate moved as deep as possible, None if
+    predicate can't be moved below node"""
+    if isinstance(node, Scan):
+        if predicate.column in node.schema:
+            return node.replace(predicates=node.predicates + (predicate,))
+        return None
+
+    if isinstance(node, (Filter, Sort)) or (isinstance(node, Project) and predicate.column in node.columns):
+        child = _push_predicate(node.child, predicate)
+    elif isinstance(node, Aggregate) and predicate.column == node.group_by:
+        child = _push_predicate(node.child, predicate)
+    elif isinstance(node, Join):
+        right_columns = node.right.columns_out()
+        if predicate.column in node.left.columns_out() and (predicate.column == node.on
+                                                            or predicate.column not in right_columns):
+            left = _push_predicate(node.left, predicate)
+            return node.with_children([left, node.right]) if left is not None else None
+        if node.how == 'inner' and predicate.column in right_columns:
+            right = _push_predicate(node.right, predicate)
+            return node.with_children([node.left, right]) if right is not None else None
+        return None
+    else:
+        # limit and top N change result if filter is moved below them
+        return None
+
+    return node.with_children([child]) if child is not None else None
+
+
+def _push_predicates(node: Node) -> Node:
+    if node.children:
+        node = node.with_children([_push_predicates(c) for c in node.children])
+    if isinstance(node, Filter):
+        pushed = _push_predicate(node.child, node.predicate)
+        if pushed is not None:
+            return pushed
+    return node
+
+
+def _prune_columns(node: Node, required: set) -> Node:
+    """Get node which reads only required columns"""
+    if isinstance(node, Scan):
+        required = required | {p.column for p in node.predicates}
+        return node.replace(columns=[c for c in node.schema if c in required])
+    if isinstance(node, Join):
+        keys = {node.on}
+        left = _prune_columns(node.left, (required & set(node.left.columns_out())) | keys)
+        right = _prune_columns(node.right, (required & set(node.right.columns_out())) | keys)
+        return node.with_children([left, right])
+
+    if isinstance(node, Project):
+        required = set(node.columns)
+    elif isinstance(node, Filter):
+        required = required | {node.predicate.column}
+    elif isinstance(node, Sort):
+        required = required | {node.by}
+    elif isinstance(node, TopNPer):
+        required = required | {node.column, *TOP_RATED_COLUMNS}
+    elif isinstance(node, Aggregate):
+        required = {node.group_by, node.column}
+    return node.with_children([_prune_columns(node.child, required)])
+
+
+def _is_filtered(node: Node) -> bool:
+    """Check if node can return less rows than its source"""
+    if isinstance(node, Scan):
+        return bool(node.predicates)
+    if isinstance(node, (Filter, Limit, TopNPer)) or (isinstance(node, Join) and node.how != 'left'):
+        return True
+    return any(_is_filtered(c) for c in node.children)
+
+
+def _reduce_joins(node: Node) -> Node:
+    if node.children:
+        node = node.with_children([_reduce_joins(c) for c in node.children])
+    if (isinstance(node, Join) and isinstance(node.right, Aggregate)
+            and node.right.group_by == node.on and _is_filtered(node.left)):
+        node = node.replace(semi_join=True)
+    return node
+
+
+def optimize(node: Node) -> Node:
+    """Get optimized plan with pushed down predicates and projections and
+    semi-join reduction of aggregated right sides of joins
+
+    Parameters
+    ----------
+    node : Node
+        Root of logical plan
+
+    Returns
+    -------
+    Node
+        Root of optimized plan
+    """
+    node = _push_predicates(node)
+    node = _prune_columns(node, set(node.columns_out()))
+    return _reduce_joins(node)
+
+
+def explain(node: Node, depth: int = 0) -> str:
+    """Get plan as indented text, one node per line
+
+    Parameters
+    ----------
+    node : Node
+        Root of plan
+    depth : int, optional
+        Indentation level of root, by default 0
+
+    Returns
+    -------
+    str
+        Text of plan
+    """
+    lines = ['  ' * depth + repr(node)]
+    lines.extend(explain(c, depth + 1) for c in node.children)
+    return '\n'.join(lines)
+
+
+class _Context:
+    """Options of plan execution"""
+
+    def __init__(self, ops, cache_dir: str, workers: int, streaming: bool = False):
+        self.ops = ops
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.streaming = streaming
+
+
+def _filtered(data: Table, predicates: list, ops) -> Table:
+    for predicate in predicates:
+        if not len(data):
+            break
+        data = predicate.apply(data, ops)
+    return data
+
+
+def _projected(data: Table, columns: list) -> Table:
+    if data.columns == columns:
+        return data
+    return Table({name: data.column(name) for name in columns})
+
+
+def _execute_scan(node: Scan, ctx: _Context) -> Table:
+    predicates = sorted(node.predicates, key=lambda p: PREDICATE_COSTS[p.kind])
+    log.info(f'reading {os.path.basename(node.path)}: {node}')
+    with profiling.stage(f'read_{node.source}') as st:
+        if ctx.cache_dir is not None and node.source == 'movies':
+            data = cached_table(ctx.cache_dir, 'movies', [node.path],
+                                lambda: read_movies_table(node.path))
+            data = _projected(_filtered(data, predicates, ctx.ops), node.columns)
+        else:
+            data = Table({c: Column(node.schema[c]) for c in node.columns})
+            for chunk in _scan_chunks(node, predicates, ctx):
+                if not len(data):
+                    data = chunk
+                else:
+                    data.extend(chunk)
+        st.rows_out = len(data)
+    return data
+
+
+def _scan_chunks(node: Scan, predicates: list, ctx: _Context):
+    """Yield filtered chunks of csv file"""
+    # derived columns are computed from columns of file after every chunk is read
+    derived = DERIVED_COLUMNS.get(node.source, {})
+    needed = set(node.columns) | {derived[c] for c in node.columns if c in derived}
+    schema = {c: t for c, t in node.schema.items() if c in needed and c not in derived}
+    for chunk in read_csv_chunks(node.path, schema, CHUNK_SIZE):
+        if node.source == 'movies' and 'title' in schema:
+            chunk = split_year_from_title(chunk)
+        yield _projected(_filtered(chunk, predicates, ctx.ops), node.columns)
+
+
+def _execute_aggregate(node: Aggregate, ctx: _Context, keys: set = None) -> Table:
+    child = node.child
+    schema = {node.group_by: child.schema[node.group_by] if isinstance(child, Scan) else 'str',
+              node.column: 'float64'}
+    is_mean_rating = (node.group_by, node.column, node.agg_function) == ('movieId', 'rating', 'mean')
+    log.info(f'aggregating {node}' + (f' for {len(keys)} keys' if keys is not None else ''))
+
+    if not isinstance(child, Scan) or child.predicates:
+        data = _execute(child, ctx)
+        with profiling.stage('aggregate', len(data)) as st:
+            data = get_groupped_data(get_sorted_data(data, node.group_by, reverse=False),
+                                     node.group_by, node.column, node.agg_function)
+            data = Table.from_records(data, schema)
+            st.rows_out = len(data)
+        return data
+
+    with profiling.stage(f'read_{child.source}') as st:
+        if ctx.cache_dir is not None and child.source == 'ratings' and is_mean_rating:
+            summary = cached_table(ctx.cache_dir, 'ratings_summary', [child.path],
+                                   lambda: read_ratings_summary_table(child.path, ctx.workers))
+            data = get_mean_ratings_table(summary)
+        elif keys is None and node.agg_function == 'mean' and not ctx.streaming:
+            data = ctx.ops.get_groupped_data_from_file(child.path, node.group_by, node.column,
+                                                       workers=ctx.workers)
+        else:
+            data = get_groupped_data_from_file(child.path, node.group_by, node.column,
+                                               agg_function=node.agg_function, workers=ctx.workers, keys=keys)
+        if not isinstance(data, Table):
+            data = Table.from_records(data, schema)
+        st.rows_out = len(data)
+    return data
+
+
+def _execute(node: Node, ctx: _Context) -> Table:
+    if isinstance(node, Scan):
+        data = _execute_scan(node, ctx)
+    elif isinstance(node, Aggregate):
+        data = _execute_aggregate(node, ctx)
+    elif isinstance(node, Join):
+        left = _execute(node.left, ctx)
+        if node.semi_join:
+            keys = {str(k) for k in left.column(node.on)}
+            right = _execute_aggregate(node.right, ctx, keys)
+        else:
+            right = _execute(node.right, ctx)
+        log.info(f'merging data: {node}')
+        with profiling.stage('merge', len(left)) as st:
+            data = ctx.ops.merged_data(left, right, node.on, how=node.how)
+            st.rows_out = len(data)
+    else:
+        data = _execute(node.child, ctx)
+        log.info(f'executing {node}')
+        if isinstance(node, Filter):
+            with profiling.stage(f'filter_{node.predicate.column}', len(data)) as st:
+                data = node.predicate.apply(data, ctx.ops)
+                st.rows_out = len(data)
+        elif isinstance(node, Sort):
+            with profiling.stage('sort', len(data)) as st:
+                data = ctx.ops.get_sorted_data(data, node.by, reverse=node.reverse)
+                st.rows_out = len(data)
+        elif isinstance(node, TopNPer):
+            with profiling.stage('top_n_per_genre', len(data)) as st:
+                data = get_top_n_per_genre(data, node.n, node.categories, node.column)
+                st.rows_out = len(data)
+        elif isinstance(node, Limit):
+            data = sliced_data(data, end=node.n)
+        elif isinstance(node, Project):
+            data = _projected(data, node.columns)
+    log.info('Done!')
+    log.debug(data_info(data))
+    return data
+
+
+def execute(node: Node, ops=None, cache_dir: str = None, workers: int = 1) -> Table:
+    """Execute plan with functions of movies.py and backend
+
+    Parameters
+    ----------
+    node : Node
+        Root of plan, see optimize
+    ops : module, optional
+        Backend from movies.get_backend, by default python backend
+    cache_dir : str, optional
+        Cache directory of parsed files, by default None (files are
+        scanned without cache)
+    workers : int, optional
+        Number of processes aggregating file, by default 1
+
+    Returns
+    -------
+    Table
+        Result of plan
+    """
+    return _execute(node, _Context(ops or get_backend(), cache_dir, workers))
+
+
+def _concatenated(chunks) -> Table:
+    data = None
+    for chunk in chunks:
+        if data is None:
+            data = chunk.empty_like()
+        data.extend(chunk)
+    return data
+
+
+def _stream_top(chunks, select) -> Table:
+    """Get result of blocking top N operator keeping only candidate rows.
+    `select` gets table in original order of rows and returns its best rows,
+    rows which are not selected from candidates and new chunk are dropped"""
+    pool = None
+    offset = 0
+    for chunk in chunks:
+        chunk.with_column(POSITION_COLUMN, Column.from_values(range(offset, offset + len(chunk)), 'int64'))
+        offset += len(chunk)
+        if pool is None:
+            data = chunk
+        else:
+            data = pool
+            data.extend(chunk)
+        # candidates are kept in original order, so ties are broken like in one pass
+        selected = set(select(data).column(POSITION_COLUMN))
+        pool = data.take(i for i, pos in enumerate(data.column(POSITION_COLUMN)) if pos in selected)
+
+    if pool is None:
+        return None
+    data = select(pool)
+    return _projected(data, [c for c in data.columns if c != POSITION_COLUMN])
+
+
+def _stream(node: Node, ctx: _Context):
+    """Yield chunks of result of node"""
+    if isinstance(node, Scan):
+        predicates = sorted(node.predicates, key=lambda p: PREDICATE_COSTS[p.kind])
+        log.info(f'streaming {os.path.basename(node.path)}: {node}')
+        yield from _scan_chunks(node, predicates, ctx)
+    elif isinstance(node, Aggregate):
+        yield _execute_aggregate(node, ctx)
+    elif isinstance(node, Join):
+        # keys of semi-join are unknown until left side is read, so all groups are aggregated
+        right = _execute(node.right, ctx)
+        # right keys are hashed or sorted once and probed by every chunk
+        index = ctx.ops.get_join_index(right, node.on)
+        log.info(f'merging data by chunks: {node}')
+        for chunk in _stream(node.left, ctx):
+            yield ctx.ops.merged_data(chunk, right, node.on, how=node.how, index=index)
+    elif isinstance(node, (Filter, Project)):
+        for chunk in _stream(node.child, ctx):
+            if isinstance(node, Filter):
+                yield node.predicate.apply(chunk, ctx.ops)
+            else:
+                yield _projected(chunk, node.columns)
+    elif isinstance(node, Limit) and isinstance(node.child, Sort):
+        sort = node.child
+        log.info(f'executing {node} of {sort}')
+        data = _stream_top(_stream(sort.child, ctx), lambda data: sliced_data(
+            ctx.ops.get_sorted_data(data, sort.by, reverse=sort.reverse), end=node.n))
+        if data is not None:
+            yield data
+    elif isinstance(node, Limit):
+        remaining = node.n
+        for chunk in _stream(node.child, ctx):
+            if len(chunk) >= remaining:
+                # rest of input is not read
+                yield sliced_data(chunk, end=remaining)
+                return
+            remaining -= len(chunk)
+            yield chunk
+    elif isinstance(node, TopNPer):
+        log.info(f'executing {node}')
+        data = _stream_top(_stream(node.child, ctx), lambda data: get_top_n_per_genre(
+            data, node.n, node.categories, node.column))
+        if data is not None:
+            yield data
+    elif isinstance(node, Sort):
+        log.info(f'executing {node}')
+        data = _concatenated(_stream(node.child, ctx))
+        if data is not None:
+            yield ctx.ops.get_sorted_data(data, node.by, reverse=node.reverse)
+
+
+def execute_stream(node: Node, ops=None, cache_dir: str = None, workers: int = 1):
+    """Execute plan in streaming mode, rows are read and filtered by chunks
+    and only aggregates and top N operators keep state
+
+    Parameters
+    ----------
+    node : Node
+        Root of plan, see optimize
+    ops : module, optional
+        Backend from movies.get_backend, by default python backend
+    cache_dir : str, optional
+        Cache directory of aggregated files, by default None (files are
+        aggregated without cache)
+    workers : int, optional
+        Number of processes aggregating file, by default 1
+
+    Yields
+    -------
+    Table
+        Chunks of result of plan, empty chunks are skipped
+    """
+    ctx = _Context(ops or get_backend(), cache_dir, workers, streaming=True)
+    for chunk in _stream(node, ctx):
+        if len(chunk):
+            yield chunk
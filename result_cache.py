@@ -0,0 +1,368 @@
+"""Persistent cache of query results
+
+This module stores printed csv results of movies.py and movies-client.py
+on disk, so repeated queries with the same arguments don't run the
+pipeline or stored procedure again. Key of result is hash of entry point
+name, normalized query arguments and version of dataset:
+
+    * movies.py - size and modification time of csv files
+    * movies-client.py - version of database, which is changed by
+      import_to_db.py after every load of data
+
+Cache is bounded by total size of results with least recently used
+eviction, results older than TTL are never returned. Hit and miss counters
+are stored with cache index.
+
+Layout of cache:
+
+    <cache_dir>/index.json   - entries, last access time and counters
+    <cache_dir>/<key>.csv    - cached result
+    <cache_dir>/db_version   - version of database
+
+Run this file as a script to print counters or clear cache.
+
+This file can also be imported as a module and contains the following:
+
+    * RESULT_CACHE_PATH - Default cache directory
+    * QUERY_ARGUMENTS - Names of arguments which determinate query result
+    * get_files_version - Get version of dataset from csv files
+    * get_db_version - Get version of database data
+    * bump_db_version - Change version of database data
+    * get_cache_key - Get key of query result
+    * ResultCache - Size-bounded LRU cache of results with TTL
+    * get_arguments - Construct the argument parser and get the arguments
+    * main - the main function of the script
+"""
+
+
+# import the necessary packages
+import os
+import json
+import time
+import fcntl
+import hashlib
+import argparse
+import logging as log
+from contextlib import contextmanager
+from dataset_cache import get_file_fingerprint
+
+
+RESULT_CACHE_PATH = 'cache/results/'
+RESULT_CACHE_MAX_BYTES = 64 << 20
+RESULT_CACHE_TTL = 24 * 60 * 60
+QUERY_ARGUMENTS = ('topN', 'genres', 'all_genres', 'year_from', 'year_to', 'regexp')
+DB_VERSION_FILE = 'db_version'
+
+
+def get_files_version(sources: list) -> str:
+    """Get version of dataset from size and modification time of files
+
+    Parameters
+    ----------
+    sources : list
+        Source file names
+
+    Returns
+    -------
+    str
+        Version of dataset
+    """
+    fingerprints = {}
+    for path in sources:
+        fingerprint = get_file_fingerprint(path, with_hash=False)
+        fingerprints[os.path.abspath(path)] = (fingerprint['size'], fingerprint['mtime_ns'])
+    return json.dumps(fingerprints, sort_keys=True)
+
+
+def get_db_version(cache_dir: str = RESULT_CACHE_PATH) -> str:
+    """Get version of database data, '0' if data was never imported
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Cache directory, by default RESULT_CACHE_PATH
+
+    Returns
+    -------
+    str
+        Version of database data
+    """
+    try:
+        with open(os.path.join(cache_dir, DB_VERSION_FILE)) as f:
+            return f.read().strip() or '0'
+    except OSError:
+        return '0'
+
+
+def bump_db_version(cache_dir: str = RESULT_CACHE_PATH) -> str:
+    """Change version of database data, so all cached results of
+    database queries are invalidated
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Cache directory, by default RESULT_CACHE_PATH
+
+    Returns
+    -------
+    str
+        New version of database data
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    version = str(time.time_ns())
+    path = os.path.join(cache_dir, DB_VERSION_FILE)
+    tmp_path = path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+
+def get_cache_key(namespace: str, args: dict, version: str) -> str:
+    """Get key of query result. Arguments which don't change result are
+    ignored, empty arguments are equal to missing ones
+
+    Parameters
+    ----------
+    namespace : str
+        Name of entry point, e.g. `movies`
+    args : dict
+        Dictionary of arguments
+    version : str
+        Version of dataset
+
+    Returns
+    -------
+    str
+        Hex digest of key
+    """
+    normalized = {}
+    for name in QUERY_ARGUMENTS:
+        value = args.get(name)
+        if isinstance(value, str):
+            value = '|'.join(v.strip() for v in value.split('|')) if name == 'genres' else value
+        if value not in (None, False, ''):
+            normalized[name] = value
+    key = json.dumps([namespace, normalized, version], sort_keys=True)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU cache of query results with TTL stored on disk.
+    Index of cache is changed under exclusive file lock, so cache can be
+    used by several processes
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Cache directory, by default RESULT_CACHE_PATH
+    max_bytes : int, optional
+        Maximum total size of results, by default RESULT_CACHE_MAX_BYTES
+    ttl : float, optional
+        Time to live of result in seconds, by default RESULT_CACHE_TTL
+    """
+
+    def __init__(self, cache_dir: str = RESULT_CACHE_PATH, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl: float = RESULT_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.csv')
+
+    @contextmanager
+    def _index(self):
+        """Lock, read and write back index of cache"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index_path = os.path.join(self.cache_dir, 'index.json')
+        with open(index_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {'hits': 0, 'misses': 0, 'entries': {}}
+            yield index
+            tmp_path = index_path + f'.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+
+    def _evict(self, index: dict) -> None:
+        """Remove expired entries and least recently used entries over size limit"""
+        entries = index['entries']
+        now = time.time()
+        total = 0
+        for key, entry in sorted(entries.items(), key=lambda e: e[1]['accessed'], reverse=True):
+            if now - entry['created'] > self.ttl or total + entry['size'] > self.max_bytes:
+                del entries[key]
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            else:
+                total += entry['size']
+
+    def get(self, key: str):
+        """Get cached result and count hit or miss
+
+        Parameters
+        ----------
+        key : str
+            Key of result
+
+        Returns
+        -------
+        str or None
+            Cached result, None if it is missing or expired
+        """
+        with self._index() as index:
+            entry = index['entries'].get(key)
+            result = None
+            if entry is not None and time.time() - entry['created'] <= self.ttl:
+                try:
+                    with open(self._path(key), newline='') as f:
+                        result = f.read()
+                    entry['accessed'] = time.time()
+                except OSError:
+                    del index['entries'][key]
+            if result is None:
+                index['misses'] += 1
+            else:
+                index['hits'] += 1
+        log.debug(f'result cache {"hit" if result is not None else "miss"}: {key}')
+        return result
+
+    def put(self, key: str, result: str) -> None:
+        """Save result to cache and evict entries over size limit
+
+        Parameters
+        ----------
+        key : str
+            Key of result
+        result : str
+            Result to save
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', newline='') as f:
+            f.write(result)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._index() as index:
+            index['entries'][key] = {'size': size, 'created': now, 'accessed': now}
+            self._evict(index)
+
+    @contextmanager
+    def recording(self, key: str, stream):
+        """Write result to stream and save it to cache if no exception
+        was raised and every write to stream succeeded, so output cut off
+        e.g. by closed pipe is not cached even if writer catches the error.
+        Written text is kept in memory until it exceeds size limit of cache,
+        then only stream is written
+
+        Parameters
+        ----------
+        key : str
+            Key of result
+        stream : file-like
+            Stream of result, e.g. sys.stdout
+
+        Yields
+        -------
+        file-like
+            Stream which writes to both stream and cache
+        """
+        recorder = _Recorder(stream, self.max_bytes)
+        yield recorder
+        if recorder.parts is not None:
+            self.put(key, ''.join(recorder.parts))
+
+    def clear(self) -> None:
+        """Remove all results and reset counters"""
+        with self._index() as index:
+            for key in index['entries']:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            index.update({'hits': 0, 'misses': 0, 'entries': {}})
+
+    def stats(self) -> dict:
+        """Get hit and miss counters, number and total size of results
+
+        Returns
+        -------
+        dict
+            Dictionary with `hits`, `misses`, `entries` and `bytes` keys
+        """
+        with self._index() as index:
+            return {
+                'hits': index['hits'],
+                'misses': index['misses'],
+                'entries': len(index['entries']),
+                'bytes': sum(e['size'] for e in index['entries'].values()),
+            }
+
+
+class _Recorder:
+    """Write-through stream which keeps written text up to limit"""
+
+    def __init__(self, stream, limit: int):
+        self.stream = stream
+        self.limit = limit
+        self.size = 0
+        self.parts = []
+
+    def write(self, text: str) -> int:
+        try:
+            written = self.stream.write(text)
+        except BaseException:
+            # output is incomplete even if caller catches the error
+            self.parts = None
+            raise
+        if self.parts is not None:
+            self.size += len(text)
+            if self.size > self.limit:
+                self.parts = None
+            else:
+                self.parts.append(text)
+        return written
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def get_arguments() -> dict:
+    """Construct the argument parser and get the arguments
+
+    Returns
+    -------
+    dict
+        Dictionary of arguments and paramenters
+    """
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cache_dir", type=str, default=RESULT_CACHE_PATH,
+                    help=f"directory of result cache (default: {RESULT_CACHE_PATH})")
+    ap.add_argument("--clear", action='store_true',
+                    help="remove all cached results and reset counters")
+
+    return vars(ap.parse_args())
+
+
+def main():
+    args = get_arguments()
+    cache = ResultCache(args['cache_dir'])
+    if args['clear']:
+        cache.clear()
+    print(json.dumps(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
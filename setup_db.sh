@@ -46,6 +46,15 @@ function execute_sql_files() {
     mysql -h $host_arg --port=$port $db -u$user < sql/ratings_table.sql
     echo "sql/ratings_table.sql Executed"
     
+    mysql -h $host_arg --port=$port $db -u$user < sql/movie_rating_stats_table.sql
+    echo "sql/movie_rating_stats_table.sql Executed"
+    
+    mysql -h $host_arg --port=$port $db -u$user < sql/movie_genres_table.sql
+    echo "sql/movie_genres_table.sql Executed"
+    
+    mysql -h $host_arg --port=$port $db -u$user < sql/import_watermarks_table.sql
+    echo "sql/import_watermarks_table.sql Executed"
+    
     mysql -h $host_arg --port=$port $db -u$user < sql/vw_movies_ratings.sql
     echo "sql/vw_movies_ratings.sql Executed"
     
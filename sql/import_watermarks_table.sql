@@ -0,0 +1,16 @@
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `import_watermarks`
+--
+-- High-water mark of imported rows per table. `import_to_db.py --incremental`
+-- imports only ratings with `timestamp` not less than the mark of `ratings`
+-- and moves the mark after every load.
+--
+DROP TABLE IF EXISTS `import_watermarks`;
+CREATE TABLE `import_watermarks` (
+  `table_name` varchar(64) PRIMARY KEY NOT NULL,
+  `high_water_mark` bigint DEFAULT NULL,
+  `rows_loaded` bigint NOT NULL DEFAULT 0,
+  `loaded_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
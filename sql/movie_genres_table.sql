@@ -0,0 +1,15 @@
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `movie_genres`
+--
+-- Normalized genres of movies, one row per movie and genre. Primary key
+-- (genre, movieId) allows index range scan of movies by genre.
+--
+DROP TABLE IF EXISTS `movie_genres`;
+CREATE TABLE `movie_genres` (
+  `movieId` int(11) NOT NULL,
+  `genre` varchar(64) NOT NULL,
+  PRIMARY KEY (`genre`, `movieId`),
+  KEY `idx_movie_genres_movieId` (`movieId`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
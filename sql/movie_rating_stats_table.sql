@@ -0,0 +1,17 @@
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `movie_rating_stats`
+--
+-- Pre-aggregated ratings of movies. Rows are upserted by import_to_db.py
+-- together with every imported batch of ratings, so the table is never
+-- recomputed from `ratings` unless it is rebuilt explicitly.
+--
+DROP TABLE IF EXISTS `movie_rating_stats`;
+CREATE TABLE `movie_rating_stats` (
+  `movieId` int(11) PRIMARY KEY NOT NULL,
+  `rating_count` int(11) NOT NULL,
+  `rating_sum` double NOT NULL,
+  `avg_rating` double GENERATED ALWAYS AS (`rating_sum` / `rating_count`) STORED,
+  KEY `idx_movie_rating_stats_avg_rating` (`avg_rating`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -8,5 +8,6 @@ CREATE TABLE `movies` (
   `movieId` int(11) PRIMARY KEY NOT NULL,
   `title` varchar(255) NOT NULL,
   `genres` varchar(255) DEFAULT NULL,
-  `year` int(11) DEFAULT NULL
+  `year` int(11) DEFAULT NULL,
+  KEY `idx_movies_year` (`year`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
\ No newline at end of file
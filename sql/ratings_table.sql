@@ -8,5 +8,7 @@ CREATE TABLE `ratings` (
   `userId` int(11) NOT NULL,
   `movieId` int(11) NOT NULL,
   `rating` float NOT NULL,
-  `timestamp` int(11) NOT NULL
+  `timestamp` int(11) NOT NULL,
+  UNIQUE KEY `uq_ratings_userId_movieId` (`userId`, `movieId`),
+  KEY `idx_ratings_movieId` (`movieId`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
\ No newline at end of file
@@ -8,8 +8,33 @@ CREATE PROCEDURE spr_find_top_rated_movies(
     IN genres VARCHAR(255)
 )
 BEGIN
-    WITH row_numbered AS
-    (
+    -- LIMIT accepts only literals, parameters and local variables
+    DECLARE lim BIGINT UNSIGNED DEFAULT COALESCE(n, 18446744073709551615);
+
+    -- all joins are equality joins on indexed columns:
+    -- movie_genres by primary key (genre, movieId), movies and
+    -- movie_rating_stats by primary key movieId, year by idx_movies_year.
+    -- check_query_plan.py explains these queries, so both of them must be
+    -- single statements which use only the procedure parameters and `lim`.
+    IF genres IS NULL THEN
+        SELECT m.movieId,
+               m.title,
+               m.genres,
+               m.year,
+               s.avg_rating AS rating
+        FROM movies m
+        JOIN movie_rating_stats s
+        ON s.movieId = m.movieId
+        WHERE
+              ((year_from IS NULL) OR (m.year >= year_from))
+          AND ((year_to IS NULL) OR (m.year <= year_to))
+          AND ((`regexp` IS NULL) OR REGEXP_LIKE(m.title, `regexp`))
+        ORDER BY
+                 s.avg_rating DESC,
+                 m.year DESC,
+                 m.title
+        LIMIT 0, lim;
+    ELSE
         WITH RECURSIVE selected_genres(i, genre) AS
         (
             SELECT 1, SUBSTRING_INDEX(SUBSTRING_INDEX(genres, '|', 1), '|', -1) as genre
@@ -17,37 +42,49 @@ BEGIN
             SELECT i+1, SUBSTRING_INDEX(SUBSTRING_INDEX(genres, '|', i+1), '|', -1)
             FROM selected_genres
             WHERE i-1 < (CHAR_LENGTH(genres) - CHAR_LENGTH(REPLACE(genres, '|', '')))
+        ),
+        row_numbered AS
+        (
+            SELECT sg.i,
+                   m.movieId,
+                   m.title,
+                   m.genres,
+                   m.year,
+                   s.avg_rating AS rating,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY
+                           sg.i
+                       ORDER BY
+                           s.avg_rating DESC,
+                           m.year DESC,
+                           m.title
+                       ) AS rn
+            FROM selected_genres sg
+            JOIN movie_genres mg
+            ON mg.genre = sg.genre
+            JOIN movies m
+            ON m.movieId = mg.movieId
+            JOIN movie_rating_stats s
+            ON s.movieId = mg.movieId
+            WHERE
+                  ((year_from IS NULL) OR (m.year >= year_from))
+              AND ((year_to IS NULL) OR (m.year <= year_to))
+              AND ((`regexp` IS NULL) OR REGEXP_LIKE(m.title, `regexp`))
         )
-        SELECT *,
-               ROW_NUMBER() OVER (
-                   PARTITION BY
-                       selected_genres.genre
-                   ORDER BY
-                       mr.rating DESC,
-                       mr.year DESC,
-                       mr.title
-                   ) AS rn
-        FROM selected_genres
-        JOIN vw_movies_ratings mr
-        ON REGEXP_SUBSTR(mr.genres, selected_genres.genre) != ''
+        SELECT num.movieId,
+               num.title,
+               num.genres,
+               num.year,
+               num.rating
+        FROM row_numbered num
         WHERE
-              ((year_from IS NULL) OR (mr.year >= year_from))
-          AND ((year_to IS NULL) OR (mr.year <= year_to))
-          AND ((`regexp` IS NULL) OR (REGEXP_SUBSTR(mr.title, `regexp`) != ''))
-    )
-    SELECT num.movieId,
-           num.title,
-           num.genres,
-           num.year,
-           num.rating
-    FROM row_numbered num
-    WHERE
-          ((n IS NULL) OR (num.rn <= n))
-    ORDER BY
-             num.i,
-             num.rating DESC,
-             num.year DESC,
-             num.title;
+              ((n IS NULL) OR (num.rn <= n))
+        ORDER BY
+                 num.i,
+                 num.rating DESC,
+                 num.year DESC,
+                 num.title;
+    END IF;
 END;
 
--- CALL spr_find_top_rated_movies('5', NULL, 1995, 2015, 'Horror|Children');
\ No newline at end of file
+-- CALL spr_find_top_rated_movies('5', NULL, 1995, 2015, 'Horror|Children');
@@ -5,15 +5,10 @@ CREATE VIEW vw_movies_ratings AS
         m.title,
         m.genres,
         m.year,
-        AVG(r.rating)AS 'rating'
+        s.avg_rating AS 'rating'
     FROM
         movies AS m
-    INNER JOIN ratings AS r
-        ON m.movieId = r.movieId
-    GROUP BY
-        m.movieId,
-        m.title,
-        m.genres,
-        m.year;
+    INNER JOIN movie_rating_stats AS s
+        ON m.movieId = s.movieId;
 
--- SELECT * FROM vw_movies_ratings;
\ No newline at end of file
+-- SELECT * FROM vw_movies_ratings;
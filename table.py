@@ -0,0 +1,380 @@
+"""Columnar table
+
+This module contains compact column-oriented data structure used by
+movies.py instead of list of dicts. Each column is stored in typed array,
+string columns with few distinct values are dictionary-encoded.
+
+Table also behaves like a read-only list of dicts (len, iteration,
+indexing), so functions written for list of dicts keep working with it.
+
+This file can also be imported as a module and contains the following:
+
+    * DTYPES - Supported column types and their array typecodes
+    * Column - Typed column with optional dictionary encoding and nulls
+    * Table - Table of named columns of equal length
+"""
+
+
+# import the necessary packages
+import sys
+from array import array
+
+
+DTYPES = {
+    'int16': 'h',
+    'int32': 'i',
+    'int64': 'q',
+    'float32': 'f',
+    'float64': 'd',
+    'category': 'i',
+    'str': None,
+}
+
+
+class Column:
+    """Typed column of table
+
+    Numeric values are stored in `array.array`, `category` values are
+    stored as int codes of `categories` list and `str` values in plain list.
+    Null values are marked in lazily created `nulls` bytearray.
+
+    Parameters
+    ----------
+    dtype : str, optional
+        Column type from DTYPES, by default 'str'
+    """
+
+    __slots__ = ('dtype', 'data', 'nulls', 'categories', '_codes', '_convert')
+
+    def __init__(self, dtype: str = 'str'):
+        if dtype not in DTYPES:
+            raise ValueError(f'Unknown column type `{dtype}`, expected one of {tuple(DTYPES)}')
+
+        self.dtype = dtype
+        typecode = DTYPES[dtype]
+        self.data = array(typecode) if typecode else []
+        self.nulls = None
+        self.categories = [] if dtype == 'category' else None
+        self._codes = {} if dtype == 'category' else None
+        if dtype.startswith('int'):
+            self._convert = int
+        elif dtype.startswith('float'):
+            self._convert = float
+        else:
+            self._convert = None
+
+    @classmethod
+    def from_values(cls, values, dtype: str = 'str') -> 'Column':
+        """Create column from iterable of python values
+
+        Parameters
+        ----------
+        values : iterable
+            Column values, None and empty strings of non `str` columns are nulls
+        dtype : str, optional
+            Column type from DTYPES, by default 'str'
+
+        Returns
+        -------
+        Column
+            New column
+        """
+        column = cls(dtype)
+        column.extend(values)
+        return column
+
+    def _empty_like(self) -> 'Column':
+        column = Column(self.dtype)
+        if self.categories is not None:
+            column.categories = self.categories
+            column._codes = self._codes
+        return column
+
+    def append(self, value) -> None:
+        """Append python value to column
+
+        Parameters
+        ----------
+        value :
+            Value to append, converted to column type
+        """
+        if value is None or (value == '' and self.dtype != 'str'):
+            if self.nulls is None:
+                self.nulls = bytearray(len(self.data))
+            self.nulls.append(1)
+            self.data.append('' if self.dtype == 'str' else 0)
+            return
+
+        if self.nulls is not None:
+            self.nulls.append(0)
+
+        if self._codes is not None:
+            code = self._codes.get(value)
+            if code is None:
+                code = len(self.categories)
+                self.categories.append(value)
+                self._codes[value] = code
+            self.data.append(code)
+        elif self._convert is not None:
+            self.data.append(self._convert(value))
+        else:
+            self.data.append(value)
+
+    def extend(self, values) -> None:
+        """Append values to column
+
+        Parameters
+        ----------
+        values : Column or iterable
+            Column of the same type is copied without decoding values
+        """
+        if (isinstance(values, Column) and values.dtype == self.dtype
+                and values.categories is self.categories):
+            if values.nulls is not None and self.nulls is None:
+                self.nulls = bytearray(len(self.data))
+            if self.nulls is not None:
+                self.nulls.extend(values.nulls if values.nulls is not None
+                                  else bytes(len(values.data)))
+            self.data.extend(values.data)
+            return
+
+        for value in values:
+            self.append(value)
+
+    def take(self, indices) -> 'Column':
+        """Get new column with values on given positions
+
+        Parameters
+        ----------
+        indices : iterable
+            Row positions, None position creates null value
+
+        Returns
+        -------
+        Column
+            New column
+        """
+        column = self._empty_like()
+        data = self.data
+        if isinstance(indices, range) and indices.step == 1:
+            column.data = data[indices.start:indices.stop]
+            if self.nulls is not None:
+                column.nulls = self.nulls[indices.start:indices.stop]
+            return column
+
+        indices = list(indices)
+        if None in indices:
+            column.nulls = bytearray(1 if i is None or self.is_null(i) else 0 for i in indices)
+            empty = '' if self.dtype == 'str' else 0
+            values = [empty if i is None else data[i] for i in indices]
+        else:
+            if self.nulls is not None:
+                nulls = self.nulls
+                column.nulls = bytearray(nulls[i] for i in indices)
+            values = [data[i] for i in indices]
+
+        column.data = values if isinstance(data, list) else array(data.typecode, values)
+        return column
+
+    def is_null(self, i: int) -> bool:
+        """Check if value on position is null"""
+        return self.nulls is not None and self.nulls[i] == 1
+
+    def where(self, predicate) -> list:
+        """Get positions of non-null values which satisfy predicate.
+        Predicate is evaluated once per category for `category` columns.
+
+        Parameters
+        ----------
+        predicate : callable
+            Function of python value returning bool
+
+        Returns
+        -------
+        list
+            Row positions
+        """
+        nulls = self.nulls
+        if self.categories is not None:
+            matched = [bool(predicate(c)) for c in self.categories]
+            return [i for i, code in enumerate(self.data)
+                    if matched[code] and not (nulls and nulls[i])]
+
+        return [i for i, value in enumerate(self.data)
+                if not (nulls and nulls[i]) and predicate(value)]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, i: int):
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        if self.categories is not None:
+            return self.categories[self.data[i]]
+        return self.data[i]
+
+    def __iter__(self):
+        if self.nulls is None and self.categories is None:
+            return iter(self.data)
+        return (self[i] for i in range(len(self.data)))
+
+    def nbytes(self) -> int:
+        """Get approximate memory size of column in bytes"""
+        size = sys.getsizeof(self.data)
+        if isinstance(self.data, list):
+            size += sum(sys.getsizeof(v) for v in self.data)
+        if self.categories is not None:
+            size += sys.getsizeof(self.categories) + sys.getsizeof(self._codes)
+            size += sum(sys.getsizeof(c) for c in self.categories)
+        if self.nulls is not None:
+            size += sys.getsizeof(self.nulls)
+        return size
+
+
+class Table:
+    """Table of named typed columns of equal length
+
+    Parameters
+    ----------
+    columns : dict, optional
+        Dictionary of column name and Column, by default None
+    """
+
+    def __init__(self, columns: dict = None):
+        self._columns = dict(columns) if columns else {}
+        if len({len(c) for c in self._columns.values()}) > 1:
+            raise ValueError('Columns of table must have the same length')
+
+    @classmethod
+    def from_records(cls, records, schema: dict = None) -> 'Table':
+        """Create table from list of dicts
+
+        Parameters
+        ----------
+        records : iterable
+            Rows stored in dicts
+        schema : dict, optional
+            Dictionary of column name and type from DTYPES, by default all
+            columns of first record with `str` type
+
+        Returns
+        -------
+        Table
+            New table
+        """
+        records = iter(records)
+        first = next(records, None)
+        if schema is None:
+            schema = {k: 'str' for k in (first or {})}
+
+        table = cls({name: Column(dtype) for name, dtype in schema.items()})
+        if first is not None:
+            table.append(first)
+            table.extend(records)
+        return table
+
+    @property
+    def columns(self) -> list:
+        """List of column names"""
+        return list(self._columns)
+
+    @property
+    def schema(self) -> dict:
+        """Dictionary of column name and type"""
+        return {name: c.dtype for name, c in self._columns.items()}
+
+    def keys(self) -> list:
+        return self.columns
+
+    def column(self, name: str) -> Column:
+        """Get column by name"""
+        return self._columns[name]
+
+    def empty_like(self) -> 'Table':
+        """Get empty table with the same columns, categories of category
+        columns are shared, so rows of new table can be appended back
+        without decoding"""
+        return Table({name: c._empty_like() for name, c in self._columns.items()})
+
+    def with_column(self, name: str, column: Column) -> 'Table':
+        """Add or replace column in place
+
+        Parameters
+        ----------
+        name : str
+            Column name
+        column : Column
+            Column of the same length
+
+        Returns
+        -------
+        Table
+            The same table
+        """
+        if self._columns and len(column) != len(self):
+            raise ValueError(f'Column `{name}` has {len(column)} rows, expected {len(self)}')
+        self._columns[name] = column
+        return self
+
+    def append(self, row: dict) -> None:
+        """Append row stored in dict, missing columns are nulls"""
+        for name, column in self._columns.items():
+            column.append(row.get(name))
+
+    def extend(self, rows) -> None:
+        """Append rows of table or iterable of dicts in place"""
+        if isinstance(rows, Table) and rows.columns == self.columns:
+            for name, column in self._columns.items():
+                column.extend(rows.column(name))
+            return
+
+        for row in rows:
+            self.append(row)
+
+    def take(self, indices) -> 'Table':
+        """Get new table with rows on given positions
+
+        Parameters
+        ----------
+        indices : iterable
+            Row positions
+
+        Returns
+        -------
+        Table
+            New table
+        """
+        if not isinstance(indices, range):
+            indices = list(indices)
+        return Table({name: c.take(indices) for name, c in self._columns.items()})
+
+    def rows(self):
+        """Iterate over rows stored in tuples in order of columns"""
+        return zip(*self._columns.values())
+
+    def to_records(self) -> list:
+        """Get rows stored in list of dicts"""
+        return list(self)
+
+    def nbytes(self) -> int:
+        """Get approximate memory size of table in bytes"""
+        return sum(c.nbytes() for c in self._columns.values())
+
+    def __len__(self) -> int:
+        for column in self._columns.values():
+            return len(column)
+        return 0
+
+    def __iter__(self):
+        names = self.columns
+        return (dict(zip(names, row)) for row in self.rows())
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._columns[key]
+        if isinstance(key, slice):
+            return self.take(range(len(self))[key])
+        return {name: c[key] for name, c in self._columns.items()}
+
+    def __repr__(self) -> str:
+        return f'Table(columns={self.schema}, rows={len(self)})'